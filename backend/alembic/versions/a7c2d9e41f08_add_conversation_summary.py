@@ -0,0 +1,26 @@
+"""Add rolling summary columns to conversations
+
+Revision ID: a7c2d9e41f08
+Revises: e4f1a9b2c3d5
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c2d9e41f08'
+down_revision = 'e4f1a9b2c3d5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('conversations', sa.Column('summary', sa.Text(), nullable=True))
+    op.add_column('conversations', sa.Column('summary_message_count', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('conversations', 'summary_message_count')
+    op.drop_column('conversations', 'summary')
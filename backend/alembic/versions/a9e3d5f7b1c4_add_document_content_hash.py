@@ -0,0 +1,31 @@
+"""Add documents.content_hash and documents.storage_uri (upload deduplication)
+
+Revision ID: a9e3d5f7b1c4
+Revises: f3b9c7d1a2e6
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9e3d5f7b1c4'
+down_revision = 'f3b9c7d1a2e6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # NULL en los documentos existentes: siguen en {id}{ext} y no se usan como
+    # origen de deduplicación
+    op.add_column('documents', sa.Column('content_hash', mysql.CHAR(64), nullable=True))
+    op.add_column('documents', sa.Column('storage_uri', sa.String(512), nullable=True))
+    op.create_index('idx_document_content_hash', 'documents', ['content_hash', 'status'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_document_content_hash', table_name='documents')
+    op.drop_column('documents', 'storage_uri')
+    op.drop_column('documents', 'content_hash')
@@ -0,0 +1,24 @@
+"""Add is_truncated flag to messages
+
+Revision ID: b3e8f5c1d2a4
+Revises: a7c2d9e41f08
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e8f5c1d2a4'
+down_revision = 'a7c2d9e41f08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('messages', sa.Column('is_truncated', sa.Boolean(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('messages', 'is_truncated')
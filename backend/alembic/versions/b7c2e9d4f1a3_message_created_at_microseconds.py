@@ -0,0 +1,39 @@
+"""messages.created_at with microsecond precision (DATETIME(6))
+
+Revision ID: b7c2e9d4f1a3
+Revises: a9e3d5f7b1c4
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7c2e9d4f1a3'
+down_revision = 'a9e3d5f7b1c4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # El message writer asigna created_at al encolar; con precisión de segundos
+    # el mensaje del usuario y el del asistente de un turno empataban
+    op.alter_column(
+        'messages', 'created_at',
+        existing_type=mysql.DATETIME(),
+        type_=mysql.DATETIME(fsp=6),
+        server_default=sa.text('CURRENT_TIMESTAMP(6)'),
+        existing_nullable=False,
+    )
+
+
+def downgrade() -> None:
+    op.alter_column(
+        'messages', 'created_at',
+        existing_type=mysql.DATETIME(fsp=6),
+        type_=mysql.DATETIME(),
+        server_default=sa.text('CURRENT_TIMESTAMP'),
+        existing_nullable=False,
+    )
@@ -0,0 +1,117 @@
+"""Add workspace_stats aggregates table for the dashboard
+
+Revision ID: c6d1f2a8e3b7
+Revises: b3e8f5c1d2a4
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from datetime import datetime, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6d1f2a8e3b7'
+down_revision = 'b3e8f5c1d2a4'
+branch_labels = None
+depends_on = None
+
+STATUS_COLUMNS = {
+    'PENDING': 'pending',
+    'PROCESSING': 'processing',
+    'COMPLETED': 'completed',
+    'FAILED': 'failed',
+}
+COUNTERS = [
+    'documents', 'pending', 'processing', 'completed', 'failed',
+    'analyzed', 'completed_unanalyzed', 'conversations',
+]
+
+
+def upgrade() -> None:
+    counter_columns = [
+        sa.Column(name, sa.Integer(), server_default='0', nullable=False)
+        for name in COUNTERS + ['month_key', 'documents_this_month', 'documents_last_month']
+    ]
+    stats = op.create_table(
+        'workspace_stats',
+        sa.Column('workspace_id', mysql.CHAR(36), sa.ForeignKey('workspaces.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('owner_id', sa.String(36), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        *counter_columns,
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    )
+    op.create_index('ix_workspace_stats_owner_id', 'workspace_stats', ['owner_id'])
+
+    # Backfill desde las tablas base
+    bind = op.get_bind()
+    workspaces = sa.table('workspaces', sa.column('id'), sa.column('owner_id'), sa.column('is_active'))
+    documents = sa.table(
+        'documents', sa.column('workspace_id'), sa.column('status'),
+        sa.column('suggestion_full'), sa.column('created_at'),
+    )
+    conversations = sa.table('conversations', sa.column('workspace_id'))
+
+    now = datetime.now()
+    this_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    last_month = (this_month - timedelta(days=1)).replace(day=1)
+
+    rows = {}
+    for workspace_id, owner_id, is_active in bind.execute(
+        sa.select(workspaces.c.id, workspaces.c.owner_id, workspaces.c.is_active)
+    ):
+        rows[workspace_id] = dict(
+            {name: 0 for name in COUNTERS},
+            workspace_id=workspace_id,
+            owner_id=owner_id,
+            is_active=True if is_active is None else bool(is_active),
+            month_key=now.year * 100 + now.month,
+            documents_this_month=0,
+            documents_last_month=0,
+        )
+
+    for workspace_id, status, total, analyzed in bind.execute(
+        sa.select(
+            documents.c.workspace_id, documents.c.status,
+            sa.func.count(), sa.func.count(documents.c.suggestion_full),
+        ).group_by(documents.c.workspace_id, documents.c.status)
+    ):
+        row = rows.get(workspace_id)
+        if row is None:
+            continue
+        row['documents'] += total
+        row['analyzed'] += analyzed
+        if status in STATUS_COLUMNS:
+            row[STATUS_COLUMNS[status]] += total
+        if status == 'COMPLETED':
+            row['completed_unanalyzed'] += total - analyzed
+
+    for workspace_id, recent, current in bind.execute(
+        sa.select(
+            documents.c.workspace_id, sa.func.count(),
+            sa.func.sum(sa.case((documents.c.created_at >= this_month, 1), else_=0)),
+        )
+        .where(documents.c.created_at >= last_month)
+        .group_by(documents.c.workspace_id)
+    ):
+        if workspace_id in rows:
+            rows[workspace_id]['documents_this_month'] = int(current or 0)
+            rows[workspace_id]['documents_last_month'] = recent - int(current or 0)
+
+    for workspace_id, total in bind.execute(
+        sa.select(conversations.c.workspace_id, sa.func.count())
+        .where(conversations.c.workspace_id.isnot(None))
+        .group_by(conversations.c.workspace_id)
+    ):
+        if workspace_id in rows:
+            rows[workspace_id]['conversations'] = total
+
+    if rows:
+        op.bulk_insert(stats, list(rows.values()))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_workspace_stats_owner_id', table_name='workspace_stats')
+    op.drop_table('workspace_stats')
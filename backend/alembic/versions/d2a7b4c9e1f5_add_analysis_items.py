@@ -0,0 +1,48 @@
+"""Add analysis_items (structured analysis) and documents.analysis_version
+
+Revision ID: d2a7b4c9e1f5
+Revises: c6d1f2a8e3b7
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a7b4c9e1f5'
+down_revision = 'c6d1f2a8e3b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # NULL = pendiente de extraer: la aplicación extrae los análisis existentes
+    # la primera vez que se consulta su workspace (core/analysis_extractor.py)
+    op.add_column('documents', sa.Column('analysis_version', sa.Integer(), nullable=True))
+
+    op.create_table(
+        'analysis_items',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('document_id', mysql.CHAR(36), sa.ForeignKey('documents.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('workspace_id', mysql.CHAR(36), sa.ForeignKey('workspaces.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('kind', sa.String(20), nullable=False),
+        sa.Column('status', sa.String(20), nullable=True),
+        sa.Column('priority', sa.String(10), nullable=True),
+        sa.Column('text', sa.String(255), nullable=False),
+        sa.Column('title', sa.String(255), nullable=True),
+        sa.Column('due_date', sa.DateTime(), nullable=True),
+        sa.Column('position', sa.Integer(), nullable=False),
+    )
+    op.create_index('ix_analysis_items_document_id', 'analysis_items', ['document_id'])
+    op.create_index('idx_analysis_ws_kind_status', 'analysis_items', ['workspace_id', 'kind', 'status'])
+    op.create_index('idx_analysis_ws_kind_due', 'analysis_items', ['workspace_id', 'kind', 'due_date'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_analysis_ws_kind_due', table_name='analysis_items')
+    op.drop_index('idx_analysis_ws_kind_status', table_name='analysis_items')
+    op.drop_index('ix_analysis_items_document_id', table_name='analysis_items')
+    op.drop_table('analysis_items')
+    op.drop_column('documents', 'analysis_version')
@@ -0,0 +1,61 @@
+"""Add composite indexes for documents and workspaces route queries
+
+Revision ID: f3b9c7d1a2e6
+Revises: d2a7b4c9e1f5
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b9c7d1a2e6'
+down_revision = 'd2a7b4c9e1f5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # documents: solo tenía PK + índices de las FK. suggestion_full (TEXT) no
+    # se puede indexar; el filtro de análisis pendientes usa analysis_version.
+    op.create_index('idx_document_ws_status_created', 'documents', ['workspace_id', 'status', 'created_at'])
+    op.create_index('idx_document_ws_created', 'documents', ['workspace_id', 'created_at'])
+    op.create_index('idx_document_ws_conversation', 'documents', ['workspace_id', 'conversation_id'])
+    op.create_index('idx_document_ws_analysis', 'documents', ['workspace_id', 'analysis_version'])
+
+    op.create_index('idx_workspace_owner_active', 'workspaces', ['owner_id', 'is_active'])
+
+
+def _restore_fk_index(table: str, column: str, dropping: list) -> None:
+    """
+    Las FK de documents.workspace_id y workspaces.owner_id no tienen nombre
+    (create_all), así que MySQL creó un índice implícito con el nombre de la
+    columna y lo descartó en upgrade() al quedar cubierto por los compuestos.
+    Se recrea con ese mismo nombre si ningún otro índice cubre la columna, o el
+    DROP INDEX del último compuesto falla (1553).
+    """
+    bind = op.get_bind()
+    if bind.dialect.name != 'mysql':
+        return
+    for index in sa.inspect(bind).get_indexes(table):
+        if index['name'] not in dropping and index['column_names'][:1] == [column]:
+            return
+    op.create_index(column, table, [column])
+
+
+def downgrade() -> None:
+    workspace_indexes = ['idx_workspace_owner_active']
+    _restore_fk_index('workspaces', 'owner_id', workspace_indexes)
+    for name in workspace_indexes:
+        op.drop_index(name, table_name='workspaces')
+
+    document_indexes = [
+        'idx_document_ws_analysis',
+        'idx_document_ws_conversation',
+        'idx_document_ws_created',
+        'idx_document_ws_status_created',
+    ]
+    _restore_fk_index('documents', 'workspace_id', document_indexes)
+    for name in document_indexes:
+        op.drop_index(name, table_name='documents')
@@ -19,6 +19,7 @@ from core.auth import (
     get_password_hash,
     verify_password,
     create_access_token,
+    build_token_claims,
     get_current_user,
     get_current_active_user
 )
@@ -164,11 +165,7 @@ def login(
     # Crear token de acceso
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={
-            "sub": user.email, 
-            "user_id": user.id,
-            "first_name": user.full_name.split()[0] if user.full_name else "Usuario"
-        },
+        data=build_token_claims(user),
         expires_delta=access_token_expires
     )
     
@@ -233,7 +230,7 @@ def refresh_token(
     # Crear nuevo token
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": current_user.email, "user_id": current_user.id},
+        data=build_token_claims(current_user),
         expires_delta=access_token_expires
     )
     
@@ -322,7 +319,7 @@ def update_profile(
     response_model=schemas.UserPublic,
     summary="Subir foto de perfil"
 )
-async def upload_profile_picture(
+def upload_profile_picture(
     file: UploadFile,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(database.get_db)
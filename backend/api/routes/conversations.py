@@ -1,11 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Response
-from sqlalchemy.orm import Session, joinedload
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 from models import database, schemas
 from models.conversation import Conversation, Message
-from models import workspace as workspace_model
 from models import document as document_model
-from core import document_service
+from core import document_service, pagination
 from core.auth import get_current_active_user
+from core.ownership import get_owned_conversation, get_owned_workspace
+from core.read_routing import get_read_db
 from models.user import User
 from core.rag_client import rag_client
 from core.config import settings
@@ -18,40 +21,123 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+
+def _conversation_summaries(
+    db: Session,
+    response: Response,
+    filters: list,
+    limit: Optional[int],
+    cursor: Optional[str],
+) -> list[schemas.ConversationPublic]:
+    """
+    Lista liviana de conversaciones (sin cargar mensajes): el conteo sale de
+    una subconsulta correlacionada sobre idx_conversation_created. Con `limit`
+    se pagina por (updated_at, id) y el cursor siguiente va en X-Next-Cursor.
+    """
+    message_count = (
+        select(func.count(Message.id))
+        .where(Message.conversation_id == Conversation.id)
+        .correlate(Conversation)
+        .scalar_subquery()
+    )
+    query = db.query(
+        Conversation.id,
+        Conversation.workspace_id,
+        Conversation.title,
+        Conversation.created_at,
+        Conversation.updated_at,
+        Conversation.has_proposal,
+        message_count.label("message_count"),
+    ).filter(*filters)
+
+    if limit:
+        rows, has_more = pagination.page_before(
+            query, Conversation.updated_at, Conversation.id, cursor, limit
+        )
+        if has_more:
+            response.headers["X-Next-Cursor"] = pagination.encode_cursor(rows[-1].updated_at, rows[-1].id)
+    else:
+        rows = query.order_by(Conversation.updated_at.desc()).all()
+
+    return [
+        schemas.ConversationPublic(
+            id=row.id,
+            workspace_id=row.workspace_id,
+            title=row.title,
+            created_at=row.created_at,
+            updated_at=row.updated_at,
+            message_count=row.message_count or 0,
+            has_proposal=bool(row.has_proposal),
+        )
+        for row in rows
+    ]
+
+
+def _conversation_with_messages(
+    db: Session,
+    conversation: Conversation,
+    before: Optional[str],
+    limit: Optional[int],
+) -> schemas.ConversationWithMessages:
+    """
+    Conversación con sus mensajes en orden cronológico. Sin `limit` ni `before`
+    se devuelve el historial completo (el front todavía no pagina); con alguno
+    de los dos, una página (los más recientes, o los anteriores a `before`) y
+    `next_cursor` carga la página anterior.
+    """
+    query = db.query(Message).filter(Message.conversation_id == conversation.id)
+    if limit or before:
+        limit = min(limit or settings.CHAT_MESSAGES_PAGE_SIZE, settings.CHAT_MESSAGES_MAX_PAGE_SIZE)
+        messages, has_more = pagination.page_before(
+            query, Message.created_at, Message.id, before, limit
+        )
+    else:
+        messages = query.order_by(Message.created_at.desc(), Message.id.desc()).all()
+        has_more = False
+    message_count = db.query(func.count(Message.id)).filter(
+        Message.conversation_id == conversation.id
+    ).scalar() or 0
+    next_cursor = (
+        pagination.encode_cursor(messages[-1].created_at, messages[-1].id) if has_more else None
+    )
+
+    return schemas.ConversationWithMessages(
+        id=conversation.id,
+        workspace_id=conversation.workspace_id,
+        title=conversation.title,
+        created_at=conversation.created_at,
+        updated_at=conversation.updated_at,
+        message_count=message_count,
+        has_proposal=conversation.has_proposal,
+        messages=[schemas.MessagePublic.model_validate(msg) for msg in reversed(messages)],
+        has_more=has_more,
+        next_cursor=next_cursor,
+    )
+
+
 @router.get(
     "/conversations/general",
     response_model=list[schemas.ConversationPublic],
     summary="Obtener todas las conversaciones generales (sin workspace)"
 )
 def get_general_conversations(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=200, description="Tamaño de página (sin valor: todas)"),
+    cursor: Optional[str] = Query(None, description="Cursor X-Next-Cursor de la página anterior"),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     Obtiene todas las conversaciones que no pertenecen a ningún workspace.
     Requiere autenticación.
     """
-    conversations = db.query(Conversation).filter(
-        Conversation.workspace_id == None,
-        Conversation.user_id == current_user.id
-    ).order_by(Conversation.updated_at.desc()).all()
-    
-    result = []
-    for conv in conversations:
-        message_count = len(conv.messages)
-        
-        conv_dict = {
-            "id": conv.id,
-            "workspace_id": None,
-            "title": conv.title,
-            "created_at": conv.created_at,
-            "updated_at": conv.updated_at,
-            "message_count": message_count,
-            "has_proposal": conv.has_proposal
-        }
-        result.append(schemas.ConversationPublic(**conv_dict))
-    
-    return result
+    return _conversation_summaries(
+        db,
+        response,
+        [Conversation.workspace_id == None, Conversation.user_id == current_user.id],  # noqa: E711
+        limit,
+        cursor,
+    )
 
 
 @router.get(
@@ -61,55 +147,26 @@ def get_general_conversations(
 )
 def get_conversations(
     workspace_id: str,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=200, description="Tamaño de página (sin valor: todas)"),
+    cursor: Optional[str] = Query(None, description="Cursor X-Next-Cursor de la página anterior"),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     Obtiene todas las conversaciones de un workspace específico.
     Requiere autenticación. Solo el owner puede ver las conversaciones.
     """
-    # Verificar que el workspace existe
-    db_workspace = db.query(workspace_model.Workspace).filter(
-        workspace_model.Workspace.id == workspace_id
-    ).first()
-    
-    if not db_workspace:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Workspace con id {workspace_id} no encontrado."
-        )
-    
-    # Verificar ownership
-    if db_workspace.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="No tienes permiso para ver las conversaciones de este workspace."
-        )
-    
-    # Obtener conversaciones con PREFETCH de mensajes (elimina N+1 queries)
-    conversations = db.query(Conversation).options(
-        joinedload(Conversation.messages)
-    ).filter(
-        Conversation.workspace_id == workspace_id
-    ).order_by(Conversation.updated_at.desc()).all()
-    
-    # Agregar conteo de mensajes (ya prefetched, no genera query adicional)
-    result = []
-    for conv in conversations:
-        message_count = len(conv.messages)  # Usa la relación ya cargada
-        
-        conv_dict = {
-            "id": conv.id,
-            "workspace_id": conv.workspace_id,
-            "title": conv.title,
-            "created_at": conv.created_at,
-            "updated_at": conv.updated_at,
-            "message_count": message_count,
-            "has_proposal": conv.has_proposal
-        }
-        result.append(schemas.ConversationPublic(**conv_dict))
+    # Verificar que el workspace existe y pertenece al usuario
+    get_owned_workspace(
+        db, workspace_id, current_user,
+        forbidden_detail="No tienes permiso para ver las conversaciones de este workspace."
+    )
     
-    return result
+    # Lista liviana: conteo de mensajes por subconsulta, sin cargar los mensajes
+    return _conversation_summaries(
+        db, response, [Conversation.workspace_id == workspace_id], limit, cursor
+    )
 
 
 @router.get(
@@ -119,11 +176,14 @@ def get_conversations(
 )
 def get_general_conversation(
     conversation_id: str,
+    before: Optional[str] = Query(None, description="Cursor next_cursor: mensajes anteriores a ese punto"),
+    limit: Optional[int] = Query(None, ge=1, description="Mensajes por página (sin limit ni before: todos)"),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
-    Obtiene una conversación específica con sus mensajes.
+    Obtiene una conversación específica con sus mensajes. Con `limit` devuelve
+    solo la página más reciente; `before=<next_cursor>` carga los anteriores.
     """
     conversation = db.query(Conversation).filter(
         Conversation.id == conversation_id,
@@ -136,83 +196,34 @@ def get_general_conversation(
             detail="Conversación no encontrada."
         )
     
-    messages = db.query(Message).filter(
-        Message.conversation_id == conversation_id
-    ).order_by(Message.created_at.asc()).all()
-    
-    return schemas.ConversationWithMessages(
-        id=conversation.id,
-        workspace_id=conversation.workspace_id,
-        title=conversation.title,
-        created_at=conversation.created_at,
-        updated_at=conversation.updated_at,
-        message_count=len(messages),
-        has_proposal=conversation.has_proposal,
-        messages=[schemas.MessagePublic.from_orm(msg) for msg in messages]
-    )
+    return _conversation_with_messages(db, conversation, before, limit)
 
 
 @router.get(
     "/workspaces/{workspace_id}/conversations/{conversation_id}",
     response_model=schemas.ConversationWithMessages,
-    summary="Obtener una conversación específica con todos sus mensajes"
+    summary="Obtener una conversación específica con sus mensajes"
 )
 def get_conversation(
     workspace_id: str,
     conversation_id: str,
+    before: Optional[str] = Query(None, description="Cursor next_cursor: mensajes anteriores a ese punto"),
+    limit: Optional[int] = Query(None, ge=1, description="Mensajes por página (sin limit ni before: todos)"),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
-    Obtiene una conversación específica con todos sus mensajes.
+    Obtiene una conversación específica con sus mensajes. Con `limit` pagina por
+    (created_at, id) desde los más recientes; `before=<next_cursor>` carga los anteriores.
     Requiere autenticación. Solo el owner puede ver la conversación.
     """
-    # Verificar que el workspace existe y pertenece al usuario
-    db_workspace = db.query(workspace_model.Workspace).filter(
-        workspace_model.Workspace.id == workspace_id
-    ).first()
-    
-    if not db_workspace:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Workspace no encontrado."
-        )
-    
-    if db_workspace.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="No tienes permiso para acceder a este workspace."
-        )
-    
-    # Verificar que la conversación existe y pertenece al workspace
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id,
-        Conversation.workspace_id == workspace_id
-    ).first()
-    
-    if not conversation:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Conversación no encontrada."
-        )
-    
-    # Obtener mensajes
-    messages = db.query(Message).filter(
-        Message.conversation_id == conversation_id
-    ).order_by(Message.created_at.asc()).all()
-    
-    message_count = len(messages)
-    
-    return schemas.ConversationWithMessages(
-        id=conversation.id,
-        workspace_id=conversation.workspace_id,
-        title=conversation.title,
-        created_at=conversation.created_at,
-        updated_at=conversation.updated_at,
-        message_count=message_count,
-        has_proposal=conversation.has_proposal,
-        messages=[schemas.MessagePublic.from_orm(msg) for msg in messages]
+    # Verificar workspace, ownership y conversación (una sola consulta)
+    conversation, _ = get_owned_conversation(
+        db, workspace_id, conversation_id, current_user,
+        forbidden_detail="No tienes permiso para acceder a este workspace."
     )
+    
+    return _conversation_with_messages(db, conversation, before, limit)
 
 
 @router.post(
@@ -231,23 +242,11 @@ def create_conversation(
     Crea una nueva conversación en un workspace.
     Requiere autenticación. Solo el owner puede crear conversaciones.
     """
-    # Verificar que el workspace existe
-    db_workspace = db.query(workspace_model.Workspace).filter(
-        workspace_model.Workspace.id == workspace_id
-    ).first()
-    
-    if not db_workspace:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Workspace con id {workspace_id} no encontrado."
-        )
-    
-    # Verificar ownership
-    if db_workspace.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="No tienes permiso para crear conversaciones en este workspace."
-        )
+    # Verificar que el workspace existe y pertenece al usuario
+    get_owned_workspace(
+        db, workspace_id, current_user,
+        forbidden_detail="No tienes permiso para crear conversaciones en este workspace."
+    )
     
     # Crear conversación
     new_conversation = Conversation(
@@ -286,34 +285,11 @@ def update_conversation(
     Actualiza el título de una conversación.
     Requiere autenticación. Solo el owner puede actualizar conversaciones.
     """
-    # Verificar que el workspace existe y pertenece al usuario
-    db_workspace = db.query(workspace_model.Workspace).filter(
-        workspace_model.Workspace.id == workspace_id
-    ).first()
-    
-    if not db_workspace:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Workspace no encontrado."
-        )
-    
-    if db_workspace.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="No tienes permiso para actualizar conversaciones en este workspace."
-        )
-    
-    # Verificar que la conversación existe y pertenece al workspace
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id,
-        Conversation.workspace_id == workspace_id
-    ).first()
-    
-    if not conversation:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Conversación no encontrada."
-        )
+    # Verificar workspace, ownership y conversación (una sola consulta)
+    conversation, _ = get_owned_conversation(
+        db, workspace_id, conversation_id, current_user,
+        forbidden_detail="No tienes permiso para actualizar conversaciones en este workspace."
+    )
     
     # Actualizar título
     conversation.title = conversation_data.title
@@ -322,21 +298,8 @@ def update_conversation(
     db.commit()
     db.refresh(conversation)
     
-    # Obtener mensajes
-    messages = db.query(Message).filter(
-        Message.conversation_id == conversation_id
-    ).order_by(Message.created_at.asc()).all()
-    
-    return schemas.ConversationWithMessages(
-        id=conversation.id,
-        workspace_id=conversation.workspace_id,
-        title=conversation.title,
-        created_at=conversation.created_at,
-        updated_at=conversation.updated_at,
-        message_count=len(messages),
-        has_proposal=conversation.has_proposal,
-        messages=[schemas.MessagePublic.from_orm(msg) for msg in messages]
-    )
+    # Devolver la conversación con su historial completo
+    return _conversation_with_messages(db, conversation, None, None)
 
 
 @router.delete(
@@ -347,16 +310,18 @@ def update_conversation(
 async def delete_general_conversation(
     conversation_id: str,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     """
     Elimina una conversación general y todos sus mensajes.
     Requiere autenticación. Solo el owner puede eliminarla.
     """
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id,
-        Conversation.user_id == current_user.id
-    ).first()
+    conversation = await db.scalar(
+        select(Conversation).where(
+            Conversation.id == conversation_id,
+            Conversation.user_id == current_user.id
+        )
+    )
     
     if not conversation:
         raise HTTPException(
@@ -365,9 +330,11 @@ async def delete_general_conversation(
         )
     
     # Eliminar documentos asociados si los hay
-    documents = db.query(document_model.Document).filter(
-        document_model.Document.conversation_id == conversation_id
-    ).all()
+    documents = (await db.scalars(
+        select(document_model.Document).where(
+            document_model.Document.conversation_id == conversation_id
+        )
+    )).all()
 
     for document in documents:
         if settings.RAG_SERVICE_ENABLED and rag_client:
@@ -375,10 +342,10 @@ async def delete_general_conversation(
                 await rag_client.delete_document(document.id)
             except Exception:
                 pass
-        db.delete(document)
+        await db.delete(document)
     
-    db.delete(conversation)
-    db.commit()
+    await db.delete(conversation)
+    await db.commit()
     return None
 
 
@@ -391,45 +358,24 @@ async def delete_conversation(
     workspace_id: str,
     conversation_id: str,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     """
     Elimina una conversación y todos sus mensajes.
     Requiere autenticación. Solo el owner puede eliminar conversaciones.
     """
-    # Verificar que el workspace existe y pertenece al usuario
-    db_workspace = db.query(workspace_model.Workspace).filter(
-        workspace_model.Workspace.id == workspace_id
-    ).first()
-    
-    if not db_workspace:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Workspace no encontrado."
-        )
-    
-    if db_workspace.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="No tienes permiso para eliminar conversaciones en este workspace."
-        )
-    
-    # Verificar que la conversación existe y pertenece al workspace
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id,
-        Conversation.workspace_id == workspace_id
-    ).first()
-    
-    if not conversation:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Conversación no encontrada."
-        )
+    # Verificar workspace, ownership y conversación (una sola consulta)
+    conversation, _ = await db.run_sync(
+        get_owned_conversation, workspace_id, conversation_id, current_user,
+        forbidden_detail="No tienes permiso para eliminar conversaciones en este workspace."
+    )
     
     # Obtener documentos asociados y eliminarlos del servicio RAG y de la BD antes de eliminar la conversación
-    documents = db.query(document_model.Document).filter(
-        document_model.Document.conversation_id == conversation_id
-    ).all()
+    documents = (await db.scalars(
+        select(document_model.Document).where(
+            document_model.Document.conversation_id == conversation_id
+        )
+    )).all()
 
     for document in documents:
         # Eliminar del servicio RAG externo (si está habilitado)
@@ -442,13 +388,13 @@ async def delete_conversation(
 
         # Eliminar de la BD explícitamente (no confiar en cascada)
         try:
-            db.delete(document)
+            await db.delete(document)
         except Exception as exc:
             print(f"ERROR eliminando documento DB {document.id}: {exc}")
     
     # Eliminar conversación (mensajes y documentos ya manejados)
-    db.delete(conversation)
-    db.commit()
+    await db.delete(conversation)
+    await db.commit()
     
     return None
 
@@ -4,15 +4,12 @@ Proporciona métricas, estadísticas y datos agregados para la vista principal.
 """
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
 from typing import List, Dict, Any
-from datetime import datetime, timedelta
-from models.database import get_db
+from datetime import datetime
 from models.user import User
-from models.workspace import Workspace
-from models.document import Document
-from models.conversation import Conversation
 from core.auth import get_current_active_user
+from core.read_routing import get_read_db
+from core import dashboard_stats
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,7 +19,7 @@ router = APIRouter()
 @router.get("/dashboard/stats", summary="Obtener estadísticas del dashboard")
 def get_dashboard_stats(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     Obtiene métricas agregadas para el dashboard principal.
@@ -40,71 +37,26 @@ def get_dashboard_stats(
         }
     """
     try:
-        # Total de workspaces del usuario
-        total_workspaces = db.query(func.count(Workspace.id)).filter(
-            Workspace.owner_id == current_user.id
-        ).scalar() or 0
-        
-        # Workspaces activos
-        active_workspaces = db.query(func.count(Workspace.id)).filter(
-            and_(
-                Workspace.owner_id == current_user.id,
-                Workspace.is_active == True
-            )
-        ).scalar() or 0
-        
-        # Total de documentos del usuario (a través de sus workspaces)
-        total_documents = db.query(func.count(Document.id)).join(
-            Workspace, Document.workspace_id == Workspace.id
-        ).filter(
-            Workspace.owner_id == current_user.id
-        ).scalar() or 0
-        
-        # Documentos completados
-        completed_documents = db.query(func.count(Document.id)).join(
-            Workspace, Document.workspace_id == Workspace.id
-        ).filter(
-            and_(
-                Workspace.owner_id == current_user.id,
-                Document.status == "COMPLETED"
-            )
-        ).scalar() or 0
-        
+        # Contadores por workspace mantenidos incrementalmente (una sola consulta)
+        rows = dashboard_stats.get_user_stats(db, current_user.id)
+        now = datetime.now()
+
+        total_workspaces = len(rows)
+        active_workspaces = sum(1 for row in rows if row.is_active)
+        total_documents = sum(row.documents for row in rows)
+        completed_documents = sum(row.completed for row in rows)
         # RFPs procesados (asumimos que son documentos con análisis completo)
-        rfps_processed = db.query(func.count(Document.id)).join(
-            Workspace, Document.workspace_id == Workspace.id
-        ).filter(
-            and_(
-                Workspace.owner_id == current_user.id,
-                Document.suggestion_full.isnot(None)
-            )
-        ).scalar() or 0
-        
+        rfps_processed = sum(row.analyzed for row in rows)
+
         # Tasa de éxito (documentos completados / total)
         success_rate = round((completed_documents / total_documents * 100), 1) if total_documents > 0 else 0
-        
-        # Documentos del mes actual
-        first_day_of_month = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        documents_this_month = db.query(func.count(Document.id)).join(
-            Workspace, Document.workspace_id == Workspace.id
-        ).filter(
-            and_(
-                Workspace.owner_id == current_user.id,
-                Document.created_at >= first_day_of_month
-            )
-        ).scalar() or 0
-        
-        # Documentos del mes anterior para calcular tendencia
-        first_day_last_month = (first_day_of_month - timedelta(days=1)).replace(day=1)
-        documents_last_month = db.query(func.count(Document.id)).join(
-            Workspace, Document.workspace_id == Workspace.id
-        ).filter(
-            and_(
-                Workspace.owner_id == current_user.id,
-                Document.created_at >= first_day_last_month,
-                Document.created_at < first_day_of_month
-            )
-        ).scalar() or 0
+
+        # Documentos del mes actual y del anterior (para calcular tendencia)
+        documents_this_month = documents_last_month = 0
+        for row in rows:
+            this_month, last_month = dashboard_stats.month_counts(row, now)
+            documents_this_month += this_month
+            documents_last_month += last_month
         
         # Calcular tendencia
         trend = "stable"
@@ -141,7 +93,7 @@ def get_dashboard_stats(
 def get_suggestions(
     workspace_id: str = None,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     Genera sugerencias proactivas basadas en el estado actual de los workspaces.
@@ -155,109 +107,76 @@ def get_suggestions(
     try:
         suggestions = []
         
-        # Filtrar workspaces según parámetro
-        workspaces_query = db.query(Workspace).filter(
-            and_(
-                Workspace.owner_id == current_user.id,
-                Workspace.is_active == True
-            )
-        )
-        
-        if workspace_id:
-            workspaces_query = workspaces_query.filter(Workspace.id == workspace_id)
-        
-        workspaces = workspaces_query.all()
+        # Contadores de los workspaces activos (una consulta, sin N+1)
+        rows = dashboard_stats.get_active_workspace_stats(db, current_user.id, workspace_id)
         
-        for workspace in workspaces:
+        for stats, workspace_name in rows:
             # 1. Detectar documentos en estado FAILED
-            failed_docs = db.query(Document).filter(
-                and_(
-                    Document.workspace_id == workspace.id,
-                    Document.status == "FAILED"
-                )
-            ).count()
+            failed_docs = stats.failed
             
             if failed_docs > 0:
                 suggestions.append({
                     "type": "missing_doc",
                     "priority": "high",
                     "title": f"{failed_docs} documento(s) con error",
-                    "description": f"Hay {failed_docs} documento(s) que fallaron en procesamiento en '{workspace.name}'",
+                    "description": f"Hay {failed_docs} documento(s) que fallaron en procesamiento en '{workspace_name}'",
                     "action": "review_documents",
-                    "workspace_id": workspace.id,
-                    "workspace_name": workspace.name
+                    "workspace_id": stats.workspace_id,
+                    "workspace_name": workspace_name
                 })
             
             # 2. Detectar documentos pendientes de procesar
-            pending_docs = db.query(Document).filter(
-                and_(
-                    Document.workspace_id == workspace.id,
-                    Document.status.in_(["PENDING", "PROCESSING"])
-                )
-            ).count()
+            pending_docs = stats.pending + stats.processing
             
             if pending_docs > 0:
                 suggestions.append({
                     "type": "requirement",
                     "priority": "medium",
                     "title": f"{pending_docs} documento(s) en proceso",
-                    "description": f"Hay {pending_docs} documento(s) siendo analizados en '{workspace.name}'",
+                    "description": f"Hay {pending_docs} documento(s) siendo analizados en '{workspace_name}'",
                     "action": "check_status",
-                    "workspace_id": workspace.id,
-                    "workspace_name": workspace.name
+                    "workspace_id": stats.workspace_id,
+                    "workspace_name": workspace_name
                 })
             
             # 3. Detectar workspaces sin documentos
-            total_docs = db.query(func.count(Document.id)).filter(
-                Document.workspace_id == workspace.id
-            ).scalar() or 0
+            total_docs = stats.documents
             
             if total_docs == 0:
                 suggestions.append({
                     "type": "missing_doc",
                     "priority": "high",
                     "title": "Workspace sin documentos",
-                    "description": f"El workspace '{workspace.name}' aún no tiene documentos cargados",
+                    "description": f"El workspace '{workspace_name}' aún no tiene documentos cargados",
                     "action": "upload_document",
-                    "workspace_id": workspace.id,
-                    "workspace_name": workspace.name
+                    "workspace_id": stats.workspace_id,
+                    "workspace_name": workspace_name
                 })
             
             # 4. Detectar workspaces con pocos documentos pero conversaciones activas
-            if total_docs > 0 and total_docs < 3:
-                conversations_count = db.query(func.count(Conversation.id)).filter(
-                    Conversation.workspace_id == workspace.id
-                ).scalar() or 0
-                
-                if conversations_count > 0:
-                    suggestions.append({
-                        "type": "improvement",
-                        "priority": "low",
-                        "title": "Mejorar base de conocimiento",
-                        "description": f"'{workspace.name}' tiene solo {total_docs} documento(s). Agrega más para mejores análisis",
-                        "action": "upload_document",
-                        "workspace_id": workspace.id,
-                        "workspace_name": workspace.name
-                    })
+            if 0 < total_docs < 3 and stats.conversations > 0:
+                suggestions.append({
+                    "type": "improvement",
+                    "priority": "low",
+                    "title": "Mejorar base de conocimiento",
+                    "description": f"'{workspace_name}' tiene solo {total_docs} documento(s). Agrega más para mejores análisis",
+                    "action": "upload_document",
+                    "workspace_id": stats.workspace_id,
+                    "workspace_name": workspace_name
+                })
             
             # 5. Detectar documentos completados sin suggestion_full (no analizados completamente)
-            docs_without_analysis = db.query(Document).filter(
-                and_(
-                    Document.workspace_id == workspace.id,
-                    Document.status == "COMPLETED",
-                    Document.suggestion_full.is_(None)
-                )
-            ).count()
+            docs_without_analysis = stats.completed_unanalyzed
             
             if docs_without_analysis > 0:
                 suggestions.append({
                     "type": "requirement",
                     "priority": "medium",
                     "title": "Documentos sin análisis completo",
-                    "description": f"{docs_without_analysis} documento(s) en '{workspace.name}' necesitan análisis detallado",
+                    "description": f"{docs_without_analysis} documento(s) en '{workspace_name}' necesitan análisis detallado",
                     "action": "analyze_documents",
-                    "workspace_id": workspace.id,
-                    "workspace_name": workspace.name
+                    "workspace_id": stats.workspace_id,
+                    "workspace_name": workspace_name
                 })
         
         # Ordenar por prioridad: high > medium > low
@@ -90,7 +90,8 @@ def _generate_document_content(
     # Generar contenido con el LLM usando generate_response sin chunks
     content = llm_service.generate_response(
         query=synthesis_prompt,
-        context_chunks=[]
+        context_chunks=[],
+        workspace_id=workspace_id
     )
     
     return content
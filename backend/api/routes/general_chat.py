@@ -1,10 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from starlette.background import BackgroundTask
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import database, schemas
-from models.conversation import Conversation, Message
+from models.conversation import Conversation
 from models.user import User
 from core.auth import get_current_active_user
+from core import conversation_memory, llm_stream, tracing
+from core.message_writer import message_writer
 from api.routes import intention_task
 import json
 import logging
@@ -28,7 +32,7 @@ async def general_chat(
     request: Request,
     chat_request: schemas.ChatRequest,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_async_db),
 ):
     """
     Endpoint para chat general sin contexto de documentos de workspace.
@@ -36,78 +40,56 @@ async def general_chat(
     Flujo:
     1. Crea/Recupera conversación con workspace_id=None (Requiere cambio en BD).
     2. Guarda mensaje del usuario.
-    3. Llama a LLM con prompt general.
-    4. Guarda respuesta del asistente.
+    3. Llama a LLM con prompt general (resumen + últimos turnos como historial).
+    4. Guarda respuesta del asistente y actualiza el resumen en segundo plano.
     """
     
     # 1. Obtener o crear conversación (Sin workspace_id)
     conversation = None
-    if chat_request.conversation_id:
-        conversation = (
-            db.query(Conversation)
-            .filter(
-                Conversation.id == chat_request.conversation_id,
-                Conversation.workspace_id == None  # Filtrar por null
+    with tracing.stage("conversation.write"):
+        if chat_request.conversation_id:
+            conversation = await db.scalar(
+                select(Conversation).where(
+                    Conversation.id == chat_request.conversation_id,
+                    Conversation.workspace_id == None  # Filtrar por null
+                )
             )
-            .first()
-        )
-        if not conversation:
-            raise HTTPException(status_code=404, detail="Conversación no encontrada.")
-    else:
-        title = (
-            chat_request.query[:50] + "..."
-            if len(chat_request.query) > 50
-            else chat_request.query
-        )
-        # Guardar user_id para tracking de ownership en chats generales
-        conversation = Conversation(
-            workspace_id=None, 
-            user_id=current_user.id,
-            title=title
-        )
-        db.add(conversation)
-        db.commit()
-        db.refresh(conversation)
+            if not conversation:
+                raise HTTPException(status_code=404, detail="Conversación no encontrada.")
+        else:
+            title = (
+                chat_request.query[:50] + "..."
+                if len(chat_request.query) > 50
+                else chat_request.query
+            )
+            # Guardar user_id para tracking de ownership en chats generales
+            conversation = Conversation(
+                workspace_id=None, 
+                user_id=current_user.id,
+                title=title
+            )
+            db.add(conversation)
+            await db.commit()
+            await db.refresh(conversation)
 
-    # 2. Guardar mensaje del usuario
-    user_message = Message(
-        conversation_id=conversation.id, role="user", content=chat_request.query
-    )
-    db.add(user_message)
-    db.commit()
+        # 2. Encolar mensaje del usuario (write-behind)
+        user_message_id = await message_writer.add(conversation.id, "user", chat_request.query)
 
-    # 3. Recuperar historial
-    past_messages = (
-        db.query(Message)
-        .filter(
-            Message.conversation_id == conversation.id,
-            Message.id != user_message.id 
+    # 3. Recuperar historial (resumen + últimos turnos)
+    with tracing.stage("history.load"):
+        chat_history = await db.run_sync(
+            conversation_memory.build_chat_history, conversation, exclude_message_id=user_message_id
         )
-        .order_by(Message.created_at.desc())
-        .limit(10) 
-        .all()
-    )
-    
-    chat_history = []
-    for msg in reversed(past_messages):
-        chat_history.append({
-            "role": msg.role,
-            "content": msg.content
-        })
 
     # 4. Streaming de respuesta
     async def stream_response_generator(conversation_id):
-        yield (
-            json.dumps(
-                {
-                    "type": "conversation_id",
-                    "id": conversation_id,
-                }
-            )
-            + "\n"
-        )
-        
-        full_response_text = ""
+        first_event = {
+            "type": "conversation_id",
+            "id": conversation_id,
+        }
+        if chat_request.include_timings:
+            first_event["timings"] = tracing.get_timings()
+        yield json.dumps(first_event) + "\n"
         
         # Usar la nueva función de intención para chat sin workspace
         response_stream = intention_task.general_query_no_workspace_chat(
@@ -116,26 +98,39 @@ async def general_chat(
             chat_history=chat_history
         )
 
+        # El relay consume el stream fuera del event loop, agrupa tokens en frames
+        # más grandes y corta el stream si el cliente se desconecta
+        relay = llm_stream.LLMStreamRelay(response_stream, request, intent="GENERAL_QUERY_NO_WORKSPACE")
+        llm_span = tracing.tracer.start_span(
+            "llm.stream", attributes={"intent": "GENERAL_QUERY_NO_WORKSPACE"}
+        )
+        draft = message_writer.draft(conversation_id)
         try:
-            for token in response_stream:
-                full_response_text += token
+            async for token in relay:
                 yield json.dumps({"type": "content", "text": token}) + "\n"
+                # Guardado parcial periódico (write-behind, no bloquea el stream)
+                draft.checkpoint(relay.text)
 
         except Exception as e:
             yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
             return
 
-        # Guardar respuesta del asistente
-        with database.SessionLocal() as db_session:
-            msg = Message(
-                conversation_id=conversation_id,
-                role="assistant",
-                content=full_response_text,
-            )
-            db_session.add(msg)
-            db_session.commit()
+        finally:
+            # Guardar respuesta del asistente (parcial y marcada si no terminó)
+            if relay.completed or relay.text:
+                draft.finish(relay.text, aborted=not relay.completed)
+            llm_span.set_attribute("response_chars", len(relay.text))
+            llm_span.set_attribute("aborted", relay.aborted)
+            llm_span.end()
 
     return StreamingResponse(
         stream_response_generator(conversation.id),
         media_type="application/x-ndjson",
+        # Actualizar el resumen de la conversación al terminar el turno
+        # (después de que los mensajes del turno estén en la BD)
+        background=BackgroundTask(
+            message_writer.run_after_flush,
+            conversation_memory.update_conversation_summary,
+            conversation.id,
+        ),
     )
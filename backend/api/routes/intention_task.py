@@ -17,6 +17,7 @@ from models import database
 from models.user import User
 from core.auth import get_current_active_user
 from core import llm_service
+from core.llm_router import TaskType
 from core import document_service
 from prompts.chat_prompts import (
     GENERAL_QUERY_WITH_WORKSPACE_PROMPT,
@@ -179,20 +180,18 @@ def general_query_chat(
     # Construir prompt simple
     prompt = GENERAL_QUERY_WITH_WORKSPACE_PROMPT
     
-    # Construir prompt completo
-    full_prompt = f"""
-        prompt: {prompt}
-        pregunta: {query}
-        system_instructions: {workspace_instructions}
-    """
+    # Prefijo estable (plantilla + instrucciones del workspace); la pregunta va al final
+    system_prompt = llm_service.build_system_prompt(prompt, workspace_instructions)
 
     try:
         # Generar respuesta usando LLM service
         response = llm_service.generate_response_stream(
-            full_prompt, 
+            query, 
             relevant_chunks, 
             chat_model,
-            chat_history=chat_history
+            chat_history=chat_history,
+            system_prompt=system_prompt,
+            task_type=TaskType.RESPOND
         )
         return response
     except Exception as e:
@@ -229,20 +228,18 @@ def requirements_matrix_chat(
     # Construir prompt simple
     prompt = REQUIREMENTS_MATRIX_PROMPT
     
-    # Construir prompt completo
-    full_prompt = f"""
-        prompt: {prompt}
-        pregunta: {query}
-        system_instructions: {workspace_instructions}
-    """
+    # Prefijo estable (plantilla + instrucciones del workspace); la pregunta va al final
+    system_prompt = llm_service.build_system_prompt(prompt, workspace_instructions)
 
     try:
         # Generar respuesta usando LLM service
         response = llm_service.generate_response_stream(
-            full_prompt, 
+            query, 
             relevant_chunks, 
             chat_model,
-            chat_history=chat_history
+            chat_history=chat_history,
+            system_prompt=system_prompt,
+            task_type=TaskType.ANALYZE
         )
         return response
     except Exception as e:
@@ -279,20 +276,18 @@ def preeliminar_price_quote_chat(
     # Construir prompt simple
     prompt = PRELIMINARY_PRICE_QUOTE_PROMPT
     
-    # Construir prompt completo
-    full_prompt = f"""
-        prompt: {prompt}
-        pregunta: {query}
-        system_instructions: {workspace_instructions}
-    """
+    # Prefijo estable (plantilla + instrucciones del workspace); la pregunta va al final
+    system_prompt = llm_service.build_system_prompt(prompt, workspace_instructions)
 
     try:
         # Generar respuesta usando LLM service
         response = llm_service.generate_response_stream(
-            full_prompt, 
+            query, 
             relevant_chunks, 
             chat_model,
-            chat_history=chat_history
+            chat_history=chat_history,
+            system_prompt=system_prompt,
+            task_type=TaskType.ANALYZE
         )
         return response
     except Exception as e:
@@ -329,20 +324,18 @@ def legal_risks_chat(
     # Construir prompt simple
     prompt = LEGAL_RISKS_PROMPT
     
-    # Construir prompt completo
-    full_prompt = f"""
-        prompt: {prompt}
-        pregunta: {query}
-        system_instructions: {workspace_instructions}
-    """
+    # Prefijo estable (plantilla + instrucciones del workspace); la pregunta va al final
+    system_prompt = llm_service.build_system_prompt(prompt, workspace_instructions)
 
     try:
         # Generar respuesta usando LLM service
         response = llm_service.generate_response_stream(
-            full_prompt, 
+            query, 
             relevant_chunks, 
             chat_model,
-            chat_history=chat_history
+            chat_history=chat_history,
+            system_prompt=system_prompt,
+            task_type=TaskType.ANALYZE
         )
         return response
     except Exception as e:
@@ -379,20 +372,18 @@ def specific_query_chat(
     # Construir prompt simple
     prompt = SPECIFIC_QUERY_PROMPT
     
-    # Construir prompt completo
-    full_prompt = f"""
-        prompt: {prompt}
-        pregunta: {query}
-        system_instructions: {workspace_instructions}
-    """
+    # Prefijo estable (plantilla + instrucciones del workspace); la pregunta va al final
+    system_prompt = llm_service.build_system_prompt(prompt, workspace_instructions)
 
     try:
         # Generar respuesta usando LLM service
         response = llm_service.generate_response_stream(
-            full_prompt, 
+            query, 
             relevant_chunks, 
             chat_model,
-            chat_history=chat_history
+            chat_history=chat_history,
+            system_prompt=system_prompt,
+            task_type=TaskType.RESPOND
         )
         return response
     except Exception as e:
@@ -423,18 +414,17 @@ def general_query_no_workspace_chat(
     # Usar el prompt específico para chats sin workspace
     prompt = GENERAL_QUERY_NO_WORKSPACE_PROMPT
     
-    full_prompt = f"""
-        prompt: {prompt}
-        pregunta: {query}
-    """
+    system_prompt = llm_service.build_system_prompt(prompt)
 
     try:
         # Generar respuesta usando LLM service (contexto vacío)
         response = llm_service.generate_response_stream(
-            full_prompt, 
+            query, 
             [], # Sin chunks de documentos
             chat_model,
-            chat_history=chat_history
+            chat_history=chat_history,
+            system_prompt=system_prompt,
+            task_type=TaskType.RESPOND
         )
         return response
     except Exception as e:
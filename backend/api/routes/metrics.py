@@ -1,11 +1,14 @@
 """
 Endpoint para métricas del sistema LLM.
 Permite monitorear uso, costos y calidad.
+También expone el registro de consultas SQL lentas (core/db_instrumentation.py).
 """
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from core.auth import get_current_superuser
+from core.db_instrumentation import slow_query_log
 from core.llm_validators import get_metrics
 from core.llm_cache import get_llm_cache
+from core import llm_service
 from models.user import User
 
 router = APIRouter()
@@ -21,7 +24,8 @@ def get_llm_metrics(current_user: User = Depends(get_current_superuser)):
     Returns:
         {
             "llm_usage": {...},
-            "cache_stats": {...}
+            "cache_stats": {...},
+            "providers": {...}
         }
     """
     metrics = get_metrics()
@@ -29,7 +33,8 @@ def get_llm_metrics(current_user: User = Depends(get_current_superuser)):
     
     response = {
         "llm_usage": metrics.get_stats(),
-        "cache_stats": {}
+        "cache_stats": {},
+        "providers": llm_service.get_provider_health()
     }
     
     if cache:
@@ -65,3 +70,37 @@ def clear_llm_cache(current_user: User = Depends(get_current_superuser)):
         return {"message": "Caché limpiado correctamente"}
     else:
         return {"message": "Caché no disponible"}
+
+
+@router.get("/metrics/db/slow-queries")
+def get_slow_queries(
+    explain: bool = True,
+    limit: int = Query(50, ge=1, le=500),
+    current_user: User = Depends(get_current_superuser),
+):
+    """
+    Consultas SQL lentas de este proceso, de mayor a menor tiempo total.
+    
+    Requiere permisos de superusuario.
+    
+    Returns:
+        {
+            "threshold_ms": int,
+            "queries": [...],            # conteo, tiempos, rutas, EXPLAIN
+            "suggested_indexes": [...],  # índices compuestos propuestos
+            "recent": [...]              # últimas consultas lentas
+        }
+    """
+    return slow_query_log.report(explain=explain, limit=limit)
+
+
+@router.post("/metrics/db/slow-queries/reset")
+def reset_slow_queries(current_user: User = Depends(get_current_superuser)):
+    """
+    Vacía el registro de consultas lentas de este proceso.
+    
+    Requiere permisos de superusuario.
+    """
+    slow_query_log.reset()
+    
+    return {"message": "Registro de consultas lentas reseteado"}
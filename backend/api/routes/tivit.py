@@ -6,6 +6,8 @@ from typing import List, Optional
 from pydantic import BaseModel
 import logging
 
+from core.team_builder import TeamRequest, get_team_builder
+
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
@@ -383,36 +385,33 @@ def sugerir_equipo(
         "tamano_equipo": 3,
         "presupuesto_mensual": 20000,
         "duracion_meses": 6,
-        "ubicacion_preferida": "Brasil"
+        "ubicacion_preferida": "Brasil",
+        "certificaciones": ["CISSP"],   # opcional
+        "idiomas": ["Inglés"]           # opcional
     }
-    """
-    # Lógica básica de sugerencia (puede ser mejorada)
-    servicios_requeridos = requerimientos.get("servicios", [])
-    tamano_equipo = requerimientos.get("tamano_equipo", 3)
-    presupuesto = requerimientos.get("presupuesto_mensual", 50000)
-    ubicacion = requerimientos.get("ubicacion_preferida", None)
-
-    # Filtrar trabajadores por servicios requeridos
-    trabajadores_filtrados = []
-    for servicio in servicios_requeridos:
-        trabajadores_filtrados.extend([t for t in TRABAJADORES_TIVIT if t.area == servicio])
-
-    # Remover duplicados
-    trabajadores_filtrados = list(set(trabajadores_filtrados))
 
-    # Filtrar por ubicación si especificada
-    if ubicacion:
-        trabajadores_filtrados = [t for t in trabajadores_filtrados if ubicacion.lower() in t.localidad.lower()]
-
-    # Limitar al tamaño del equipo
-    equipo_sugerido = trabajadores_filtrados[:tamano_equipo]
+    El equipo se arma con core.team_builder: maximiza la cobertura de áreas,
+    certificaciones e idiomas pedidos (y, a igualdad, experiencia,
+    disponibilidad y ubicación) sin exceder el presupuesto mensual.
+    """
+    request = TeamRequest.from_dict(requerimientos)
+    builder = get_team_builder()
+    result = builder.build(request)
 
-    # Calcular costo aproximado
-    costo_mensual_aprox = sum(5000 for _ in equipo_sugerido)  # Estimación básica
+    equipo_sugerido = [builder.index.trabajadores[i] for i in result.members]
+    duracion = requerimientos.get("duracion_meses")
 
     return {
         "equipo_sugerido": [t.dict() for t in equipo_sugerido],
-        "costo_mensual_aproximado": costo_mensual_aprox,
-        "servicios_cubiertos": servicios_requeridos,
+        "costo_mensual_aproximado": result.cost,
+        "costo_por_miembro": {
+            builder.index.trabajadores[i].id: builder.index.costs[i] for i in result.members
+        },
+        "costo_total_aproximado": result.cost * duracion if duracion else None,
+        "servicios_cubiertos": [r.split(":", 1)[1] for r in result.covered if r.startswith("area:")],
+        "requisitos_cubiertos": result.covered,
+        "requisitos_no_cubiertos": result.missing,
+        "puntaje": result.score,
+        "metodo": result.method,
         "tamano_equipo": len(equipo_sugerido)
-    }
\ No newline at end of file
+    }
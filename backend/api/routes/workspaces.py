@@ -1,12 +1,8 @@
-import csv
-import io
 import json
 import os
-import pickle
-import shutil
+import time
 import uuid
 from datetime import datetime
-from functools import lru_cache
 from pathlib import Path
 from typing import List, Optional
 
@@ -25,10 +21,23 @@ from core.gcp_services import gcp_services
 
 # DEPRECADO: from processing import vector_store (eliminado - usar rag_client)
 from core.rag_client import rag_client
-from core import llm_service, intent_detector
+from core import llm_service, intent_detector, conversation_memory, llm_stream, tracing, chat_export, streaming_export
+from core.llm_cache import invalidate_documents
+from core.message_writer import message_writer
+from core.read_routing import get_read_db
+from core import document_store
+from core.document_store import UPLOAD_DIR
+from core.ownership import (
+    get_owned_conversation,
+    get_owned_document,
+    get_owned_workspace,
+    owned_document,
+    owned_workspace,
+)
+from core.tivit_index import get_tivit_index, normalize as normalize_tivit_term
 from api.routes import intention_task
 from fastapi import APIRouter, Depends, File, HTTPException, Request, UploadFile, status
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from models import database, schemas
 from models import document as document_model
 from models import workspace as workspace_model
@@ -39,7 +48,10 @@ from models.user import User
 # Rate Limiting
 from slowapi import Limiter
 from slowapi.util import get_remote_address
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.background import BackgroundTask
 
 limiter = Limiter(key_func=get_remote_address)
 
@@ -55,29 +67,30 @@ CACHE_TTL = 86400
 
 
 # Funciones de cache y eficiencia para datos TIVIT
-@lru_cache(maxsize=1)
-def get_tivit_data():
-    """Obtiene datos TIVIT con cache LRU (solo se carga una vez por proceso)"""
-    try:
-        from api.routes.tivit import SERVICIOS_TIVIT, TRABAJADORES_TIVIT
+TIVIT_CACHE_PREFIX = "tivit_chunks:"
+TIVIT_CACHE_INDEX = f"{TIVIT_CACHE_PREFIX}index"  # ZSET clave -> expiración
+TIVIT_CACHE_STATS = f"{TIVIT_CACHE_PREFIX}stats"  # HASH de contadores
 
-        return TRABAJADORES_TIVIT, SERVICIOS_TIVIT
-    except Exception as e:
-        print(f"Error cargando datos TIVIT: {e}")
-        return [], []
+
+def get_tivit_data():
+    """Obtiene datos TIVIT (cargados una vez por proceso junto con el índice)"""
+    index = get_tivit_index()
+    return index.trabajadores, index.servicios
 
 
 def get_cached_tivit_chunks(query_keywords: frozenset) -> List[schemas.DocumentChunk]:
     """Obtiene chunks de TIVIT cacheados basados en keywords de la consulta"""
     if not redis_client:
-        return get_fallback_tivit_chunks(query_keywords)
+        return generate_tivit_chunks(query_keywords)
 
-    cache_key = f"tivit_chunks:{hash(query_keywords)}"
+    # Clave estable entre workers (sha256 de keywords + versión de los datos)
+    cache_key = get_tivit_index().cache_key(query_keywords, prefix=TIVIT_CACHE_PREFIX)
 
     try:
         cached_data = redis_client.get(cache_key)
         if cached_data:
-            return pickle.loads(cached_data)
+            redis_client.hincrby(TIVIT_CACHE_STATS, "hits", 1)
+            return [schemas.DocumentChunk(**chunk) for chunk in json.loads(cached_data)]
     except Exception as e:
         print(f"Error obteniendo cache Redis: {e}")
 
@@ -85,7 +98,14 @@ def get_cached_tivit_chunks(query_keywords: frozenset) -> List[schemas.DocumentC
     chunks = generate_tivit_chunks(query_keywords)
 
     try:
-        redis_client.setex(cache_key, CACHE_TTL, pickle.dumps(chunks))
+        payload = json.dumps([chunk.model_dump() for chunk in chunks])
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.setex(cache_key, CACHE_TTL, payload)
+        pipe.zadd(TIVIT_CACHE_INDEX, {cache_key: time.time() + CACHE_TTL})
+        pipe.hincrby(TIVIT_CACHE_STATS, "misses", 1)
+        pipe.hincrby(TIVIT_CACHE_STATS, "sets", 1)
+        pipe.hincrby(TIVIT_CACHE_STATS, "bytes_written", len(payload))
+        pipe.execute()
     except Exception as e:
         print(f"Error guardando en cache Redis: {e}")
 
@@ -93,132 +113,60 @@ def get_cached_tivit_chunks(query_keywords: frozenset) -> List[schemas.DocumentC
 
 
 def generate_tivit_chunks(query_keywords: frozenset) -> List[schemas.DocumentChunk]:
-    """Genera chunks de TIVIT filtrados por keywords"""
-    trabajadores, servicios = get_tivit_data()
-    chunks = []
-
-    # Keywords para detectar tipo de equipo
-    dev_keywords = frozenset(
-        [
-            "desarrollo",
-            "programador",
-            "developer",
-            "software",
-            "web",
-            "mobile",
-            "backend",
-            "frontend",
-        ]
-    )
-    security_keywords = frozenset(
-        [
-            "seguridad",
-            "ciberseguridad",
-            "cybersecurity",
-            "hacking",
-            "pentest",
-            "auditoria",
-        ]
-    )
-    cloud_keywords = frozenset(
-        ["cloud", "aws", "azure", "gcp", "nube", "infraestructura"]
-    )
-    data_keywords = frozenset(
-        ["datos", "data", "analytics", "bi", "machine learning", "ml", "ai"]
-    )
-
-    # Determinar qué tipo de trabajadores/servicios son más relevantes
-    relevant_areas = set()
-    if any(kw in query_keywords for kw in dev_keywords):
-        relevant_areas.add("Desarrollo")
-    if any(kw in query_keywords for kw in security_keywords):
-        relevant_areas.add("Ciberseguridad")
-    if any(kw in query_keywords for kw in cloud_keywords):
-        relevant_areas.add("Cloud")
-    if any(kw in query_keywords for kw in data_keywords):
-        relevant_areas.add("Datos")
-
-    # Si no hay áreas específicas, incluir todas
-    if not relevant_areas:
-        relevant_areas = {"Desarrollo", "Ciberseguridad", "Cloud", "Datos"}
-
-    # Filtrar y limitar trabajadores
-    filtered_trabajadores = [
-        t
-        for t in trabajadores
-        if any(
-            area.lower() in t.area.lower() or area.lower() in t.area_experiencia.lower()
-            for area in relevant_areas
-        )
-    ][:8]  # Máximo 8 trabajadores
-
-    # Filtrar servicios relevantes
-    filtered_servicios = [
-        s
-        for s in servicios
-        if any(area.lower() in s.categoria.lower() for area in relevant_areas)
-    ][:4]  # Máximo 4 servicios
-
-    # Crear chunks optimizados (más concisos)
-    for trabajador in filtered_trabajadores:
-        chunk_text = f"TIVIT {trabajador.nombre}: {trabajador.area} con {trabajador.anos_experiencia} años exp. Certificaciones: {', '.join(trabajador.certificaciones[:3])}. Rol: {trabajador.rol}. Idiomas: {', '.join(trabajador.idiomas)}. Disponibilidad: {trabajador.disponibilidad}."
-
-        chunks.append(
-            schemas.DocumentChunk(
-                document_id="tivit-trabajadores",
-                chunk_text=chunk_text,
-                chunk_index=len(chunks),
-                score=0.95,  # Alta relevancia para datos filtrados
-            )
-        )
-
-    for servicio in filtered_servicios:
-        chunk_text = f"Servicio TIVIT {servicio.nombre}: {servicio.descripcion[:100]}... Costo: ${servicio.costo_mensual_min}-${servicio.costo_mensual_max}/mes. Duración: {servicio.duracion_estimada_meses} meses. Tecnologías: {', '.join(servicio.tecnologias_principales[:3])}."
-
-        chunks.append(
-            schemas.DocumentChunk(
-                document_id="tivit-servicios",
-                chunk_text=chunk_text,
-                chunk_index=len(chunks),
-                score=0.85,
-            )
-        )
-
-    return chunks
+    """Genera chunks de TIVIT filtrados por keywords (vía índice invertido)"""
+    return get_tivit_index().chunks_for(query_keywords)
 
 
 def invalidate_tivit_cache():
     """Invalida todo el cache de TIVIT (útil cuando se actualizan los datos)"""
     if redis_client:
         try:
-            # Eliminar todas las claves que empiecen con "tivit_chunks:"
-            keys = redis_client.keys("tivit_chunks:*")
-            if keys:
-                redis_client.delete(*keys)
-                print(f"Cache TIVIT invalidado: {len(keys)} claves eliminadas")
+            # SCAN por lotes (KEYS bloquea Redis con muchas claves)
+            batch, removed = [], 0
+            for key in redis_client.scan_iter(match=f"{TIVIT_CACHE_PREFIX}*", count=500):
+                batch.append(key)
+                if len(batch) >= 500:
+                    removed += redis_client.unlink(*batch)
+                    batch = []
+            if batch:
+                removed += redis_client.unlink(*batch)
+            print(f"Cache TIVIT invalidado: {removed} claves eliminadas")
         except Exception as e:
             print(f"Error invalidando cache TIVIT: {e}")
 
-    # Limpiar también el LRU cache
-    get_tivit_data.cache_clear()
+    # Reconstruir también el índice en memoria
+    get_tivit_index.cache_clear()
 
 
 def get_cache_stats():
-    """Obtiene estadísticas del cache para monitoreo"""
+    """Obtiene estadísticas del cache para monitoreo (contadores, sin recorrer claves)"""
+    index = get_tivit_index()
     stats = {
         "redis_available": redis_client is not None,
-        "lru_cache_info": get_tivit_data.cache_info()._asdict()
-        if hasattr(get_tivit_data, "cache_info")
-        else None,
+        "lru_cache_info": get_tivit_index.cache_info()._asdict(),
+        "tivit_index": {
+            "version": index.version,
+            "trabajadores": len(index.trabajadores),
+            "servicios": len(index.servicios),
+            "terms": len(index.vocabulary),
+        },
     }
 
     if redis_client:
         try:
-            tivit_keys = redis_client.keys("tivit_chunks:*")
-            stats["redis_keys_count"] = len(tivit_keys)
-            stats["redis_memory_usage"] = sum(
-                len(redis_client.get(k) or b"") for k in tivit_keys
-            )
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.zremrangebyscore(TIVIT_CACHE_INDEX, "-inf", time.time())
+            pipe.zcard(TIVIT_CACHE_INDEX)
+            pipe.hgetall(TIVIT_CACHE_STATS)
+            _, keys_count, raw_counters = pipe.execute()
+            counters = {k.decode(): int(v) for k, v in raw_counters.items()}
+            sets = counters.get("sets", 0)
+            avg_bytes = counters.get("bytes_written", 0) / sets if sets else 0
+            stats["redis_keys_count"] = keys_count
+            # Estimación: entradas vigentes x tamaño medio guardado
+            stats["redis_memory_usage"] = int(keys_count * avg_bytes)
+            stats["hits"] = counters.get("hits", 0)
+            stats["misses"] = counters.get("misses", 0)
         except Exception as e:
             stats["redis_error"] = str(e)
 
@@ -279,6 +227,12 @@ def extract_query_keywords(query: str) -> frozenset:
 
     found_keywords = {word for word in query_lower.split() if word in team_keywords}
 
+    # Certificaciones y tecnologías conocidas por el índice TIVIT
+    vocabulary = get_tivit_index().vocabulary
+    found_keywords |= {
+        word for word in normalize_tivit_term(query_lower).split() if word in vocabulary
+    }
+
     # Agregar bigramas comunes
     query_words = query_lower.split()
     for i in range(len(query_words) - 1):
@@ -352,16 +306,34 @@ def create_workspace(
     )
 
 
-UPLOAD_DIR = Path("uploaded_files")
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+def _save_upload(file: UploadFile) -> document_store.StoredUpload:
+    """Guarda el upload por contenido (SHA-256 calculado al copiarlo); 500 si falla."""
+    try:
+        return document_store.save_upload(file.file, os.path.splitext(file.filename)[1])
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al guardar el archivo: {e}",
+        )
+    finally:
+        file.file.close()
+
+
+def _reuse_processed(db: Session, db_document: document_model.Document) -> bool:
+    """
+    Si ya se procesó un archivo idéntico (mismo content_hash), encola la copia
+    de sus vectores y análisis en lugar del procesamiento completo.
+    """
+    source = document_store.find_processed(db, db_document.content_hash, exclude_id=db_document.id)
+    if source is None:
+        return False
+    celery_app.send_task(
+        "processing.tasks.copy_processed_document",
+        args=[db_document.id, source.id, db_document.storage_uri],
+    )
+    print(f"API: Documento {db_document.id} idéntico a {source.id}: se reutiliza su procesamiento.")
+    return True
 
-def upload_to_gcs(file_obj, destination_blob_name):
-    """Sube un archivo a Google Cloud Storage."""
-    # Used centralized service
-    result = gcp_services.upload_file(file_obj, destination_blob_name)
-    if not result:
-        raise Exception("Error uploading to GCS (check logs)")
-    return result
 
 def download_from_gcs_stream(source_blob_name):
     """Genera un stream del archivo desde GCS."""
@@ -391,9 +363,10 @@ def upload_document_to_workspace(
     El endpoint:
     1. Verifica que el Workspace exista.
     2. Valida el archivo (tamaño, tipo, extensión).
-    3. Guarda el archivo en un directorio persistente.
+    3. Guarda el archivo por contenido (SHA-256, ver core/document_store.py).
     4. Crea un registro 'Document' en la BD con estado 'PENDING'.
-    5. Envía una tarea a Celery para procesarlo.
+    5. Envía una tarea a Celery: copia del procesamiento si el mismo archivo
+       ya se procesó, o procesamiento completo.
     """
 
     # 1. Validar archivo ANTES de cualquier procesamiento (SEGURIDAD)
@@ -401,27 +374,17 @@ def upload_document_to_workspace(
 
     validate_file(file)
 
-    # 2. Verificar que el Workspace existe
-    db_workspace = (
-        db.query(workspace_model.Workspace)
-        .filter(workspace_model.Workspace.id == workspace_id)
-        .first()
+    # 2. Verificar que el Workspace existe y pertenece al usuario
+    get_owned_workspace(
+        db, workspace_id, current_user,
+        forbidden_detail="No tienes permiso para subir documentos a este workspace.",
     )
 
-    if not db_workspace:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Workspace con id {workspace_id} no encontrado.",
-        )
-
-    # Verificar ownership
-    if db_workspace.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="No tienes permiso para subir documentos a este workspace.",
-        )
+    # 3. Guardar el archivo por contenido (blobs/{sha256}{ext})
+    stored = _save_upload(file)
+    file_uri = stored.uri
 
-    # 3. Crear el registro 'Document' en la BD PRIMERO para obtener el ID
+    # 4. Crear el registro 'Document' en la BD
     # Usamos el helper del schema para obtener el file_type
     doc_data = schemas.DocumentPublic.from_upload(file, workspace_id)
 
@@ -430,60 +393,17 @@ def upload_document_to_workspace(
         file_type=doc_data.file_type,
         workspace_id=workspace_id,
         status="PENDING",  # Estado inicial
+        content_hash=stored.content_hash,
+        storage_uri=file_uri,
     )
 
     db.add(db_document)
     db.commit()
     db.refresh(db_document)
 
-    # 4. Guardar el archivo PERSISTENTEMENTE
-    file_uri = ""
-    try:
-        extension = os.path.splitext(file.filename)[1]
-        filename = f"{db_document.id}{extension}"
-        
-        # Intentar subir a GCS si está configurado
-        if settings.GCS_BUCKET_NAME:
-            try:
-                file_uri = upload_to_gcs(file.file, filename)
-                if file_uri:
-                    print(f"Archivo subido a GCS: {file_uri}")
-                else:
-                    raise Exception("GCS upload returned None")
-            except Exception as gcs_error:
-                print(f"Error al subir a GCS, usando almacenamiento local: {gcs_error}")
-                # Fallback a local si GCS falla
-                file.file.seek(0)  # Reset file pointer
-                file_path = UPLOAD_DIR / filename
-                with open(file_path, "wb") as buffer:
-                    shutil.copyfileobj(file.file, buffer)
-                file_uri = str(file_path)
-        else:
-            # Almacenamiento local si GCS no está configurado
-            file_path = UPLOAD_DIR / filename
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            file_uri = str(file_path)
-            
-    except Exception as e:
-        # Si falla el guardado, eliminar el registro de la BD
-        db.delete(db_document)
-        db.commit()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error al guardar el archivo: {e}",
-        )
-    finally:
-        file.file.close()
-
-    # Verificar que file_uri no esté vacío
-    if not file_uri:
-        db.delete(db_document)
-        db.commit()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Error: No se pudo determinar la ubicación del archivo guardado",
-        )
+    # Archivo idéntico ya procesado: copiar vectores y análisis
+    if _reuse_processed(db, db_document):
+        return db_document
 
     # 5. Enviar tarea de procesamiento
     # Check if Cloud Tasks configuration exists
@@ -538,37 +458,8 @@ def get_document_content(
     """
     Obtiene el archivo original de un documento para previsualización.
     """
-    # 1. Verificar documento
-    db_document = (
-        db.query(document_model.Document)
-        .filter(document_model.Document.id == document_id)
-        .first()
-    )
-
-    if not db_document:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Documento no encontrado.",
-        )
-        
-    # 2. Verificar workspace y permisos
-    if db_document.workspace_id != workspace_id:
-         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="El documento no pertenece al workspace especificado.",
-        )
-
-    db_workspace = (
-        db.query(workspace_model.Workspace)
-        .filter(workspace_model.Workspace.id == workspace_id)
-        .first()
-    )
-    
-    if not db_workspace or db_workspace.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="No tienes permiso para ver este documento.",
-        )
+    # 1-2. Verificar documento, workspace y permisos (una sola consulta)
+    db_document, _ = get_owned_document(db, document_id, current_user, workspace_id=workspace_id)
 
     # 3. Servir el archivo
     # Determinar content-type
@@ -585,6 +476,25 @@ def get_document_content(
     elif ext in [".jpg", ".jpeg", ".png"]:
         media_type = "image/" + ext[1:]
 
+    # Documentos con almacenamiento por contenido: ubicación guardada en la BD
+    if db_document.storage_uri:
+        if db_document.storage_uri.startswith("gs://"):
+            bucket_name, blob_name = document_store.split_gcs_uri(db_document.storage_uri)
+            stream = gcp_services.open_file_stream(blob_name, bucket_name)
+            if stream:
+                return StreamingResponse(stream, media_type=media_type)
+        elif os.path.exists(db_document.storage_uri):
+            return FileResponse(
+                path=db_document.storage_uri,
+                filename=db_document.file_name,
+                media_type=media_type
+            )
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="El archivo no se encuentra en el almacenamiento.",
+        )
+
+    # Documentos anteriores: guardados como {id}{ext}
     # Intentar obtener desde GCS
     if settings.GCS_BUCKET_NAME:
         # Asumimos que el nombre en el bucket es ID + extension.
@@ -632,33 +542,19 @@ def get_document_content(
 def get_workspace_documents(
     workspace_id: str,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(database.get_db),
+    db: Session = Depends(get_read_db),
 ):
     """
     Obtiene una lista de todos los documentos para un workspace_id específico.
 
     Requiere autenticación. Solo el owner puede ver los documentos del workspace.
     """
-    # Primero, verificar que el workspace exista (buena práctica)
-    db_workspace = (
-        db.query(workspace_model.Workspace)
-        .filter(workspace_model.Workspace.id == workspace_id)
-        .first()
+    # Verificar que el workspace exista y sea del usuario
+    get_owned_workspace(
+        db, workspace_id, current_user,
+        forbidden_detail="No tienes permiso para ver los documentos de este workspace.",
     )
 
-    if not db_workspace:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Workspace con id {workspace_id} no encontrado.",
-        )
-
-    # Verificar ownership
-    if db_workspace.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="No tienes permiso para ver los documentos de este workspace.",
-        )
-
     # Si existe, obtener sus documentos
     documents = (
         db.query(document_model.Document)
@@ -675,9 +571,7 @@ def get_workspace_documents(
     summary="Obtener el estado de procesamiento de un documento"
 )
 def get_document_status(
-    document_id: str,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(database.get_db),
+    db_document: document_model.Document = Depends(owned_document),
 ):
     """
     Endpoint para que el frontend consulte el estado de un documento.
@@ -704,32 +598,10 @@ def get_document_status(
       }
     };
     ```
-    """
-    db_document = (
-        db.query(document_model.Document)
-        .filter(document_model.Document.id == document_id)
-        .first()
-    )
-
-    if not db_document:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Documento con id {document_id} no encontrado.",
-        )
-
-    # Verificar ownership del workspace
-    db_workspace = (
-        db.query(workspace_model.Workspace)
-        .filter(workspace_model.Workspace.id == db_document.workspace_id)
-        .first()
-    )
-
-    if not db_workspace or db_workspace.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="No tienes permiso para ver este documento.",
-        )
 
+    Documento y ownership se resuelven en una sola consulta (`owned_document`):
+    este endpoint se consulta cada 2 segundos por documento.
+    """
     return db_document
 
 
@@ -741,31 +613,19 @@ def get_document_status(
 def get_pending_documents(
     workspace_id: str,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(database.get_db),
+    db: Session = Depends(get_read_db),
 ):
     """
     Devuelve solo los documentos que están en estado PENDING o PROCESSING.
     
     Útil para que el frontend muestre un indicador de "X documentos procesándose".
     """
-    db_workspace = (
-        db.query(workspace_model.Workspace)
-        .filter(workspace_model.Workspace.id == workspace_id)
-        .first()
+    get_owned_workspace(
+        db, workspace_id, current_user,
+        forbidden_detail="No tienes permiso para ver documentos de este workspace.",
+        not_found_detail="Workspace no encontrado.",
     )
 
-    if not db_workspace:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Workspace no encontrado.",
-        )
-
-    if db_workspace.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="No tienes permiso para ver documentos de este workspace.",
-        )
-
     pending_docs = (
         db.query(document_model.Document)
         .filter(
@@ -788,49 +648,20 @@ def get_conversation_documents(
     workspace_id: str,
     conversation_id: str,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(database.get_db),
+    db: Session = Depends(get_read_db),
 ):
     """
     Obtiene una lista de todos los documentos asociados a una conversación específica.
 
     Requiere autenticación. Solo el owner puede ver los documentos de la conversación.
     """
-    # Verificar que el workspace exista
-    db_workspace = (
-        db.query(workspace_model.Workspace)
-        .filter(workspace_model.Workspace.id == workspace_id)
-        .first()
-    )
-
-    if not db_workspace:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Workspace con id {workspace_id} no encontrado.",
-        )
-
-    # Verificar ownership
-    if db_workspace.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="No tienes permiso para ver los documentos de este workspace.",
-        )
-
-    # Verificar que la conversación exista y pertenezca al workspace
-    db_conversation = (
-        db.query(Conversation)
-        .filter(
-            Conversation.id == conversation_id,
-            Conversation.workspace_id == workspace_id,
-        )
-        .first()
+    # Verificar workspace, ownership y conversación (una sola consulta)
+    get_owned_conversation(
+        db, workspace_id, conversation_id, current_user,
+        forbidden_detail="No tienes permiso para ver los documentos de este workspace.",
+        not_found_detail=f"Conversación con id {conversation_id} no encontrada en este workspace.",
     )
 
-    if not db_conversation:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Conversación con id {conversation_id} no encontrada en este workspace.",
-        )
-
     # Obtener documentos de la conversación
     documents = (
         db.query(document_model.Document)
@@ -867,9 +698,10 @@ def upload_document_to_conversation(
     El endpoint:
     1. Verifica que el Workspace y Conversación existan.
     2. Valida el archivo (tamaño, tipo, extensión).
-    3. Guarda el archivo en un directorio temporal.
+    3. Guarda el archivo por contenido (SHA-256, ver core/document_store.py).
     4. Crea un registro 'Document' en la BD con estado 'PENDING' y conversation_id.
-    5. Envía una tarea a Celery para procesarlo.
+    5. Envía una tarea a Celery: copia del procesamiento si el mismo archivo
+       ya se procesó, o procesamiento completo.
     """
 
     # 1. Validar archivo ANTES de cualquier procesamiento (SEGURIDAD)
@@ -877,43 +709,18 @@ def upload_document_to_conversation(
 
     validate_file(file)
 
-    # 2. Verificar que el Workspace existe
-    db_workspace = (
-        db.query(workspace_model.Workspace)
-        .filter(workspace_model.Workspace.id == workspace_id)
-        .first()
-    )
-
-    if not db_workspace:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Workspace con id {workspace_id} no encontrado.",
-        )
-
-    # Verificar ownership
-    if db_workspace.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="No tienes permiso para subir documentos a este workspace.",
-        )
-
-    # 3. Verificar que la Conversación existe y pertenece al workspace
-    db_conversation = (
-        db.query(Conversation)
-        .filter(
-            Conversation.id == conversation_id,
-            Conversation.workspace_id == workspace_id,
-        )
-        .first()
+    # 2-3. Verificar Workspace, ownership y que la Conversación pertenezca al workspace
+    get_owned_conversation(
+        db, workspace_id, conversation_id, current_user,
+        forbidden_detail="No tienes permiso para subir documentos a este workspace.",
+        not_found_detail=f"Conversación con id {conversation_id} no encontrada en este workspace.",
     )
 
-    if not db_conversation:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Conversación con id {conversation_id} no encontrada en este workspace.",
-        )
+    # 4. Guardar el archivo por contenido (blobs/{sha256}{ext})
+    stored = _save_upload(file)
+    file_uri = stored.uri
 
-    # 4. Crear el registro 'Document' en la BD PRIMERO para obtener el ID
+    # 5. Crear el registro 'Document' en la BD
     # Usamos el helper del schema para obtener el file_type
     doc_data = schemas.DocumentPublic.from_upload(file, workspace_id)
 
@@ -923,59 +730,17 @@ def upload_document_to_conversation(
         workspace_id=workspace_id,
         conversation_id=conversation_id,  # Asignar a la conversación
         status="PENDING",
+        content_hash=stored.content_hash,
+        storage_uri=file_uri,
     )
 
     db.add(db_document)
     db.commit()
     db.refresh(db_document)
 
-    # 5. Guardar el archivo PERSISTENTEMENTE
-    file_uri = ""
-    try:
-        extension = os.path.splitext(file.filename)[1]
-        filename = f"{db_document.id}{extension}"
-        
-        # Intentar subir a GCS si está configurado
-        if settings.GCS_BUCKET_NAME:
-            try:
-                file_uri = upload_to_gcs(file.file, filename)
-                if file_uri:
-                    print(f"Archivo conversación subido a GCS: {file_uri}")
-                else:
-                    raise Exception("GCS upload returned None")
-            except Exception as gcs_error:
-                print(f"Error al subir a GCS, usando almacenamiento local: {gcs_error}")
-                # Fallback a local si GCS falla
-                file.file.seek(0)  # Reset file pointer
-                file_path = UPLOAD_DIR / filename
-                with open(file_path, "wb") as buffer:
-                    shutil.copyfileobj(file.file, buffer)
-                file_uri = str(file_path)
-        else:
-            # Almacenamiento local si GCS no está configurado
-            file_path = UPLOAD_DIR / filename
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            file_uri = str(file_path)
-            
-    except Exception as e:
-        db.delete(db_document)
-        db.commit()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error al guardar el archivo: {e}",
-        )
-    finally:
-        file.file.close()
-    
-    # Validar que file_uri no esté vacío
-    if not file_uri:
-        db.delete(db_document)
-        db.commit()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Error: No se pudo determinar la ubicación del archivo guardado",
-        )
+    # Archivo idéntico ya procesado: copiar vectores y análisis
+    if _reuse_processed(db, db_document):
+        return db_document
 
     # 6. Enviar tarea a Celery con la URI
     celery_app.send_task(
@@ -1000,7 +765,7 @@ async def chat_with_workspace(
     workspace_id: str,
     chat_request: schemas.ChatRequest,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_async_db),
 ):
     """
     Endpoint general de chat.
@@ -1014,57 +779,46 @@ async def chat_with_workspace(
     # -------------------------------------------------------------
     # 1. Verificar existencia y permisos del workspace
     # -------------------------------------------------------------
-    db_workspace = (
-        db.query(workspace_model.Workspace)
-        .filter(workspace_model.Workspace.id == workspace_id)
-        .first()
-    )
-    
+    # Si viene conversation_id, workspace + conversación se resuelven en una consulta
+    conversation = None
+    with tracing.stage("workspace.lookup", workspace_id=workspace_id):
+        if chat_request.conversation_id:
+            conversation, db_workspace = await db.run_sync(
+                get_owned_conversation, workspace_id, chat_request.conversation_id, current_user,
+                forbidden_detail="No autorizado.",
+            )
+        else:
+            db_workspace = await db.run_sync(
+                get_owned_workspace, workspace_id, current_user,
+                forbidden_detail="No autorizado.",
+                not_found_detail="Workspace no encontrado.",
+            )
+
     if db_workspace.instructions:
         workspace_instructions = db_workspace.instructions
         print(f"Instrucciones del workspace: {db_workspace.instructions}")
     else:
         workspace_instructions = ""
 
-    if not db_workspace:
-        raise HTTPException(status_code=404, detail="Workspace no encontrado.")
-
-    if db_workspace.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="No autorizado.")
-
     # -------------------------------------------------------------
     # 2. Obtener o crear conversación
     # -------------------------------------------------------------
-    if chat_request.conversation_id:
-        conversation = (
-            db.query(Conversation)
-            .filter(
-                Conversation.id == chat_request.conversation_id,
-                Conversation.workspace_id == workspace_id,
+    with tracing.stage("conversation.write"):
+        if conversation is None:
+            title = (
+                chat_request.query[:50] + "..."
+                if len(chat_request.query) > 50
+                else chat_request.query
             )
-            .first()
-        )
-        if not conversation:
-            raise HTTPException(status_code=404, detail="Conversación no encontrada.")
-    else:
-        title = (
-            chat_request.query[:50] + "..."
-            if len(chat_request.query) > 50
-            else chat_request.query
-        )
-        conversation = Conversation(workspace_id=workspace_id, title=title)
-        db.add(conversation)
-        db.commit()
-        db.refresh(conversation)
+            conversation = Conversation(workspace_id=workspace_id, title=title)
+            db.add(conversation)
+            await db.commit()
+            await db.refresh(conversation)
 
-    # -------------------------------------------------------------
-    # 3. Guardar mensaje del usuario en la BD
-    # -------------------------------------------------------------
-    user_message = Message(
-        conversation_id=conversation.id, role="user", content=chat_request.query
-    )
-    db.add(user_message)
-    db.commit()
+        # -------------------------------------------------------------
+        # 3. Encolar el mensaje del usuario (write-behind, fuera del camino del TTFT)
+        # -------------------------------------------------------------
+        user_message_id = await message_writer.add(conversation.id, "user", chat_request.query)
 
     # -------------------------------------------------------------
     # 4. Retrieval dinámico
@@ -1076,13 +830,14 @@ async def chat_with_workspace(
     if settings.RAG_SERVICE_ENABLED and rag_client:
         try:
             # Filtrar por workspace_id Y conversation_id para independencia entre chats
-            rag_results = await rag_client.search(
-                query=chat_request.query,
-                workspace_id=workspace_id,
-                conversation_id=conversation.id,  # Agregar filtro por conversación
-                limit=top_k,
-                threshold=0.25,
-            )
+            with tracing.stage("rag.search", top_k=top_k):
+                rag_results = await rag_client.search(
+                    query=chat_request.query,
+                    workspace_id=workspace_id,
+                    conversation_id=conversation.id,  # Agregar filtro por conversación
+                    limit=top_k,
+                    threshold=0.25,
+                )
             relevant_chunks = [
                 schemas.DocumentChunk(
                     document_id=r.document_id,
@@ -1099,30 +854,17 @@ async def chat_with_workspace(
     # 5. Identificar intención de consulta de usuario
     # -------------------------------------------------------------  
 
-    intent = intent_detector.classify_intent(chat_request.query)
+    with tracing.stage("intent.classify") as span:
+        intent = intent_detector.classify_intent(chat_request.query)
+        span.set_attribute("intent", str(intent))
     print(f"Intención detectada: {intent}")
 
-    # --- NUEVO: Recuperar historial de chat ---
-    # Obtenemos los últimos 10 mensajes (5 turnos de conversación) para contexto
+    # --- Recuperar historial de chat (resumen + últimos turnos) ---
     # Excluimos el mensaje actual que acabamos de guardar
-    past_messages = (
-        db.query(Message)
-        .filter(
-            Message.conversation_id == conversation.id,
-            Message.id != user_message.id # Excluir el actual
+    with tracing.stage("history.load"):
+        chat_history = await db.run_sync(
+            conversation_memory.build_chat_history, conversation, exclude_message_id=user_message_id
         )
-        .order_by(Message.created_at.desc())
-        .limit(10) 
-        .all()
-    )
-    
-    # Reordenar cronológicamente (antiguo -> nuevo) y formatear
-    chat_history = []
-    for msg in reversed(past_messages):
-        chat_history.append({
-            "role": msg.role,
-            "content": msg.content
-        })
     # ------------------------------------------
 
     # -------------------------------------------------------------
@@ -1134,15 +876,14 @@ async def chat_with_workspace(
         model_used = chat_request.model or "gpt-4o-mini"
 
         # Enviar el intent detectado al frontend para que pueda reaccionar
-        yield (
-            json.dumps(
-                {
-                    "type": "intent",
-                    "intent": intent,
-                }
-            )
-            + "\n"
-        )
+        intent_event = {
+            "type": "intent",
+            "intent": intent,
+        }
+        if chat_request.include_timings:
+            # Desglose por etapa (ms) hasta antes de llamar al LLM
+            intent_event["timings"] = tracing.get_timings()
+        yield json.dumps(intent_event) + "\n"
 
         yield (
             json.dumps(
@@ -1156,12 +897,16 @@ async def chat_with_workspace(
             + "\n"
         )
 
-        full_response_text = ""
-        
         if intent == "GENERATE_PROPOSAL":
-            # Marcar conversación como que tiene propuesta
-            conversation.has_proposal = True
-            db.commit()
+            # Marcar conversación como que tiene propuesta (sesión propia: el
+            # stream se consume fuera del ciclo de vida de la dependencia)
+            async with database.AsyncSessionLocal() as db_session:
+                await db_session.execute(
+                    update(Conversation)
+                    .where(Conversation.id == conversation_id)
+                    .values(has_proposal=True)
+                )
+                await db_session.commit()
             response_stream = intention_task.get_analyze_stream(query=chat_request.query,relevant_chunks=relevant_chunks,chat_model= chat_request.model, workspace_instructions= workspace_instructions)
         elif intent == "GENERAL_QUERY":
             response_stream = intention_task.general_query_chat(
@@ -1204,28 +949,39 @@ async def chat_with_workspace(
                 chat_history=chat_history
             )
 
+        # El relay consume el stream fuera del event loop, agrupa tokens en frames
+        # más grandes y corta el stream si el cliente se desconecta
+        relay = llm_stream.LLMStreamRelay(response_stream, request, intent=intent)
+        llm_span = tracing.tracer.start_span("llm.stream", attributes={"intent": str(intent)})
+        draft = message_writer.draft(conversation_id)
         try:
-            for token in response_stream:
-                full_response_text += token
+            async for token in relay:
                 yield json.dumps({"type": "content", "text": token}) + "\n"
+                # Guardado parcial periódico (write-behind, no bloquea el stream)
+                draft.checkpoint(relay.text)
 
         except Exception as e:
             yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
             return
 
-        # Guardar respuesta del asistente
-        with database.SessionLocal() as db_session:
-            msg = Message(
-                conversation_id=conversation_id,
-                role="assistant",
-                content=full_response_text,
-            )
-            db_session.add(msg)
-            db_session.commit()
+        finally:
+            # Guardar respuesta del asistente (parcial y marcada si no terminó)
+            if relay.completed or relay.text:
+                draft.finish(relay.text, aborted=not relay.completed)
+            llm_span.set_attribute("response_chars", len(relay.text))
+            llm_span.set_attribute("aborted", relay.aborted)
+            llm_span.end()
 
     return StreamingResponse(
         stream_response_generator(conversation.id, relevant_chunks),
         media_type="application/x-ndjson",
+        # Actualizar el resumen de la conversación al terminar el turno
+        # (después de que los mensajes del turno estén en la BD)
+        background=BackgroundTask(
+            message_writer.run_after_flush,
+            conversation_memory.update_conversation_summary,
+            conversation.id,
+        ),
     )
 
 
@@ -1235,34 +991,13 @@ async def chat_with_workspace(
     summary="Obtener un Workspace por ID",
 )
 def get_workspace(
-    workspace_id: str,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(database.get_db),
+    db_workspace: workspace_model.Workspace = Depends(owned_workspace),
 ):
     """
     Obtiene un workspace específico por su ID.
 
     Requiere autenticación. Solo el owner puede ver el workspace.
     """
-    db_workspace = (
-        db.query(workspace_model.Workspace)
-        .filter(workspace_model.Workspace.id == workspace_id)
-        .first()
-    )
-
-    if not db_workspace:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Workspace con id {workspace_id} no encontrado.",
-        )
-
-    # Verificar ownership
-    if db_workspace.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="No tienes permiso para acceder a este workspace.",
-        )
-
     return db_workspace
 
 
@@ -1283,25 +1018,11 @@ def update_workspace(
 
     Requiere autenticación. Solo el owner puede actualizar el workspace.
     """
-    db_workspace = (
-        db.query(workspace_model.Workspace)
-        .filter(workspace_model.Workspace.id == workspace_id)
-        .first()
+    db_workspace = get_owned_workspace(
+        db, workspace_id, current_user,
+        forbidden_detail="No tienes permiso para actualizar este workspace.",
     )
 
-    if not db_workspace:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Workspace con id {workspace_id} no encontrado.",
-        )
-
-    # Verificar ownership
-    if db_workspace.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="No tienes permiso para actualizar este workspace.",
-        )
-
     # Actualizar solo los campos proporcionados (que no sean None)
     update_data = workspace_in.model_dump(exclude_unset=True)
     for key, value in update_data.items():
@@ -1323,33 +1044,22 @@ async def delete_workspace(
     request: Request,
     workspace_id: str,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_async_db),
 ):
     """
     Elimina un workspace y todos sus documentos asociados.
 
     Requiere autenticación. Solo el owner puede eliminar el workspace.
     """
-    db_workspace = (
-        db.query(workspace_model.Workspace)
-        .filter(workspace_model.Workspace.id == workspace_id)
-        .first()
+    db_workspace = await db.run_sync(
+        get_owned_workspace, workspace_id, current_user,
+        forbidden_detail="No tienes permiso para eliminar este workspace.",
     )
 
-    if not db_workspace:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Workspace con id {workspace_id} no encontrado.",
-        )
-
-    # Verificar ownership
-    if db_workspace.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="No tienes permiso para eliminar este workspace.",
-        )
-
-    documents = list(db_workspace.documents)
+    documents = (await db.scalars(
+        select(document_model.Document).where(document_model.Document.workspace_id == workspace_id)
+    )).all()
+    document_ids = [document.id for document in documents]
 
     for document in documents:
         # Eliminar del servicio RAG externo (si está habilitado)
@@ -1360,14 +1070,17 @@ async def delete_workspace(
             except Exception as exc:
                 print(f"ERROR eliminando del RAG externo {document.id}: {exc}")
 
-        db.delete(document)
+        await db.delete(document)
 
     # Nota: El servicio RAG externo elimina documentos individualmente
     # No hay concepto de "workspace vectors" en el servicio externo
     print(f"Workspace {workspace_id} eliminado (documentos ya eliminados del RAG)")
 
-    db.delete(db_workspace)
-    db.commit()
+    await db.delete(db_workspace)
+    await db.commit()
+
+    # Respuestas LLM cacheadas que dependían del workspace o sus documentos
+    invalidate_documents(workspace_id, document_ids)
     return
 
 
@@ -1382,38 +1095,19 @@ async def delete_document(
     request: Request,
     document_id: str,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_async_db),
 ):
     """
     Elimina un documento específico.
 
     Requiere autenticación. Solo el owner del workspace al que pertenece el documento puede eliminarlo.
     """
-    db_document = (
-        db.query(document_model.Document)
-        .filter(document_model.Document.id == document_id)
-        .first()
+    # Documento + ownership del workspace al que pertenece (una sola consulta)
+    db_document, db_workspace = await db.run_sync(
+        get_owned_document, document_id, current_user,
+        forbidden_detail="No tienes permiso para eliminar este documento.",
     )
 
-    if not db_document:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Documento con id {document_id} no encontrado.",
-        )
-
-    # Verificar ownership del workspace al que pertenece el documento
-    db_workspace = (
-        db.query(workspace_model.Workspace)
-        .filter(workspace_model.Workspace.id == db_document.workspace_id)
-        .first()
-    )
-
-    if not db_workspace or db_workspace.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="No tienes permiso para eliminar este documento.",
-        )
-
     # 1. Eliminar del servicio RAG externo (si está habilitado)
     if settings.RAG_SERVICE_ENABLED and rag_client:
         try:
@@ -1427,8 +1121,12 @@ async def delete_document(
             # Continuar de todos modos para eliminar de la BD
 
     # 2. Eliminar de PostgreSQL
-    db.delete(db_document)
-    db.commit()
+    document_workspace_id = db_document.workspace_id
+    await db.delete(db_document)
+    await db.commit()
+
+    # 3. Invalidar respuestas LLM cacheadas que usaban este documento
+    invalidate_documents(document_workspace_id, [document_id])
     return
 
 
@@ -1439,7 +1137,7 @@ async def delete_document(
 )
 def get_workspaces(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(database.get_db),
+    db: Session = Depends(get_read_db),
 ):
     """
     Obtiene una lista de todos los workspaces del usuario autenticado.
@@ -1473,50 +1171,15 @@ def export_documents_csv(
 
     Requiere autenticación. Solo el owner puede exportar los documentos.
     """
-    # Verificar que el workspace existe
-    db_workspace = (
-        db.query(workspace_model.Workspace)
-        .filter(workspace_model.Workspace.id == workspace_id)
-        .first()
+    # Verificar que el workspace existe y pertenece al usuario
+    get_owned_workspace(
+        db, workspace_id, current_user,
+        forbidden_detail="No tienes permiso para exportar desde este workspace.",
     )
 
-    if not db_workspace:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Workspace con id {workspace_id} no encontrado.",
-        )
-
-    # Obtener documentos
-    documents = (
-        db.query(document_model.Document)
-        .filter(document_model.Document.workspace_id == workspace_id)
-        .all()
-    )
-
-    # Crear CSV en memoria
-    output = io.StringIO()
-    writer = csv.writer(output)
-
-    # Escribir encabezados
-    writer.writerow(["ID", "Nombre", "Tipo", "Estado", "Chunks", "Fecha Creación"])
-
-    # Escribir datos
-    for doc in documents:
-        writer.writerow(
-            [
-                doc.id,
-                doc.file_name,
-                doc.file_type,
-                doc.status,
-                doc.chunk_count,
-                doc.created_at.strftime("%Y-%m-%d %H:%M:%S") if doc.created_at else "",
-            ]
-        )
-
-    # Preparar respuesta
-    output.seek(0)
+    # CSV fila a fila (memoria constante aunque el workspace sea grande)
     return StreamingResponse(
-        iter([output.getvalue()]),
+        streaming_export.iter_documents_csv(workspace_id),
         media_type="text/csv",
         headers={
             "Content-Disposition": f"attachment; filename=documents_{workspace_id}_{datetime.now().strftime('%Y%m%d')}.csv"
@@ -1541,115 +1204,26 @@ def export_chat_txt(
 
     Requiere autenticación. Solo el owner puede exportar.
     """
-    import re
-
-    from models.conversation import Conversation, Message
-
-    def markdown_to_text(markdown_text: str) -> str:
-        """Convierte Markdown a texto plano legible."""
-        text = markdown_text
-        # Headers
-        text = re.sub(r"^#{1,6}\s+(.+)$", r"\1", text, flags=re.MULTILINE)
-        # Bold
-        text = re.sub(r"\*\*(.+?)\*\*", r"\1", text)
-        text = re.sub(r"__(.+?)__", r"\1", text)
-        # Italic
-        text = re.sub(r"\*(.+?)\*", r"\1", text)
-        text = re.sub(r"_(.+?)_", r"\1", text)
-        # Code blocks
-        text = re.sub(r"```[\w]*\n([\s\S]+?)```", r"\n\1\n", text)
-        # Inline code
-        text = re.sub(r"`(.+?)`", r"\1", text)
-        # Links
-        text = re.sub(r"\[([^\]]+)\]\([^\)]+\)", r"\1", text)
-        # Lists
-        text = re.sub(r"^[\*\-\+]\s+", "• ", text, flags=re.MULTILINE)
-        text = re.sub(r"^\d+\.\s+", "", text, flags=re.MULTILINE)
-        return text
-
-    # Verificar que el workspace existe
-    db_workspace = (
-        db.query(workspace_model.Workspace)
-        .filter(workspace_model.Workspace.id == workspace_id)
-        .first()
-    )
-
-    if not db_workspace:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Workspace con id {workspace_id} no encontrado.",
-        )
-
-    # Verificar ownership
-    if db_workspace.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="No tienes permiso para exportar desde este workspace.",
-        )
-
-    # Crear contenido TXT
-    content = f"CHAT EXPORT - {db_workspace.name}\n"
-    content += f"{'=' * 80}\n"
-    content += f"Workspace: {db_workspace.name}\n"
-    content += f"Descripción: {db_workspace.description or 'N/A'}\n"
-    content += f"Fecha de exportación: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-    content += f"{'=' * 80}\n\n"
-
-    # Obtener conversaciones
+    # Verificar workspace y ownership (y la conversación, si se indicó, en la misma consulta)
     if conversation_id:
-        conversations = (
-            db.query(Conversation)
-            .filter(
-                Conversation.id == conversation_id,
-                Conversation.workspace_id == workspace_id,
-            )
-            .all()
+        _, db_workspace = get_owned_conversation(
+            db, workspace_id, conversation_id, current_user,
+            forbidden_detail="No tienes permiso para exportar desde este workspace.",
+            not_found_detail=f"Conversación {conversation_id} no encontrada.",
         )
-        if not conversations:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Conversación {conversation_id} no encontrada.",
-            )
     else:
-        conversations = (
-            db.query(Conversation)
-            .filter(Conversation.workspace_id == workspace_id)
-            .order_by(Conversation.created_at.desc())
-            .all()
+        db_workspace = get_owned_workspace(
+            db, workspace_id, current_user,
+            forbidden_detail="No tienes permiso para exportar desde este workspace.",
         )
 
-    if not conversations:
-        content += "No hay conversaciones en este workspace.\n"
-    else:
-        for conv in conversations:
-            content += f"\n{'=' * 80}\n"
-            content += f"CONVERSACIÓN: {conv.title}\n"
-            content += f"Fecha: {conv.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n"
-            content += f"{'=' * 80}\n\n"
-
-            # Obtener mensajes de la conversación
-            messages = (
-                db.query(Message)
-                .filter(Message.conversation_id == conv.id)
-                .order_by(Message.created_at.asc())
-                .all()
-            )
-
-            if not messages:
-                content += "  (Sin mensajes)\n"
-            else:
-                for msg in messages:
-                    role = "Usuario" if msg.role == "user" else "Asistente"
-                    content += f"[{msg.created_at.strftime('%H:%M:%S')}] {role}:\n"
-                    # Convertir markdown a texto plano
-                    formatted_content = markdown_to_text(msg.content)
-                    content += f"{formatted_content}\n\n"
-                    content += f"{'-' * 80}\n\n"
-
     # Preparar respuesta
     filename = f"chat_{conversation_id if conversation_id else workspace_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
     return StreamingResponse(
-        iter([content]),
+        # Mensaje a mensaje, leyendo la BD en lotes
+        streaming_export.iter_chat_txt(
+            workspace_id, db_workspace.name, db_workspace.description, conversation_id
+        ),
         media_type="text/plain",
         headers={"Content-Disposition": f"attachment; filename={filename}"},
     )
@@ -1658,6 +1232,7 @@ def export_chat_txt(
 @router.get(
     "/workspaces/{workspace_id}/chat/export/pdf",
     summary="Exportar historial de chat a PDF",
+    responses={202: {"description": "PDF en generación: consultar status_url y repetir la request"}},
 )
 def export_chat_pdf(
     workspace_id: str,
@@ -1670,285 +1245,84 @@ def export_chat_pdf(
     Si se proporciona conversation_id, exporta solo esa conversación.
     Si no, exporta todas las conversaciones del workspace.
 
+    El PDF se genera en segundo plano y queda cacheado (core/chat_export.py):
+    - 200 con el archivo si ya existe para el estado actual del historial.
+    - 202 con {job_id, status, status_url} mientras se genera; cuando el
+      trabajo está "ready", repetir esta request devuelve el archivo.
+
     Requiere autenticación. Solo el owner puede exportar.
     """
-    import re
-    from io import BytesIO
-
-    from models.conversation import Conversation, Message
-    from reportlab.lib.colors import HexColor
-    from reportlab.lib.enums import TA_LEFT, TA_RIGHT
-    from reportlab.lib.pagesizes import letter
-    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
-    from reportlab.lib.units import inch
-    from reportlab.platypus import (
-        PageBreak,
-        Paragraph,
-        Preformatted,
-        SimpleDocTemplate,
-        Spacer,
-    )
-
-    def markdown_to_paragraphs(text: str, style, code_style):
-        """Convierte markdown a lista de elementos Platypus."""
-        elements = []
-        lines = text.split("\n")
-        i = 0
-
-        while i < len(lines):
-            line = lines[i]
-
-            # Code blocks
-            if line.strip().startswith("```"):
-                code_lines = []
-                i += 1
-                while i < len(lines) and not lines[i].strip().startswith("```"):
-                    code_lines.append(lines[i])
-                    i += 1
-                if code_lines:
-                    code_text = "\n".join(code_lines)
-                    elements.append(Preformatted(code_text, code_style))
-                    elements.append(Spacer(1, 0.1 * inch))
-                i += 1
-                continue
-
-            # Process inline markdown
-            processed_line = line
-
-            # Bold
-            processed_line = re.sub(r"\*\*(.+?)\*\*", r"<b>\1</b>", processed_line)
-            processed_line = re.sub(r"__(.+?)__", r"<b>\1</b>", processed_line)
-
-            # Italic
-            processed_line = re.sub(r"\*(.+?)\*", r"<i>\1</i>", processed_line)
-            processed_line = re.sub(r"_(.+?)_", r"<i>\1</i>", processed_line)
-
-            # Inline code
-            processed_line = re.sub(
-                r"`(.+?)`",
-                r'<font name="Courier" backColor="#f0f0f0">\1</font>',
-                processed_line,
-            )
-
-            # Links (simplificado)
-            processed_line = re.sub(
-                r"\[([^\]]+)\]\([^\)]+\)", r"<u>\1</u>", processed_line
-            )
-
-            # Headers (h1-h6)
-            header_match = re.match(r"^(#{1,6})\s+(.+)$", processed_line)
-            if header_match:
-                level = len(header_match.group(1))
-                text = header_match.group(2)
-                size = max(12, 18 - level * 2)
-                elements.append(
-                    Paragraph(f'<font size="{size}"><b>{text}</b></font>', style)
-                )
-                elements.append(Spacer(1, 0.1 * inch))
-                i += 1
-                continue
-
-            # Lists
-            if re.match(r"^[\*\-\+]\s+", processed_line):
-                text = re.sub(r"^[\*\-\+]\s+", "• ", processed_line)
-                elements.append(Paragraph(text, style))
-            elif re.match(r"^\d+\.\s+", processed_line):
-                elements.append(Paragraph(processed_line, style))
-            elif processed_line.strip():  # Regular paragraph
-                elements.append(Paragraph(processed_line, style))
-            else:  # Empty line
-                elements.append(Spacer(1, 0.05 * inch))
-
-            i += 1
-
-        return elements
-
-    # Verificar que el workspace existe
-    db_workspace = (
-        db.query(workspace_model.Workspace)
-        .filter(workspace_model.Workspace.id == workspace_id)
-        .first()
-    )
-
-    if not db_workspace:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Workspace con id {workspace_id} no encontrado.",
-        )
-
-    # Verificar ownership
-    if db_workspace.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="No tienes permiso para exportar desde este workspace.",
-        )
-
-    # Crear buffer para el PDF
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=letter,
-        rightMargin=72,
-        leftMargin=72,
-        topMargin=72,
-        bottomMargin=18,
-    )
-
-    # Estilos
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        "CustomTitle",
-        parent=styles["Heading1"],
-        fontSize=18,
-        textColor=HexColor("#1a1a1a"),
-        spaceAfter=30,
-    )
-
-    subtitle_style = ParagraphStyle(
-        "CustomSubtitle",
-        parent=styles["Heading2"],
-        fontSize=14,
-        textColor=HexColor("#333333"),
-        spaceAfter=12,
-    )
-
-    user_style = ParagraphStyle(
-        "UserMessage",
-        parent=styles["Normal"],
-        fontSize=11,
-        textColor=HexColor("#0066cc"),
-        alignment=TA_RIGHT,
-        spaceAfter=8,
-        leftIndent=100,
-    )
-
-    assistant_style = ParagraphStyle(
-        "AssistantMessage",
-        parent=styles["Normal"],
-        fontSize=11,
-        textColor=HexColor("#333333"),
-        spaceAfter=8,
-        rightIndent=100,
-    )
-
-    timestamp_style = ParagraphStyle(
-        "Timestamp",
-        parent=styles["Normal"],
-        fontSize=8,
-        textColor=HexColor("#666666"),
-        spaceAfter=4,
-    )
-
-    code_style = ParagraphStyle(
-        "CodeBlock",
-        parent=styles["Code"],
-        fontSize=9,
-        textColor=HexColor("#000000"),
-        backColor=HexColor("#f5f5f5"),
-        leftIndent=20,
-        rightIndent=20,
-        spaceAfter=10,
-        fontName="Courier",
-    )
-
-    # Contenido del PDF
-    story = []
-
-    # Título
-    story.append(Paragraph(f"Chat Export - {db_workspace.name}", title_style))
-    story.append(
-        Paragraph(
-            f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles["Normal"]
-        )
-    )
-    story.append(Spacer(1, 0.3 * inch))
-
-    # Obtener conversaciones
+    # Verificar workspace y ownership (y la conversación, si se indicó, en la misma consulta)
     if conversation_id:
-        conversations = (
-            db.query(Conversation)
-            .filter(
-                Conversation.id == conversation_id,
-                Conversation.workspace_id == workspace_id,
-            )
-            .all()
+        get_owned_conversation(
+            db, workspace_id, conversation_id, current_user,
+            forbidden_detail="No tienes permiso para exportar desde este workspace.",
+            not_found_detail=f"Conversación {conversation_id} no encontrada.",
         )
-        if not conversations:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Conversación {conversation_id} no encontrada.",
-            )
     else:
-        conversations = (
-            db.query(Conversation)
-            .filter(Conversation.workspace_id == workspace_id)
-            .order_by(Conversation.created_at.desc())
-            .all()
+        get_owned_workspace(
+            db, workspace_id, current_user,
+            forbidden_detail="No tienes permiso para exportar desde este workspace.",
         )
 
-    if not conversations:
-        story.append(
-            Paragraph("No hay conversaciones en este workspace.", styles["Normal"])
-        )
-    else:
-        for idx, conv in enumerate(conversations):
-            if idx > 0:
-                story.append(PageBreak())
-
-            story.append(Paragraph(f"Conversación: {conv.title}", subtitle_style))
-            story.append(
-                Paragraph(
-                    f"Creada: {conv.created_at.strftime('%Y-%m-%d %H:%M:%S')}",
-                    timestamp_style,
-                )
+    key = chat_export.artifact_key(db, workspace_id, conversation_id)
+    job = chat_export.get_job(key)
+
+    if job and job["status"] == chat_export.READY:
+        artifact = chat_export.open_artifact(job)
+        if artifact is not None:
+            filename = f"chat_{conversation_id if conversation_id else workspace_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+            if isinstance(artifact, str):
+                return FileResponse(artifact, media_type="application/pdf", filename=filename)
+            return StreamingResponse(
+                artifact,
+                media_type="application/pdf",
+                headers={"Content-Disposition": f"attachment; filename={filename}"},
             )
-            story.append(Spacer(1, 0.2 * inch))
-
-            # Obtener mensajes
-            messages = (
-                db.query(Message)
-                .filter(Message.conversation_id == conv.id)
-                .order_by(Message.created_at.asc())
-                .all()
+        # El archivo expiró o se borró: regenerar
+        job = None
+
+    if job is None or job["status"] == chat_export.FAILED:
+        chat_export.clear_job(key)
+        if chat_export.start_job(key, workspace_id):
+            celery_app.send_task(
+                "processing.tasks.export_chat_pdf", args=[workspace_id, conversation_id, key]
             )
 
-            if not messages:
-                story.append(Paragraph("(Sin mensajes)", styles["Italic"]))
-            else:
-                for msg in messages:
-                    # Timestamp
-                    story.append(
-                        Paragraph(
-                            f"{msg.created_at.strftime('%H:%M:%S')}", timestamp_style
-                        )
-                    )
-
-                    # Mensaje con formato markdown
-                    if msg.role == "user":
-                        story.append(Paragraph(f"<b>Usuario:</b>", user_style))
-                        # Usuario: texto simple
-                        story.append(Paragraph(msg.content, user_style))
-                    else:
-                        story.append(Paragraph(f"<b>Asistente:</b>", assistant_style))
-                        # Asistente: parsear markdown
-                        markdown_elements = markdown_to_paragraphs(
-                            msg.content, assistant_style, code_style
-                        )
-                        story.extend(markdown_elements)
-
-                    story.append(Spacer(1, 0.15 * inch))
-
-    # Construir PDF
-    doc.build(story)
-    buffer.seek(0)
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={
+            "job_id": key,
+            "status": chat_export.PENDING,
+            "status_url": f"/api/v1/workspaces/{workspace_id}/chat/export/pdf/jobs/{key}",
+        },
+    )
 
-    # Preparar respuesta
-    filename = f"chat_{conversation_id if conversation_id else workspace_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={filename}"},
+
+@router.get(
+    "/workspaces/{workspace_id}/chat/export/pdf/jobs/{job_id}",
+    summary="Estado de una exportación de chat a PDF",
+)
+def get_chat_pdf_export_job(
+    workspace_id: str,
+    job_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(database.get_db),
+):
+    """
+    Estado del trabajo de exportación: pending, ready o failed.
+    Con "ready", GET /chat/export/pdf (mismos parámetros) devuelve el archivo.
+    """
+    get_owned_workspace(
+        db, workspace_id, current_user,
+        forbidden_detail="No tienes permiso para exportar desde este workspace.",
     )
+    job = chat_export.get_job(job_id)
+    # Sin workspace_id (registro reconstruido desde el archivo local) no se
+    # puede verificar a quién pertenece: 404, el cliente vuelve a pedir el export
+    if not job or job.get("workspace_id") != workspace_id:
+        raise HTTPException(status_code=404, detail="Exportación no encontrada.")
+    return {"job_id": job_id, "status": job["status"], "error": job.get("error")}
 
 
 @router.get("/cache/stats", summary="Obtener estadísticas del cache TIVIT")
@@ -1,10 +1,12 @@
 import json
 from typing import Dict, Any, Optional
-from fastapi import UploadFile, HTTPException, requests, status, File
+from fastapi import UploadFile, HTTPException, status, File
 from api.service.proposals_service import ProposalsService
 from prompts.proposals.analyze_prompts import AnalyzePrompts
 from utils.file_util import FileUtil
 from core import llm_service
+from core.llm_router import TaskType
+from core.tivit_vectors import get_tivit_vectors
 import logging
 
 logger = logging.getLogger(__name__)
@@ -21,7 +23,9 @@ class ProposalsServiceImpl(ProposalsService):
                 # Validar y extraer texto soportando PDF o DOCX
                 document_text = await FileUtil.extract_text(file)
                 prompt = AnalyzePrompts.create_analysis_JSON_prompt(document_text = document_text, max_length=8000)
-                return self._analyze_with_ia(prompt)
+                analysis = self._analyze_with_ia(prompt)
+                self._attach_tivit_profiles(analysis)
+                return analysis
             except HTTPException:
                 raise
             except Exception as e:
@@ -39,22 +43,10 @@ class ProposalsServiceImpl(ProposalsService):
     ):
         try:
             prompt = AnalyzePrompts.create_markdown_analysis_prompt()
-            full_prompt = f"""
-                prompt : {prompt}
-                pregunta: {query}
-                system_instructions: {workspace_instructions}
-            """
-
-            response = self._analyze_with_ia_stream(full_prompt, relevant_chunks)
-            
-            #response_text = json.dumps(response, ensure_ascii=False, indent=2)
-            #nuevos_skills = self._consume_api(response_text)
-
-            #if "equipo_sugerido" in response:
-                #for miembro in response["equipo_sugerido"]:
-                   # if "skills" in miembro and isinstance(miembro["skills"], list):
-                       # miembro["skills"].extend(nuevos_skills)
+            # Prefijo estable (cacheable por el proveedor); la pregunta va al final
+            system_prompt = llm_service.build_system_prompt(prompt, workspace_instructions)
 
+            response = self._analyze_with_ia_stream(query, relevant_chunks, system_prompt)
             return response
         except Exception as e:
             logger.error(f"Error al analizar RFP: {str(e)}")
@@ -64,10 +56,10 @@ class ProposalsServiceImpl(ProposalsService):
             )
             
 
-    def _analyze_with_ia_stream(self, prompt: str, relevant_chunks: Dict[str, Any]) -> Dict[str, Any]: 
+    def _analyze_with_ia_stream(self, query: str, relevant_chunks: Dict[str, Any], system_prompt: str = None) -> Dict[str, Any]: 
         """Método auxiliar y privado para la lógica del LLM y el parseo."""
         try:
-            response =  llm_service.generate_response_stream(query=prompt, context_chunks=relevant_chunks, model_override="") 
+            response =  llm_service.generate_response_stream(query=query, context_chunks=relevant_chunks, model_override="", system_prompt=system_prompt, task_type=TaskType.CREATE) 
             logger.info(response)
             return response
         except Exception as e:
@@ -108,32 +100,29 @@ class ProposalsServiceImpl(ProposalsService):
             response_text = response_text[:-3]
         return response_text.strip()
     
-    def _consume_api(self, response: str) -> list[str]:
-        external_url = "http://localhost:8095/recomendations/recommend"
-        payload = {
-            "requirement": response,
-            "limit": 3,
-            "umbral": 2
-        }
-
-        try:
-            api_result = requests.post(external_url, json=payload)
-            api_result.raise_for_status()
+    def _attach_tivit_profiles(self, analysis: Dict[str, Any], limit: int = 3) -> None:
+        """
+        Agrega a cada miembro de `equipo_sugerido` los perfiles TIVIT más
+        parecidos a su rol y skills (búsqueda vectorial en proceso, una sola
+        consulta por lotes para todo el equipo).
+        """
+        equipo = analysis.get("equipo_sugerido") if isinstance(analysis, dict) else None
+        if not isinstance(equipo, list) or not equipo:
+            return
 
-            trabajadores = api_result.json() 
-            textos = []
-
-            for t in trabajadores:
-                if isinstance(t, dict):
-                    texto = "\n".join([
-                        f"{k}: {v}" for k, v in t.items()
-                    ])
-                    textos.append(texto)
-                else:
-                    textos.append(str(t))
-
-            return textos
+        miembros = [m for m in equipo if isinstance(m, dict)]
+        requirements = []
+        for miembro in miembros:
+            skills = miembro.get("skills") if isinstance(miembro.get("skills"), list) else []
+            requirements.append(" ".join(
+                str(part) for part in [miembro.get("nombre", ""), miembro.get("rol", ""), *skills]
+            ))
 
+        try:
+            matches = get_tivit_vectors().search(requirements, k=limit, tipo="trabajador", min_score=0.05)
         except Exception as e:
-            logger.error(f"Error consumiendo API externa: {str(e)}")
-            return []
\ No newline at end of file
+            logger.error(f"Error buscando perfiles TIVIT: {str(e)}")
+            return
+
+        for miembro, perfiles in zip(miembros, matches):
+            miembro["perfiles_tivit"] = [p.to_dict() for p in perfiles]
@@ -0,0 +1,239 @@
+"""
+Extracción estructurada del análisis de documentos (suggestion_full).
+
+El texto del análisis se parsea una sola vez, cuando se guarda, y el resultado
+queda en analysis_items (requisitos y fechas límite). Los endpoints de
+/compliance y /deadlines consultan esas filas por índice en lugar de cargar y
+recorrer con regex todo el texto de todos los documentos en cada request.
+
+- Eventos del mapper de Document: al insertar/actualizar suggestion_full se
+  reemplazan los items del documento en la misma transacción.
+- `ensure_extracted` procesa los documentos que aún no tienen items de la
+  versión actual del extractor (datos previos o cambio de EXTRACTOR_VERSION),
+  de modo que no hace falta un backfill aparte. Se serializa por workspace
+  (bloqueo de su fila) para que las requests concurrentes no choquen.
+"""
+import logging
+import re
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, event, insert, inspect, or_, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from models.analysis_item import AnalysisItem
+from models.document import Document
+from models.workspace import Workspace
+
+logger = logging.getLogger(__name__)
+
+# Subir al cambiar las reglas de extracción: los documentos se re-procesan solos
+EXTRACTOR_VERSION = 1
+
+REQUIREMENT = "requirement"
+DEADLINE = "deadline"
+
+MAX_ASSUMPTIONS = 5
+REQUIREMENT_MAX_CHARS = 100
+DESCRIPTION_MAX_CHARS = 150
+CONTEXT_CHARS = 100
+
+items_table = AnalysisItem.__table__
+documents_table = Document.__table__
+workspaces_table = Workspace.__table__
+
+# Backfill concurrente: intentos ante deadlock (1213) / lock wait timeout (1205)
+BACKFILL_ATTEMPTS = 3
+_LOCK_CONFLICT_CODES = {1205, 1213}
+
+_CRITICAL_RE = re.compile(r'🔴.*?\n.*?❓\s*(.+?)\n', re.DOTALL)
+_IMPORTANT_RE = re.compile(r'🟡.*?\n.*?❓\s*(.+?)\n', re.DOTALL)
+_ASSUMPTION_RE = re.compile(r'📝\s*SUPUESTO.*?\n.*?Tema:\s*(.+?)\n', re.DOTALL)
+
+MONTHS_ES = {
+    'enero': 1, 'febrero': 2, 'marzo': 3, 'abril': 4,
+    'mayo': 5, 'junio': 6, 'julio': 7, 'agosto': 8,
+    'septiembre': 9, 'octubre': 10, 'noviembre': 11, 'diciembre': 12
+}
+
+# (regex, función que devuelve (año, mes, día) a partir del match)
+_DATE_PATTERNS = [
+    # "31 de diciembre de 2024", "15 de enero del 2025"
+    (
+        re.compile(
+            r'(\d{1,2})\s+de\s+(enero|febrero|marzo|abril|mayo|junio|julio|agosto|septiembre|octubre|noviembre|diciembre)\s+(?:de|del)\s+(\d{4})',
+            re.IGNORECASE,
+        ),
+        lambda m: (int(m.group(3)), MONTHS_ES.get(m.group(2).lower(), 1), int(m.group(1))),
+    ),
+    # "2024-12-31", "2025-01-15"
+    (re.compile(r'(\d{4})-(\d{2})-(\d{2})'), lambda m: (int(m.group(1)), int(m.group(2)), int(m.group(3)))),
+    # "31/12/2024", "15/01/2025"
+    (re.compile(r'(\d{1,2})/(\d{1,2})/(\d{4})'), lambda m: (int(m.group(3)), int(m.group(2)), int(m.group(1)))),
+]
+
+
+# ----------------------------------------------------------------------
+# Parsing
+# ----------------------------------------------------------------------
+def extract_requirements(text: str) -> List[Dict]:
+    """Preguntas críticas (pending), importantes (partial) y supuestos (completed)."""
+    items = []
+    if "PREGUNTAS CRÍTICAS" in text:
+        critical_section = text.split("PREGUNTAS CRÍTICAS")[1]
+        if "SUPUESTOS RECOMENDADOS" in critical_section:
+            critical_section = critical_section.split("SUPUESTOS RECOMENDADOS")[0]
+        for question in _CRITICAL_RE.findall(critical_section):
+            items.append({"status": "pending", "priority": "high", "text": question.strip()[:REQUIREMENT_MAX_CHARS]})
+        for question in _IMPORTANT_RE.findall(critical_section):
+            items.append({"status": "partial", "priority": "medium", "text": question.strip()[:REQUIREMENT_MAX_CHARS]})
+
+    if "SUPUESTOS RECOMENDADOS" in text:
+        assumptions_section = text.split("SUPUESTOS RECOMENDADOS")[1]
+        for assumption in _ASSUMPTION_RE.findall(assumptions_section)[:MAX_ASSUMPTIONS]:
+            items.append({"status": "completed", "priority": "low", "text": assumption.strip()[:REQUIREMENT_MAX_CHARS]})
+    return items
+
+
+def _deadline_title(context: str, file_name: str) -> str:
+    context = context.lower()
+    if "presentación" in context:
+        return "Presentación de propuesta"
+    if "entrega" in context:
+        return "Entrega de documentos"
+    if "cierre" in context:
+        return "Cierre de RFP"
+    return f"Fecha límite - {file_name}"[:255]
+
+
+def extract_deadlines(text: str, file_name: str) -> List[Dict]:
+    """Fechas límite del texto (una por fecha: la primera aparición) con título y contexto."""
+    deadlines = []
+    seen = set()
+    for pattern, to_date in _DATE_PATTERNS:
+        for match in pattern.finditer(text):
+            try:
+                due_date = datetime(*to_date(match))
+            except ValueError as e:
+                logger.debug(f"Error parseando fecha en {file_name}: {e}")
+                continue
+            if due_date in seen:
+                continue
+            seen.add(due_date)
+            start_idx = max(0, match.start() - CONTEXT_CHARS)
+            end_idx = min(len(text), match.end() + CONTEXT_CHARS)
+            context = text[start_idx:end_idx].replace('\n', ' ').strip()
+            deadlines.append({
+                "due_date": due_date,
+                "title": _deadline_title(context, file_name),
+                "text": context[:DESCRIPTION_MAX_CHARS],
+            })
+    return deadlines
+
+
+def build_rows(document_id: str, workspace_id: str, file_name: str, text: Optional[str]) -> List[Dict]:
+    """Filas de analysis_items para un análisis."""
+    if not text:
+        return []
+    rows = []
+    for position, item in enumerate(extract_requirements(text)):
+        rows.append(dict(item, document_id=document_id, workspace_id=workspace_id,
+                         kind=REQUIREMENT, position=position, title=None, due_date=None))
+    for position, item in enumerate(extract_deadlines(text, file_name)):
+        rows.append(dict(item, document_id=document_id, workspace_id=workspace_id,
+                         kind=DEADLINE, position=position, status=None, priority=None))
+    return rows
+
+
+def replace_items(connection, document_id: str, workspace_id: str, file_name: str, text: Optional[str]) -> int:
+    """Reemplaza los items de un documento (en la transacción de `connection`)."""
+    connection.execute(delete(items_table).where(items_table.c.document_id == document_id))
+    rows = build_rows(document_id, workspace_id, file_name, text)
+    if rows:
+        connection.execute(insert(items_table), rows)
+    return len(rows)
+
+
+# ----------------------------------------------------------------------
+# Eventos: extraer al guardar el análisis
+# ----------------------------------------------------------------------
+def _analysis_changed(target) -> bool:
+    return inspect(target).attrs.suggestion_full.history.has_changes()
+
+
+def _mark_version(mapper, connection, target):
+    if _analysis_changed(target):
+        target.analysis_version = EXTRACTOR_VERSION if target.suggestion_full is not None else None
+
+
+def _write_items(mapper, connection, target):
+    if _analysis_changed(target):
+        replace_items(connection, target.id, target.workspace_id, target.file_name, target.suggestion_full)
+
+
+event.listen(Document, "before_insert", _mark_version)
+event.listen(Document, "before_update", _mark_version)
+event.listen(Document, "after_insert", _write_items)
+event.listen(Document, "after_update", _write_items)
+
+
+# ----------------------------------------------------------------------
+# Documentos sin extraer (datos previos / nueva versión del extractor)
+# ----------------------------------------------------------------------
+def _pending(db: Session, workspace_id: str):
+    return db.query(Document.id, Document.file_name, Document.suggestion_full).filter(
+        Document.workspace_id == workspace_id,
+        Document.suggestion_full.isnot(None),
+        or_(Document.analysis_version.is_(None), Document.analysis_version != EXTRACTOR_VERSION),
+    )
+
+
+def _is_lock_conflict(error: OperationalError) -> bool:
+    code = getattr(error.orig, "args", (None,))[0]
+    return code in _LOCK_CONFLICT_CODES
+
+
+def ensure_extracted(db: Session, workspace_id: str) -> int:
+    """
+    Extrae los análisis del workspace que no tienen items de la versión actual.
+    Tras la primera vez es una consulta que no devuelve filas.
+
+    /compliance y /deadlines se piden en paralelo desde el dashboard: el
+    backfill se serializa por workspace con SELECT ... FOR UPDATE sobre su fila
+    y los pendientes se vuelven a leer con lectura bloqueante (ve lo que ya
+    commiteó la otra request, que así no re-extrae nada). Si aun así MySQL
+    detecta un deadlock (p. ej. contra el worker guardando un análisis), se
+    reintenta.
+    """
+    if _pending(db, workspace_id).first() is None:
+        return 0
+
+    for attempt in range(1, BACKFILL_ATTEMPTS + 1):
+        try:
+            db.execute(
+                select(workspaces_table.c.id)
+                .where(workspaces_table.c.id == workspace_id)
+                .with_for_update()
+            )
+            pending = _pending(db, workspace_id).with_for_update().all()
+
+            connection = db.connection()
+            for document_id, file_name, text in pending:
+                replace_items(connection, document_id, workspace_id, file_name, text)
+                connection.execute(
+                    update(documents_table)
+                    .where(documents_table.c.id == document_id)
+                    .values(analysis_version=EXTRACTOR_VERSION)
+                )
+            db.commit()
+        except OperationalError as e:
+            db.rollback()
+            if attempt == BACKFILL_ATTEMPTS or not _is_lock_conflict(e):
+                raise
+            logger.warning(f"⚠️ Conflicto de bloqueo extrayendo análisis del workspace {workspace_id}, reintento {attempt}: {e}")
+            continue
+
+        if pending:
+            logger.info(f"Análisis extraído para {len(pending)} documento(s) del workspace {workspace_id}")
+        return len(pending)
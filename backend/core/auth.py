@@ -10,12 +10,14 @@ Este módulo proporciona funciones para:
 
 from datetime import datetime, timedelta
 from typing import Optional
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 from core.config import settings
+from core import tracing
+from core.user_cache import get_user_cache
 from models import database
 from models.user import User
 import logging
@@ -108,6 +110,24 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
+def build_token_claims(user: User) -> dict:
+    """
+    Claims del access token para un usuario.
+    
+    Con AUTH_TOKEN_USER_CLAIMS el token lleva también `user_id` y `active`:
+    get_current_user busca por clave primaria y rechaza tokens de usuarios
+    inactivos sin consultar la BD.
+    """
+    claims = {
+        "sub": user.email,
+        "first_name": user.full_name.split()[0] if user.full_name else "Usuario"
+    }
+    if settings.AUTH_TOKEN_USER_CLAIMS:
+        claims["user_id"] = user.id
+        claims["active"] = bool(user.is_active)
+    return claims
+
+
 def decode_access_token(token: str) -> Optional[dict]:
     """
     Decodifica y verifica un JWT token.
@@ -137,6 +157,7 @@ def decode_access_token(token: str) -> Optional[dict]:
 # ============================================================================
 
 def get_current_user(
+    request: Request,
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(database.get_db)
 ) -> User:
@@ -144,9 +165,12 @@ def get_current_user(
     Obtiene el usuario actual desde el JWT token.
     
     Esta función se usa como dependencia en endpoints protegidos.
-    Verifica el token, extrae el email, busca el usuario en la DB.
+    Verifica el token, extrae el email y resuelve el usuario desde el caché
+    por proceso (core/user_cache.py) o, si no está, desde la DB.
     
     Args:
+        request: Request actual (se anota `request.state.user_id` para
+            ReadYourWritesMiddleware)
         token: JWT token del header Authorization
         db: Sesión de base de datos
         
@@ -179,13 +203,36 @@ def get_current_user(
         logger.warning("Token sin email (sub)")
         raise credentials_exception
     
-    # Buscar usuario en la base de datos
-    user = db.query(User).filter(User.email == email).first()
+    # Token emitido para un usuario inactivo: rechazar sin ir a la BD
+    if payload.get("active") is False:
+        logger.warning(f"Token de usuario inactivo: {email}")
+        raise HTTPException(status_code=400, detail="Usuario inactivo")
+    
+    # Caché por proceso (invalidado vía Redis al modificar el usuario)
+    cache = get_user_cache()
+    snapshot = cache.get(email) if cache else None
+    if snapshot is not None:
+        user = cache.attach(snapshot, db)
+        request.state.user_id = user.id
+        return user
+    
+    # Buscar usuario en la base de datos (por PK si el token trae user_id)
+    with tracing.stage("auth.user_lookup"):
+        user_id = payload.get("user_id")
+        if user_id:
+            user = db.get(User, user_id)
+            if user is not None and user.email != email:
+                user = None
+        else:
+            user = db.query(User).filter(User.email == email).first()
     if user is None:
         logger.warning(f"Usuario no encontrado: {email}")
         raise credentials_exception
     
-    logger.info(f"Usuario autenticado: {user.email}")
+    if cache:
+        cache.set(email, user)
+    logger.debug(f"Usuario autenticado: {user.email}")
+    request.state.user_id = user.id
     return user
 
 
@@ -1,5 +1,7 @@
 from celery import Celery
+from celery.signals import task_postrun, task_prerun
 from .config import settings
+from . import db_instrumentation
 
 celery_app = Celery(
     "ia_worker",
@@ -15,5 +17,28 @@ celery_app.conf.update(
     enable_utc=True,
 )
 
+# Tareas periódicas (el worker se lanza con -B para ejecutar el scheduler)
+if settings.DASHBOARD_STATS_RECONCILE_SECONDS > 0:
+    celery_app.conf.beat_schedule = {
+        "reconcile-dashboard-stats": {
+            "task": "processing.tasks.reconcile_dashboard_stats",
+            "schedule": float(settings.DASHBOARD_STATS_RECONCILE_SECONDS),
+        },
+    }
+
+# Consultas lentas: etiquetadas con el nombre de la tarea en lugar de una ruta
+db_instrumentation.install()
+
+
+@task_prerun.connect
+def _label_task_queries(task=None, **kwargs):
+    db_instrumentation.set_route_label(f"task {task.name}" if task else None)
+
+
+@task_postrun.connect
+def _clear_task_label(**kwargs):
+    db_instrumentation.set_route_label(None)
+
+
 # Le dice a Celery que busque tareas en el módulo 'backend.processing.tasks'
 celery_app.autodiscover_tasks(['processing'])
\ No newline at end of file
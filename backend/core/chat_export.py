@@ -0,0 +1,466 @@
+"""
+Exportación del historial de chat a PDF en segundo plano.
+
+Antes el endpoint armaba en memoria, dentro de la request, el "story" de
+reportlab de todas las conversaciones del workspace: con workspaces grandes
+la request se cortaba por timeout y el worker se disparaba en RAM. Ahora:
+
+- El PDF se genera en una tarea de Celery (processing.tasks.export_chat_pdf).
+  Los mensajes se leen de la BD en lotes (stream_results) y el documento se
+  construye por partes de CHAT_EXPORT_PART_MESSAGES mensajes que se unen con
+  pypdf, así que el worker nunca tiene todo el historial en memoria.
+- El archivo resultante se cachea por clave = hash(workspace, conversaciones,
+  último mensaje, nº de mensajes). Mientras no cambie el historial, exportar
+  de nuevo devuelve el mismo archivo sin regenerarlo.
+- El estado de cada trabajo (pending / ready / failed) vive en Redis bajo la
+  misma clave, que es el job_id que se devuelve al cliente.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from core.config import settings
+from models.conversation import Conversation, Message
+from models.workspace import Workspace
+
+logger = logging.getLogger(__name__)
+
+# Subir al cambiar el formato del PDF: invalida los archivos cacheados
+EXPORT_FORMAT_VERSION = 1
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+EXPORT_DIR = Path(settings.CHAT_EXPORT_DIR)
+_REDIS_PREFIX = "chat_export:"
+
+_redis = None
+
+
+def _redis_client():
+    global _redis
+    if _redis is None:
+        import redis
+
+        _redis = redis.from_url(settings.REDIS_URL)
+    return _redis
+
+
+# ----------------------------------------------------------------------
+# Clave del artefacto y estado del trabajo
+# ----------------------------------------------------------------------
+def _conversations_query(db: Session, workspace_id: str, conversation_id: Optional[str]):
+    query = db.query(Conversation.id, Conversation.title, Conversation.created_at).filter(
+        Conversation.workspace_id == workspace_id
+    )
+    if conversation_id:
+        query = query.filter(Conversation.id == conversation_id)
+    return query.order_by(Conversation.created_at.desc(), Conversation.id)
+
+
+def artifact_key(db: Session, workspace_id: str, conversation_id: Optional[str] = None) -> str:
+    """
+    Clave del PDF para el estado actual del historial: cambia si se agrega o
+    borra un mensaje o una conversación, o si se renombra algo del encabezado.
+
+    El MessageWriter inserta la respuesta del asistente como borrador
+    (is_truncated) y luego actualiza su contenido en el mismo registro, sin
+    cambiar fecha ni conteo: por eso la clave incluye también cuántos mensajes
+    siguen truncados y el largo total del contenido.
+    """
+    workspace_name = db.query(Workspace.name).filter(Workspace.id == workspace_id).scalar()
+    conversations = _conversations_query(db, workspace_id, conversation_id).all()
+    ids = [conv.id for conv in conversations]
+    last_message, message_count, truncated_count, content_length = (None, 0, 0, 0)
+    if ids:
+        last_message, message_count, truncated_count, content_length = (
+            db.query(
+                func.max(Message.created_at),
+                func.count(Message.id),
+                func.sum(case((Message.is_truncated, 1), else_=0)),
+                func.sum(func.length(Message.content)),
+            )
+            .filter(Message.conversation_id.in_(ids))
+            .one()
+        )
+    payload = json.dumps(
+        [
+            EXPORT_FORMAT_VERSION,
+            workspace_id,
+            workspace_name,
+            conversation_id,
+            [(conv.id, conv.title) for conv in conversations],
+            last_message.isoformat() if last_message else None,
+            message_count,
+            int(truncated_count or 0),
+            int(content_length or 0),
+        ],
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def get_job(key: str) -> Optional[Dict]:
+    """Estado del trabajo: {"status", "workspace_id", "uri"?, "error"?} o None."""
+    try:
+        raw = _redis_client().get(_REDIS_PREFIX + key)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo leer el estado de la exportación {key}: {e}")
+        raw = None
+    if raw:
+        return json.loads(raw)
+    # Sin registro en Redis (expiró o Redis se reinició) pero el archivo local existe
+    path = EXPORT_DIR / f"{key}.pdf"
+    if path.exists():
+        return {"status": READY, "uri": str(path)}
+    return None
+
+
+def _set_job(key: str, job: Dict, ttl: int) -> None:
+    _redis_client().set(_REDIS_PREFIX + key, json.dumps(job), ex=ttl)
+
+
+def start_job(key: str, workspace_id: str) -> bool:
+    """
+    Marca el trabajo como pendiente. Devuelve False si ya había uno en curso
+    (SET NX): varias requests iguales comparten el mismo trabajo.
+    """
+    job = json.dumps({"status": PENDING, "workspace_id": workspace_id})
+    return bool(
+        _redis_client().set(
+            _REDIS_PREFIX + key, job, nx=True, ex=settings.CHAT_EXPORT_JOB_TIMEOUT_SECONDS
+        )
+    )
+
+
+def clear_job(key: str) -> None:
+    _redis_client().delete(_REDIS_PREFIX + key)
+
+
+# ----------------------------------------------------------------------
+# Render (reportlab por partes + pypdf)
+# ----------------------------------------------------------------------
+def _styles():
+    from reportlab.lib.colors import HexColor
+    from reportlab.lib.enums import TA_RIGHT
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+
+    styles = getSampleStyleSheet()
+    return {
+        "normal": styles["Normal"],
+        "italic": styles["Italic"],
+        "title": ParagraphStyle(
+            "CustomTitle",
+            parent=styles["Heading1"],
+            fontSize=18,
+            textColor=HexColor("#1a1a1a"),
+            spaceAfter=30,
+        ),
+        "subtitle": ParagraphStyle(
+            "CustomSubtitle",
+            parent=styles["Heading2"],
+            fontSize=14,
+            textColor=HexColor("#333333"),
+            spaceAfter=12,
+        ),
+        "user": ParagraphStyle(
+            "UserMessage",
+            parent=styles["Normal"],
+            fontSize=11,
+            textColor=HexColor("#0066cc"),
+            alignment=TA_RIGHT,
+            spaceAfter=8,
+            leftIndent=100,
+        ),
+        "assistant": ParagraphStyle(
+            "AssistantMessage",
+            parent=styles["Normal"],
+            fontSize=11,
+            textColor=HexColor("#333333"),
+            spaceAfter=8,
+            rightIndent=100,
+        ),
+        "timestamp": ParagraphStyle(
+            "Timestamp",
+            parent=styles["Normal"],
+            fontSize=8,
+            textColor=HexColor("#666666"),
+            spaceAfter=4,
+        ),
+        "code": ParagraphStyle(
+            "CodeBlock",
+            parent=styles["Code"],
+            fontSize=9,
+            textColor=HexColor("#000000"),
+            backColor=HexColor("#f5f5f5"),
+            leftIndent=20,
+            rightIndent=20,
+            spaceAfter=10,
+            fontName="Courier",
+        ),
+    }
+
+
+def markdown_to_paragraphs(text: str, style, code_style) -> List:
+    """Convierte markdown a lista de elementos Platypus."""
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, Preformatted, Spacer
+
+    elements = []
+    lines = text.split("\n")
+    i = 0
+
+    while i < len(lines):
+        line = lines[i]
+
+        # Code blocks
+        if line.strip().startswith("```"):
+            code_lines = []
+            i += 1
+            while i < len(lines) and not lines[i].strip().startswith("```"):
+                code_lines.append(lines[i])
+                i += 1
+            if code_lines:
+                code_text = "\n".join(code_lines)
+                elements.append(Preformatted(code_text, code_style))
+                elements.append(Spacer(1, 0.1 * inch))
+            i += 1
+            continue
+
+        # Process inline markdown
+        processed_line = line
+
+        # Bold
+        processed_line = re.sub(r"\*\*(.+?)\*\*", r"<b>\1</b>", processed_line)
+        processed_line = re.sub(r"__(.+?)__", r"<b>\1</b>", processed_line)
+
+        # Italic
+        processed_line = re.sub(r"\*(.+?)\*", r"<i>\1</i>", processed_line)
+        processed_line = re.sub(r"_(.+?)_", r"<i>\1</i>", processed_line)
+
+        # Inline code
+        processed_line = re.sub(
+            r"`(.+?)`",
+            r'<font name="Courier" backColor="#f0f0f0">\1</font>',
+            processed_line,
+        )
+
+        # Links (simplificado)
+        processed_line = re.sub(r"\[([^\]]+)\]\([^\)]+\)", r"<u>\1</u>", processed_line)
+
+        # Headers (h1-h6)
+        header_match = re.match(r"^(#{1,6})\s+(.+)$", processed_line)
+        if header_match:
+            level = len(header_match.group(1))
+            text = header_match.group(2)
+            size = max(12, 18 - level * 2)
+            elements.append(Paragraph(f'<font size="{size}"><b>{text}</b></font>', style))
+            elements.append(Spacer(1, 0.1 * inch))
+            i += 1
+            continue
+
+        # Lists
+        if re.match(r"^[\*\-\+]\s+", processed_line):
+            text = re.sub(r"^[\*\-\+]\s+", "• ", processed_line)
+            elements.append(Paragraph(text, style))
+        elif re.match(r"^\d+\.\s+", processed_line):
+            elements.append(Paragraph(processed_line, style))
+        elif processed_line.strip():  # Regular paragraph
+            elements.append(Paragraph(processed_line, style))
+        else:  # Empty line
+            elements.append(Spacer(1, 0.05 * inch))
+
+        i += 1
+
+    return elements
+
+
+class _PartWriter:
+    """Construye el PDF por partes en archivos temporales y las une al final."""
+
+    def __init__(self, work_dir: str):
+        self.work_dir = work_dir
+        self.parts: List[str] = []
+        self.story: List = []
+        self.messages = 0
+
+    def flush(self) -> None:
+        from reportlab.lib.pagesizes import letter
+        from reportlab.platypus import SimpleDocTemplate
+
+        if not self.story:
+            return
+        path = os.path.join(self.work_dir, f"part_{len(self.parts):05d}.pdf")
+        doc = SimpleDocTemplate(
+            path,
+            pagesize=letter,
+            rightMargin=72,
+            leftMargin=72,
+            topMargin=72,
+            bottomMargin=18,
+        )
+        doc.build(self.story)
+        self.parts.append(path)
+        self.story = []
+        self.messages = 0
+
+    def merge(self, output_path: str) -> None:
+        from pypdf import PdfWriter
+
+        self.flush()
+        writer = PdfWriter()
+        for part in self.parts:
+            writer.append(part)
+        with open(output_path, "wb") as output:
+            writer.write(output)
+        writer.close()
+
+
+def render_pdf(db: Session, workspace_id: str, conversation_id: Optional[str], output_path: str) -> int:
+    """Escribe el PDF del historial en `output_path`. Devuelve el número de mensajes."""
+    from reportlab.lib.units import inch
+    from reportlab.platypus import PageBreak, Paragraph, Spacer
+
+    styles = _styles()
+    workspace_name = db.query(Workspace.name).filter(Workspace.id == workspace_id).scalar()
+    total = 0
+
+    with tempfile.TemporaryDirectory(prefix="chat_export_") as work_dir:
+        writer = _PartWriter(work_dir)
+
+        # Título
+        writer.story.append(Paragraph(f"Chat Export - {workspace_name}", styles["title"]))
+        writer.story.append(
+            Paragraph(f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles["normal"])
+        )
+        writer.story.append(Spacer(1, 0.3 * inch))
+
+        conversations = _conversations_query(db, workspace_id, conversation_id).all()
+        if not conversations:
+            writer.story.append(Paragraph("No hay conversaciones en este workspace.", styles["normal"]))
+
+        for idx, conv in enumerate(conversations):
+            if idx > 0:
+                writer.story.append(PageBreak())
+            writer.story.append(Paragraph(f"Conversación: {conv.title}", styles["subtitle"]))
+            writer.story.append(
+                Paragraph(f"Creada: {conv.created_at.strftime('%Y-%m-%d %H:%M:%S')}", styles["timestamp"])
+            )
+            writer.story.append(Spacer(1, 0.2 * inch))
+
+            # Mensajes en lotes (cursor del lado del servidor)
+            messages = (
+                db.query(Message.role, Message.content, Message.created_at)
+                .filter(Message.conversation_id == conv.id)
+                .order_by(Message.created_at.asc(), Message.id.asc())
+                .execution_options(stream_results=True, yield_per=settings.CHAT_EXPORT_BATCH_SIZE)
+            )
+            empty = True
+            for msg in messages:
+                empty = False
+                total += 1
+                if writer.messages >= settings.CHAT_EXPORT_PART_MESSAGES:
+                    # Parte llena: se escribe a disco y la conversación continúa en la siguiente
+                    writer.flush()
+                    writer.story.append(
+                        Paragraph(f"Conversación: {conv.title} (continuación)", styles["subtitle"])
+                    )
+
+                # Timestamp
+                writer.story.append(Paragraph(f"{msg.created_at.strftime('%H:%M:%S')}", styles["timestamp"]))
+
+                # Mensaje con formato markdown
+                if msg.role == "user":
+                    writer.story.append(Paragraph("<b>Usuario:</b>", styles["user"]))
+                    # Usuario: texto simple
+                    writer.story.append(Paragraph(msg.content, styles["user"]))
+                else:
+                    writer.story.append(Paragraph("<b>Asistente:</b>", styles["assistant"]))
+                    # Asistente: parsear markdown
+                    writer.story.extend(
+                        markdown_to_paragraphs(msg.content, styles["assistant"], styles["code"])
+                    )
+
+                writer.story.append(Spacer(1, 0.15 * inch))
+                writer.messages += 1
+
+            if empty:
+                writer.story.append(Paragraph("(Sin mensajes)", styles["italic"]))
+
+        writer.merge(output_path)
+    return total
+
+
+# ----------------------------------------------------------------------
+# Trabajo completo (se ejecuta en el worker)
+# ----------------------------------------------------------------------
+def build_artifact(db: Session, workspace_id: str, conversation_id: Optional[str], key: str) -> Dict:
+    """Genera el PDF, lo guarda (GCS o disco local) y marca el trabajo como listo."""
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    path = EXPORT_DIR / f"{key}.pdf"
+    tmp_path = EXPORT_DIR / f"{key}.pdf.tmp"
+    started = time.perf_counter()
+    try:
+        total = render_pdf(db, workspace_id, conversation_id, str(tmp_path))
+        os.replace(tmp_path, path)
+    except Exception as e:
+        tmp_path.unlink(missing_ok=True)
+        _set_job(key, {"status": FAILED, "workspace_id": workspace_id, "error": str(e)},
+                 settings.CHAT_EXPORT_JOB_TIMEOUT_SECONDS)
+        raise
+
+    uri = str(path)
+    if settings.GCS_BUCKET_NAME:
+        from core.gcp_services import gcp_services
+
+        with open(path, "rb") as pdf_file:
+            gcs_uri = gcp_services.upload_file(pdf_file, f"exports/{key}.pdf")
+        if gcs_uri:
+            uri = gcs_uri
+            path.unlink(missing_ok=True)
+
+    job = {"status": READY, "workspace_id": workspace_id, "uri": uri}
+    _set_job(key, job, settings.CHAT_EXPORT_TTL_SECONDS)
+    logger.info(
+        f"📄 Export PDF {key} listo: {total} mensajes en {time.perf_counter() - started:.1f}s ({uri})"
+    )
+    cleanup_expired()
+    return job
+
+
+def cleanup_expired() -> int:
+    """Borra los PDFs locales más viejos que CHAT_EXPORT_TTL_SECONDS."""
+    if not EXPORT_DIR.exists():
+        return 0
+    cutoff = time.time() - settings.CHAT_EXPORT_TTL_SECONDS
+    removed = 0
+    for path in EXPORT_DIR.glob("*.pdf"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+def open_artifact(job: Dict):
+    """Archivo del trabajo listo: ruta local (str) o stream de GCS; None si ya no existe."""
+    uri = job.get("uri") or ""
+    if uri.startswith("gs://"):
+        from core.gcp_services import gcp_services
+
+        blob_name = uri[len("gs://"):].split("/", 1)[1]
+        return gcp_services.open_file_stream(blob_name)
+    return uri if uri and os.path.exists(uri) else None
@@ -7,7 +7,7 @@ import os
 import secrets
 from pydantic_settings import BaseSettings
 from pydantic import Field
-from typing import Optional
+from typing import Dict, List, Optional
 
 
 class Settings(BaseSettings):
@@ -17,6 +17,18 @@ class Settings(BaseSettings):
     # DATABASE
     # ========================================================================
     DATABASE_URL: str = "mysql+pymysql://user:password@ia_mysql:3306/caso01_db"
+    # Motor async para las rutas `async def` (vacío = DATABASE_URL con el driver aiomysql)
+    DATABASE_ASYNC_URL: str = ""
+    DATABASE_POOL_SIZE: int = 20
+    DATABASE_MAX_OVERFLOW: int = 10
+    DATABASE_ASYNC_POOL_SIZE: int = 20
+    DATABASE_ASYNC_MAX_OVERFLOW: int = 10
+    # Réplica de lectura opcional para GETs (vacío = todo va al primario)
+    DATABASE_REPLICA_URL: str = ""
+    DATABASE_REPLICA_POOL_SIZE: int = 20
+    DATABASE_REPLICA_MAX_OVERFLOW: int = 10
+    # Tras una escritura, las lecturas del usuario van al primario durante este tiempo
+    DATABASE_READ_YOUR_WRITES_SECONDS: int = 5
 
     # ========================================================================
     # REDIS
@@ -27,6 +39,15 @@ class Settings(BaseSettings):
     REDIS_PASSWORD: Optional[str] = None
     REDIS_URL: str = "redis://ia_redis:6379/0"
 
+    # ========================================================================
+    # CACHÉ LLM
+    # ========================================================================
+    LLM_CACHE_TTL_SECONDS: int = 3600
+    LLM_CACHE_LOCAL_MAX_MB: int = 32  # Nivel en memoria por proceso (0 = desactivado)
+    LLM_CACHE_LOCAL_TTL_SECONDS: int = 60  # Acota lo desactualizado entre workers tras invalidar
+    LLM_CACHE_COMPRESS_MIN_BYTES: int = 1024
+    LLM_CACHE_LOCK_TIMEOUT_SECONDS: int = 60  # Espera máxima de requests idénticas concurrentes
+
     # ========================================================================
     # QDRANT
     # ========================================================================
@@ -42,6 +63,11 @@ class Settings(BaseSettings):
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", secrets.token_urlsafe(32))
     JWT_ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 43200  # 30 días
+    # Usuario autenticado cacheado por proceso (0 = consultar la BD en cada request)
+    AUTH_USER_CACHE_TTL_SECONDS: int = 30
+    # Incluir user_id y estado activo en los claims del token (lookup por PK y
+    # rechazo de tokens de usuarios inactivos sin ir a la BD)
+    AUTH_TOKEN_USER_CLAIMS: bool = True
 
     # ========================================================================
     # GCP SERVICES (NUEVO)
@@ -79,6 +105,78 @@ class Settings(BaseSettings):
     LLM_PROVIDER: str = "gemini"  # gemini, openai, vertex
     MULTI_LLM_ENABLED: bool = True
 
+    # Routing / failover entre proveedores
+    LLM_TTFT_DEADLINE_SECONDS: float = 15.0  # Sin primer token en este tiempo -> siguiente proveedor
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 3  # Fallos consecutivos para abrir el circuito
+    LLM_CIRCUIT_COOLDOWN_SECONDS: float = 30.0  # Tiempo que un proveedor queda fuera de rotación
+    LLM_HEALTH_EWMA_ALPHA: float = 0.2  # Peso de la última muestra en latencia/error rate
+    # Cadena de proveedores por tipo de tarea, ej: {"create": ["openai_gpt4o_mini", "gemini_flash"]}
+    LLM_TASK_ROUTING: Dict[str, List[str]] = {}
+
+    # ========================================================================
+    # CHAT MEMORY (resumen incremental de conversaciones)
+    # ========================================================================
+    CHAT_SUMMARY_ENABLED: bool = True
+    CHAT_HISTORY_RECENT_MESSAGES: int = 4  # Últimos 2 turnos en crudo
+    CHAT_SUMMARY_MAX_CHARS: int = 4000
+    CHAT_SUMMARY_MESSAGE_MAX_CHARS: int = 3000  # Recorte por mensaje al resumir
+    # Mensajes por página cuando el cliente pagina (?limit= / ?before=); sin ellos, todos
+    CHAT_MESSAGES_PAGE_SIZE: int = 50
+    CHAT_MESSAGES_MAX_PAGE_SIZE: int = 200
+
+    # ========================================================================
+    # MESSAGE WRITER (persistencia write-behind de mensajes del chat)
+    # ========================================================================
+    MESSAGE_WRITER_ENABLED: bool = True  # False = escribir cada mensaje al momento
+    MESSAGE_WRITER_QUEUE_SIZE: int = 1000  # Escrituras pendientes por proceso (backpressure)
+    MESSAGE_WRITER_BATCH_SIZE: int = 100
+    MESSAGE_WRITER_FLUSH_MS: int = 50  # Espera máxima para juntar un lote
+    MESSAGE_WRITER_MAX_RETRIES: int = 3
+    MESSAGE_CHECKPOINT_SECONDS: float = 5.0  # Guardado parcial de la respuesta en streaming (0 = off)
+
+    # ========================================================================
+    # EXPORTACIONES (CSV/TXT en streaming; PDF en tarea de Celery + cacheado)
+    # ========================================================================
+    EXPORT_BATCH_SIZE: int = 500  # Filas por lote leído de la BD en CSV/TXT
+    EXPORT_STREAM_CHUNK_BYTES: int = 65536  # Tamaño de cada bloque enviado al cliente
+    CHAT_EXPORT_DIR: str = "uploaded_files/exports"  # Sin GCS: debe ser un volumen compartido backend/worker
+    CHAT_EXPORT_BATCH_SIZE: int = 500  # Mensajes por lote leído de la BD
+    CHAT_EXPORT_PART_MESSAGES: int = 1000  # Mensajes por parte del PDF antes de escribir a disco
+    CHAT_EXPORT_TTL_SECONDS: int = 86400  # Vida del archivo cacheado
+    CHAT_EXPORT_JOB_TIMEOUT_SECONDS: int = 900  # Un trabajo "pending" más viejo se relanza
+
+    # ========================================================================
+    # STREAMING LLM
+    # ========================================================================
+    STREAM_DISCONNECT_CHECK_INTERVAL: float = 0.5  # Segundos entre chequeos de desconexión
+    STREAM_COALESCE_ENABLED: bool = True  # Agrupar tokens en menos frames NDJSON
+    STREAM_COALESCE_WINDOW_MS: int = 50  # Ventana máxima de agrupación
+    STREAM_COALESCE_MAX_BYTES: int = 512  # Flush anticipado al superar este tamaño
+
+    # ========================================================================
+    # TRACING (OpenTelemetry)
+    # ========================================================================
+    TRACING_ENABLED: bool = False
+    TRACING_EXPORTER: str = "console"  # console | file
+    TRACING_FILE_PATH: str = "traces.jsonl"
+
+    # ========================================================================
+    # CONSULTAS LENTAS (instrumentación SQL + sugerencias de índices)
+    # ========================================================================
+    DB_SLOW_QUERY_ENABLED: bool = True
+    DB_SLOW_QUERY_MS: int = 200
+    # Últimas consultas lentas que se guardan por proceso (ring buffer)
+    DB_SLOW_QUERY_BUFFER_SIZE: int = 200
+    # Sentencias distintas agregadas por proceso (las nuevas se ignoran al llegar al límite)
+    DB_SLOW_QUERY_MAX_STATEMENTS: int = 500
+
+    # ========================================================================
+    # TIVIT (búsqueda vectorial de perfiles)
+    # ========================================================================
+    TIVIT_VECTOR_DIM: int = 1024
+    # Directorio de la matriz memory-mapped (compartida entre workers); None = solo en memoria
+    TIVIT_VECTORS_DIR: Optional[str] = "/tmp/caso01_tivit_vectors"
+
     # ========================================================================
     # RAG SERVICE
     # ========================================================================
@@ -92,12 +190,18 @@ class Settings(BaseSettings):
     # ========================================================================
     MAX_FILE_SIZE: int = 52428800  # 50MB
     ALLOWED_EXTENSIONS: str = ".pdf,.docx,.xlsx,.csv,.txt"
+    # Reutilizar el procesamiento (vectores + análisis) de un archivo idéntico ya procesado
+    UPLOAD_DEDUP_ENABLED: bool = True
+    # Bloque de lectura al copiar el upload calculando su SHA-256
+    UPLOAD_HASH_CHUNK_BYTES: int = 1048576  # 1MB
 
     # ========================================================================
     # CELERY
     # ========================================================================
     CELERY_BROKER_URL: str = "redis://ia_redis:6379/0"
     CELERY_RESULT_BACKEND: str = "redis://ia_redis:6379/0"
+    # Cada cuánto se recalculan desde cero los agregados del dashboard (0 = nunca)
+    DASHBOARD_STATS_RECONCILE_SECONDS: int = 3600
 
     # ========================================================================
     # CORS
@@ -0,0 +1,192 @@
+"""
+Memoria compacta de conversaciones.
+
+En lugar de reenviar los últimos 10 mensajes completos en cada prompt (las respuestas
+del asistente suelen ser propuestas o matrices de miles de tokens), cada conversación
+mantiene un resumen incremental de los mensajes antiguos. El prompt incluye:
+- El resumen acumulado (si existe)
+- Solo los últimos turnos en crudo (CHAT_HISTORY_RECENT_MESSAGES)
+
+El resumen se actualiza en segundo plano al terminar cada turno.
+"""
+import logging
+import threading
+from typing import List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from core import llm_service
+from core.config import settings
+from models import database
+from models.conversation import Conversation, Message
+from models.schemas import DocumentChunk
+from prompts.chat_prompts import CONVERSATION_SUMMARY_PROMPT
+
+logger = logging.getLogger(__name__)
+
+# Conversaciones con un resumen en curso en este proceso
+_in_progress = set()
+_in_progress_lock = threading.Lock()
+
+
+def build_chat_history(
+    db: Session,
+    conversation: Conversation,
+    exclude_message_id: Optional[str] = None
+) -> List[dict]:
+    """
+    Construye el historial acotado que se envía al LLM.
+
+    Args:
+        db: Sesión de base de datos
+        conversation: Conversación actual
+        exclude_message_id: Mensaje a excluir (normalmente el mensaje actual del usuario)
+
+    Returns:
+        Lista de mensajes [{"role": ..., "content": ...}] en orden cronológico,
+        precedida por el resumen de la conversación si existe.
+    """
+    query = db.query(Message).filter(Message.conversation_id == conversation.id)
+    if exclude_message_id:
+        query = query.filter(Message.id != exclude_message_id)
+
+    recent_messages = (
+        query.order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(settings.CHAT_HISTORY_RECENT_MESSAGES)
+        .all()
+    )
+
+    chat_history = []
+    if conversation.summary:
+        chat_history.append({
+            "role": "system",
+            "content": f"Resumen de la conversación previa:\n{conversation.summary}"
+        })
+
+    # Reordenar cronológicamente (antiguo -> nuevo)
+    for msg in reversed(recent_messages):
+        chat_history.append({
+            "role": msg.role,
+            "content": msg.content
+        })
+
+    return chat_history
+
+
+def _format_transcript(messages: List[Message]) -> str:
+    """Formatea los mensajes a resumir, recortando los muy largos."""
+    max_chars = settings.CHAT_SUMMARY_MESSAGE_MAX_CHARS
+    lines = []
+    for msg in messages:
+        role = "USUARIO" if msg.role == "user" else "ASISTENTE"
+        content = msg.content or ""
+        if len(content) > max_chars:
+            content = content[:max_chars] + " [...]"
+        lines.append(f"{role}: {content}")
+    return "\n\n".join(lines)
+
+
+def update_conversation_summary(conversation_id: str) -> None:
+    """
+    Incorpora al resumen los mensajes que salieron de la ventana de turnos recientes.
+
+    Se ejecuta como tarea en segundo plano tras cada turno de chat. Usa su propia
+    sesión de BD y nunca propaga errores (un fallo solo retrasa el resumen al
+    siguiente turno).
+    """
+    if not settings.CHAT_SUMMARY_ENABLED:
+        return
+
+    with _in_progress_lock:
+        if conversation_id in _in_progress:
+            return
+        _in_progress.add(conversation_id)
+
+    try:
+        with database.SessionLocal() as db:
+            conversation = (
+                db.query(Conversation)
+                .filter(Conversation.id == conversation_id)
+                .first()
+            )
+            if not conversation:
+                return
+
+            total_messages = (
+                db.query(func.count(Message.id))
+                .filter(Message.conversation_id == conversation_id)
+                .scalar()
+            ) or 0
+
+            summarized = conversation.summary_message_count or 0
+            fold_until = total_messages - settings.CHAT_HISTORY_RECENT_MESSAGES
+            if fold_until <= summarized:
+                return
+
+            pending_messages = (
+                db.query(Message)
+                .filter(Message.conversation_id == conversation_id)
+                .order_by(Message.created_at.asc(), Message.id.asc())
+                .offset(summarized)
+                .limit(fold_until - summarized)
+                .all()
+            )
+            if not pending_messages:
+                return
+
+            context_chunks = []
+            if conversation.summary:
+                context_chunks.append(DocumentChunk(
+                    document_id=f"conversation-{conversation_id}-summary",
+                    chunk_text=f"RESUMEN PREVIO:\n{conversation.summary}",
+                    chunk_index=0,
+                    score=1.0,
+                ))
+            context_chunks.append(DocumentChunk(
+                document_id=f"conversation-{conversation_id}-messages",
+                chunk_text=f"MENSAJES NUEVOS:\n{_format_transcript(pending_messages)}",
+                chunk_index=len(context_chunks),
+                score=1.0,
+            ))
+
+            summary = llm_service.generate_response(
+                query="Genera el resumen actualizado de la conversación.",
+                context_chunks=context_chunks,
+                use_cache=False,
+                system_prompt=CONVERSATION_SUMMARY_PROMPT
+            )
+            summary = (summary or "").strip()
+            if not summary:
+                return
+
+            # Update condicional: si otro worker ya avanzó el resumen, no lo pisamos.
+            # updated_at se conserva para no reordenar la lista de conversaciones.
+            updated = (
+                db.query(Conversation)
+                .filter(
+                    Conversation.id == conversation_id,
+                    Conversation.summary_message_count == summarized
+                )
+                .update(
+                    {
+                        Conversation.summary: summary[:settings.CHAT_SUMMARY_MAX_CHARS],
+                        Conversation.summary_message_count: fold_until,
+                        Conversation.updated_at: Conversation.updated_at,
+                    },
+                    synchronize_session=False
+                )
+            )
+            db.commit()
+
+            if updated:
+                logger.info(
+                    f"🧠 Resumen de conversación {conversation_id} actualizado "
+                    f"({summarized} → {fold_until} mensajes)"
+                )
+
+    except Exception as e:
+        logger.warning(f"No se pudo actualizar el resumen de la conversación {conversation_id}: {e}")
+    finally:
+        with _in_progress_lock:
+            _in_progress.discard(conversation_id)
@@ -0,0 +1,421 @@
+"""
+Agregados del dashboard mantenidos incrementalmente (tabla workspace_stats).
+
+`/dashboard/stats` hacía ~7 COUNT con JOIN por request y `/suggestions` 4-5
+consultas por workspace. Ahora ambos leen las filas de workspace_stats del
+usuario (una consulta) y los contadores se mantienen así:
+
+- Eventos del mapper sobre Document, Conversation y Workspace aplican deltas
+  (`UPDATE ... SET col = col + n`) en la misma transacción que el cambio, así
+  que el contador nunca queda confirmado sin su cambio ni al revés.
+- Los documentos del mes actual / anterior se guardan junto con el mes al que
+  corresponden (`month_key`, AAAAMM); al cambiar de mes se desplazan en el
+  siguiente insert, y la lectura corrige filas que no se tocaron en el mes.
+- Si falta la fila de un workspace se reconstruye al hacer commit, y la tarea
+  periódica `reconcile_dashboard_stats` recalcula todo desde las tablas base
+  (corrige cambios hechos por fuera del ORM: SQL manual, bulk updates...).
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, delete, event, func, insert, inspect, select, update
+from sqlalchemy.orm import Session
+
+from models.conversation import Conversation
+from models.document import Document
+from models.workspace import Workspace
+from models.workspace_stats import WorkspaceStats
+
+logger = logging.getLogger(__name__)
+
+stats_table = WorkspaceStats.__table__
+documents_table = Document.__table__
+conversations_table = Conversation.__table__
+workspaces_table = Workspace.__table__
+
+STATUS_COLUMNS = {
+    "PENDING": "pending",
+    "PROCESSING": "processing",
+    "COMPLETED": "completed",
+    "FAILED": "failed",
+}
+COUNTERS = [
+    "documents", "pending", "processing", "completed", "failed",
+    "analyzed", "completed_unanalyzed", "conversations",
+]
+RECONCILE_BATCH_SIZE = 500
+
+_MISSING_KEY = "dashboard_stats_missing"
+_DELETED_WORKSPACES_KEY = "dashboard_stats_deleted_workspaces"
+
+
+# ----------------------------------------------------------------------
+# Meses
+# ----------------------------------------------------------------------
+def month_key(dt: datetime) -> int:
+    return dt.year * 100 + dt.month
+
+
+def shift_month(key: int, months: int) -> int:
+    year, month = divmod(key, 100)
+    index = year * 12 + (month - 1) + months
+    return (index // 12) * 100 + index % 12 + 1
+
+
+def month_counts(row, now: Optional[datetime] = None) -> Tuple[int, int]:
+    """(documentos de este mes, del mes anterior) según el mes actual."""
+    current = month_key(now or datetime.now())
+    if row.month_key == current:
+        return max(row.documents_this_month, 0), max(row.documents_last_month, 0)
+    if row.month_key == shift_month(current, -1):
+        return 0, max(row.documents_this_month, 0)
+    return 0, 0
+
+
+# ----------------------------------------------------------------------
+# Deltas
+# ----------------------------------------------------------------------
+def _contribution(status: Optional[str], has_full: bool) -> Dict[str, int]:
+    """Contadores a los que suma un documento en un estado dado."""
+    contribution = {"documents": 1}
+    column = STATUS_COLUMNS.get(status)
+    if column:
+        contribution[column] = 1
+    if has_full:
+        contribution["analyzed"] = 1
+    elif status == "COMPLETED":
+        contribution["completed_unanalyzed"] = 1
+    return contribution
+
+
+def _negate(contribution: Dict[str, int]) -> Dict[str, int]:
+    return {key: -value for key, value in contribution.items()}
+
+
+def _diff(new: Dict[str, int], old: Dict[str, int]) -> Dict[str, int]:
+    keys = set(new) | set(old)
+    return {k: new.get(k, 0) - old.get(k, 0) for k in keys if new.get(k, 0) != old.get(k, 0)}
+
+
+def _apply(connection, target, workspace_id: Optional[str], deltas: Dict[str, int], extra=()):
+    """
+    Aplica los deltas (y asignaciones extra, en orden) a la fila del workspace.
+    Si la fila no existe se marca para reconstruirla al confirmar la transacción.
+    """
+    if not workspace_id or not (deltas or extra):
+        return
+    values = [(stats_table.c[key], stats_table.c[key] + value) for key, value in deltas.items()]
+    values += list(extra)
+    result = connection.execute(
+        update(stats_table)
+        .where(stats_table.c.workspace_id == workspace_id)
+        .ordered_values(*values)
+    )
+    if result.rowcount == 0:
+        session = Session.object_session(target)
+        if session is not None:
+            session.info.setdefault(_MISSING_KEY, set()).add(workspace_id)
+
+
+def _month_insert_values(now: datetime):
+    """
+    Asignaciones para sumar un documento al mes actual, desplazando los
+    contadores si la fila era de un mes anterior. El orden importa: MySQL
+    evalúa las asignaciones de izquierda a derecha con los valores ya
+    actualizados, así que month_key se asigna al final.
+    """
+    c = stats_table.c
+    current = month_key(now)
+    previous = shift_month(current, -1)
+    return [
+        (c.documents_last_month, case(
+            (c.month_key == current, c.documents_last_month),
+            (c.month_key == previous, c.documents_this_month),
+            else_=0,
+        )),
+        (c.documents_this_month, case((c.month_key == current, c.documents_this_month), else_=0) + 1),
+        (c.month_key, current),
+    ]
+
+
+def _month_delete_values(created_at: Optional[datetime]):
+    """Asignaciones para restar un documento creado en `created_at`."""
+    if created_at is None:
+        return []
+    c = stats_table.c
+    created = month_key(created_at)
+    return [
+        (c.documents_this_month, c.documents_this_month - case((c.month_key == created, 1), else_=0)),
+        (c.documents_last_month, c.documents_last_month - case(
+            (c.month_key == shift_month(created, 1), 1), else_=0
+        )),
+    ]
+
+
+def _workspace_being_deleted(target, workspace_id: Optional[str]) -> bool:
+    session = Session.object_session(target)
+    return bool(session and workspace_id in session.info.get(_DELETED_WORKSPACES_KEY, ()))
+
+
+# ----------------------------------------------------------------------
+# Eventos: Document
+# ----------------------------------------------------------------------
+def _load_document(connection, document_id):
+    return connection.execute(
+        select(
+            documents_table.c.workspace_id,
+            documents_table.c.status,
+            documents_table.c.suggestion_full.isnot(None),
+            documents_table.c.created_at,
+        ).where(documents_table.c.id == document_id)
+    ).first()
+
+
+def _document_after_insert(mapper, connection, target):
+    contribution = _contribution(target.status or "PENDING", target.suggestion_full is not None)
+    _apply(connection, target, target.workspace_id, contribution, _month_insert_values(datetime.now()))
+
+
+def _document_before_update(mapper, connection, target):
+    attrs = inspect(target).attrs
+    changed = {key for key in ("status", "suggestion_full", "workspace_id") if attrs[key].history.has_changes()}
+    if not changed:
+        return
+    # Estado anterior desde la BD: el valor previo no siempre está cargado en el objeto
+    old = _load_document(connection, target.id)
+    if old is None:
+        return
+    old_workspace, old_status, old_full, _ = old
+    new_workspace = target.workspace_id if "workspace_id" in changed else old_workspace
+    new_status = target.status if "status" in changed else old_status
+    new_full = (target.suggestion_full is not None) if "suggestion_full" in changed else bool(old_full)
+
+    old_contribution = _contribution(old_status, bool(old_full))
+    new_contribution = _contribution(new_status, new_full)
+    if new_workspace == old_workspace:
+        _apply(connection, target, new_workspace, _diff(new_contribution, old_contribution))
+    else:
+        # Cambio de workspace: los contadores mensuales se corrigen en la reconciliación
+        _apply(connection, target, old_workspace, _negate(old_contribution))
+        _apply(connection, target, new_workspace, new_contribution)
+
+
+def _document_before_delete(mapper, connection, target):
+    old = _load_document(connection, target.id)
+    if old is None or _workspace_being_deleted(target, old[0]):
+        return
+    workspace_id, status, has_full, created_at = old
+    _apply(
+        connection, target, workspace_id,
+        _negate(_contribution(status, bool(has_full))),
+        _month_delete_values(created_at),
+    )
+
+
+# ----------------------------------------------------------------------
+# Eventos: Conversation (solo las de un workspace)
+# ----------------------------------------------------------------------
+def _conversation_after_insert(mapper, connection, target):
+    _apply(connection, target, target.workspace_id, {"conversations": 1})
+
+
+def _conversation_before_update(mapper, connection, target):
+    if not inspect(target).attrs.workspace_id.history.has_changes():
+        return
+    old_workspace = connection.execute(
+        select(conversations_table.c.workspace_id).where(conversations_table.c.id == target.id)
+    ).scalar()
+    if old_workspace != target.workspace_id:
+        _apply(connection, target, old_workspace, {"conversations": -1})
+        _apply(connection, target, target.workspace_id, {"conversations": 1})
+
+
+def _conversation_before_delete(mapper, connection, target):
+    workspace_id = connection.execute(
+        select(conversations_table.c.workspace_id).where(conversations_table.c.id == target.id)
+    ).scalar()
+    if not _workspace_being_deleted(target, workspace_id):
+        _apply(connection, target, workspace_id, {"conversations": -1})
+
+
+# ----------------------------------------------------------------------
+# Eventos: Workspace
+# ----------------------------------------------------------------------
+def _workspace_after_insert(mapper, connection, target):
+    connection.execute(
+        insert(stats_table).values(
+            workspace_id=target.id,
+            owner_id=target.owner_id,
+            is_active=target.is_active if target.is_active is not None else True,
+            month_key=month_key(datetime.now()),
+        )
+    )
+
+
+def _workspace_after_update(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if attrs.owner_id.history.has_changes() or attrs.is_active.history.has_changes():
+        _apply(connection, target, target.id, {}, [
+            (stats_table.c.owner_id, target.owner_id),
+            (stats_table.c.is_active, bool(target.is_active)),
+        ])
+
+
+def _workspace_after_delete(mapper, connection, target):
+    connection.execute(delete(stats_table).where(stats_table.c.workspace_id == target.id))
+
+
+event.listen(Document, "after_insert", _document_after_insert)
+event.listen(Document, "before_update", _document_before_update)
+event.listen(Document, "before_delete", _document_before_delete)
+event.listen(Conversation, "after_insert", _conversation_after_insert)
+event.listen(Conversation, "before_update", _conversation_before_update)
+event.listen(Conversation, "before_delete", _conversation_before_delete)
+event.listen(Workspace, "after_insert", _workspace_after_insert)
+event.listen(Workspace, "after_update", _workspace_after_update)
+event.listen(Workspace, "after_delete", _workspace_after_delete)
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_deleted_workspaces(session, flush_context, instances):
+    # Los hijos de un workspace que se elimina no ajustan contadores: la fila se borra
+    deleted = {obj.id for obj in session.deleted if isinstance(obj, Workspace)}
+    if deleted:
+        session.info.setdefault(_DELETED_WORKSPACES_KEY, set()).update(deleted)
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _clear_deleted_workspaces(session, flush_context):
+    session.info.pop(_DELETED_WORKSPACES_KEY, None)
+
+
+@event.listens_for(Session, "after_commit")
+def _rebuild_missing_rows(session):
+    missing = session.info.pop(_MISSING_KEY, None)
+    if not missing:
+        return
+    try:
+        with session.get_bind().begin() as connection:
+            rebuild(connection, missing)
+    except Exception as e:
+        logger.warning(f"No se pudieron reconstruir agregados del dashboard: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_missing_rows(session):
+    session.info.pop(_MISSING_KEY, None)
+
+
+# ----------------------------------------------------------------------
+# Reconstrucción desde las tablas base
+# ----------------------------------------------------------------------
+def rebuild(connection, workspace_ids: Iterable[str], now: Optional[datetime] = None) -> int:
+    """
+    Recalcula las filas de los workspaces indicados con COUNT agrupados.
+
+    Bloquea primero las filas existentes (SELECT ... FOR UPDATE): los deltas
+    de transacciones concurrentes esperan a que termine y se aplican sobre
+    los valores recalculados, sin perderse ni contarse dos veces.
+    """
+    ids = list(workspace_ids)
+    if not ids:
+        return 0
+    now = now or datetime.now()
+    this_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    last_month = (this_month - timedelta(days=1)).replace(day=1)
+    d, cv, ws = documents_table.c, conversations_table.c, workspaces_table.c
+
+    connection.execute(
+        select(stats_table.c.workspace_id).where(stats_table.c.workspace_id.in_(ids)).with_for_update()
+    ).all()
+
+    rows: Dict[str, dict] = {}
+    for workspace_id, owner_id, is_active in connection.execute(
+        select(ws.id, ws.owner_id, ws.is_active).where(ws.id.in_(ids))
+    ):
+        rows[workspace_id] = dict(
+            {key: 0 for key in COUNTERS},
+            workspace_id=workspace_id,
+            owner_id=owner_id,
+            is_active=True if is_active is None else bool(is_active),
+            month_key=month_key(now),
+            documents_this_month=0,
+            documents_last_month=0,
+        )
+
+    # COUNT(suggestion_full) cuenta solo los no nulos
+    for workspace_id, status, total, analyzed in connection.execute(
+        select(d.workspace_id, d.status, func.count(), func.count(d.suggestion_full))
+        .where(d.workspace_id.in_(ids))
+        .group_by(d.workspace_id, d.status)
+    ):
+        row = rows.get(workspace_id)
+        if row is None:
+            continue
+        row["documents"] += total
+        row["analyzed"] += analyzed
+        column = STATUS_COLUMNS.get(status)
+        if column:
+            row[column] += total
+        if status == "COMPLETED":
+            row["completed_unanalyzed"] += total - analyzed
+
+    for workspace_id, recent, current in connection.execute(
+        select(d.workspace_id, func.count(), func.sum(case((d.created_at >= this_month, 1), else_=0)))
+        .where(d.workspace_id.in_(ids), d.created_at >= last_month)
+        .group_by(d.workspace_id)
+    ):
+        if workspace_id in rows:
+            rows[workspace_id]["documents_this_month"] = int(current or 0)
+            rows[workspace_id]["documents_last_month"] = recent - int(current or 0)
+
+    for workspace_id, total in connection.execute(
+        select(cv.workspace_id, func.count()).where(cv.workspace_id.in_(ids)).group_by(cv.workspace_id)
+    ):
+        if workspace_id in rows:
+            rows[workspace_id]["conversations"] = total
+
+    connection.execute(delete(stats_table).where(stats_table.c.workspace_id.in_(ids)))
+    if rows:
+        connection.execute(insert(stats_table), list(rows.values()))
+    return len(rows)
+
+
+def reconcile_all(engine, batch_size: int = RECONCILE_BATCH_SIZE) -> int:
+    """Recalcula todos los workspaces por lotes (una transacción por lote)."""
+    total = 0
+    last_id = ""
+    while True:
+        with engine.begin() as connection:
+            ids = connection.execute(
+                select(workspaces_table.c.id)
+                .where(workspaces_table.c.id > last_id)
+                .order_by(workspaces_table.c.id)
+                .limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                return total
+            total += rebuild(connection, ids)
+        last_id = ids[-1]
+
+
+# ----------------------------------------------------------------------
+# Lectura
+# ----------------------------------------------------------------------
+def get_user_stats(db: Session, owner_id: str) -> List[WorkspaceStats]:
+    return db.query(WorkspaceStats).filter(WorkspaceStats.owner_id == owner_id).all()
+
+
+def get_active_workspace_stats(
+    db: Session, owner_id: str, workspace_id: Optional[str] = None
+) -> List[Tuple[WorkspaceStats, str]]:
+    """Filas de workspaces activos del usuario junto con el nombre del workspace."""
+    query = (
+        db.query(WorkspaceStats, Workspace.name)
+        .join(Workspace, Workspace.id == WorkspaceStats.workspace_id)
+        .filter(WorkspaceStats.owner_id == owner_id, WorkspaceStats.is_active == True)  # noqa: E712
+    )
+    if workspace_id:
+        query = query.filter(WorkspaceStats.workspace_id == workspace_id)
+    return query.all()
@@ -0,0 +1,369 @@
+"""
+Instrumentación de consultas SQL: consultas lentas, EXPLAIN y sugerencias de índices.
+
+- Eventos de SQLAlchemy sobre todos los Engine (sync, async, réplica) miden
+  cada sentencia. Las que tardan >= DB_SLOW_QUERY_MS se agregan por sentencia
+  normalizada (conteo, tiempo total/máximo, rutas que la ejecutan) y además
+  quedan en un ring buffer con las últimas DB_SLOW_QUERY_BUFFER_SIZE.
+- La ruta es la plantilla de FastAPI (QueryRouteMiddleware) o el nombre de la
+  tarea de Celery; cualquier otra cosa cuenta como "background".
+- `slow_query_log.report()` ejecuta EXPLAIN de los SELECT lentos (una vez por
+  sentencia, en la réplica si existe) y propone índices compuestos: primero
+  las columnas comparadas por igualdad, luego la de rango u orden, salvo que
+  un índice existente ya las cubra como prefijo. Solo se sugieren índices si
+  el plan muestra full scan / filesort (o si no hay plan).
+
+Se mide hasta que el driver termina el execute: con stream_results el fetch
+de las filas no entra en el tiempo. Los datos son por proceso, como los
+contadores de Prometheus sin modo multiproceso.
+
+Reporte: GET /api/v1/metrics/db/slow-queries (superusuario).
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import LargeBinary, Text, UniqueConstraint, event
+from sqlalchemy.engine import Engine
+
+from core.config import settings
+from core.prometheus_metrics import DB_SLOW_QUERIES
+
+logger = logging.getLogger(__name__)
+
+_START_KEY = "query_start"
+
+_PLACEHOLDER = r"(?:%s|\?|%\(\w+\)s|:\w+)"
+_IN_LIST = re.compile(r"\(\s*" + _PLACEHOLDER + r"(?:\s*,\s*" + _PLACEHOLDER + r")*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+_EQUALITY = re.compile(
+    r"\b(\w+)\.(\w+)\s*(?:=\s*" + _PLACEHOLDER + r"|IN\s*\(|IS\s+(?:NOT\s+)?NULL)", re.IGNORECASE
+)
+_RANGE = re.compile(r"\b(\w+)\.(\w+)\s*(?:<=|>=|<|>|BETWEEN)\s*" + _PLACEHOLDER, re.IGNORECASE)
+_ORDER_BY = re.compile(r"\bORDER BY\s+(.+?)(?:\bLIMIT\b|\bFOR UPDATE\b|$)", re.IGNORECASE | re.DOTALL)
+_COLUMN = re.compile(r"\b(\w+)\.(\w+)")
+
+# Columnas por índice sugerido (más allá de esto rara vez compensa)
+_MAX_INDEX_COLUMNS = 4
+# Largo máximo de identificadores en MySQL
+_MAX_NAME_LENGTH = 64
+
+
+# ----------------------------------------------------------------------
+# Ruta / tarea en curso
+# ----------------------------------------------------------------------
+# Dict mutable en lugar del valor directo: se vacía al terminar la request, así
+# las tareas que la sobreviven (p. ej. el message writer) no heredan su ruta.
+_current: ContextVar[Optional[dict]] = ContextVar("db_query_route", default=None)
+
+
+def current_route() -> str:
+    holder = _current.get()
+    if not holder:
+        return "background"
+    scope = holder.get("scope")
+    if scope is None:
+        return holder.get("label") or "background"
+    route = scope.get("route")
+    path = getattr(route, "path", None) or scope.get("path", "")
+    return f"{scope.get('method', '')} {path}".strip()
+
+
+def set_route_label(label: Optional[str]) -> None:
+    """Etiqueta fija para lo que se ejecute a continuación (tareas de Celery)."""
+    _current.set({"label": label} if label else None)
+
+
+class QueryRouteMiddleware:
+    """Middleware ASGI: asocia las consultas de la request a su ruta."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        holder = {"scope": scope}
+        token = _current.set(holder)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            holder.clear()
+            _current.reset(token)
+
+
+# ----------------------------------------------------------------------
+# Registro de consultas lentas
+# ----------------------------------------------------------------------
+def normalize(statement: str) -> str:
+    """Sentencia sin espacios repetidos y con las listas IN (...) colapsadas."""
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    return _IN_LIST.sub("(?)", statement)
+
+
+def _is_select(statement: str) -> bool:
+    return statement.lstrip().upper().startswith(("SELECT", "WITH"))
+
+
+class SlowQueryLog:
+    """Agregado por sentencia + ring buffer de las últimas consultas lentas."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._recent = deque(maxlen=settings.DB_SLOW_QUERY_BUFFER_SIZE)
+            self._statements: Dict[str, Dict] = {}
+
+    def record(self, statement: str, parameters, executemany: bool, elapsed_ms: float, route: str) -> None:
+        key = normalize(statement)
+        now = datetime.now()
+        with self._lock:
+            self._recent.append(
+                {"statement": key, "ms": round(elapsed_ms, 1), "route": route, "at": now.isoformat()}
+            )
+            entry = self._statements.get(key)
+            if entry is None:
+                if len(self._statements) >= settings.DB_SLOW_QUERY_MAX_STATEMENTS:
+                    return
+                entry = self._statements[key] = {
+                    "statement": key,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "routes": Counter(),
+                    # Muestra para EXPLAIN (solo memoria del proceso, no se expone)
+                    "sample": (statement, None if executemany else parameters),
+                    "plan": None,
+                    "plan_error": None,
+                }
+            entry["count"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["last_seen"] = now.isoformat()
+            entry["routes"][route] += 1
+            if elapsed_ms > entry["max_ms"]:
+                entry["max_ms"] = elapsed_ms
+                entry["sample"] = (statement, None if executemany else parameters)
+
+    def report(self, explain: bool = True, limit: int = 50) -> Dict:
+        """Sentencias más costosas (tiempo total), con plan e índices sugeridos."""
+        with self._lock:
+            entries = sorted(self._statements.values(), key=lambda e: e["total_ms"], reverse=True)[:limit]
+            recent = list(self._recent)
+
+        queries = []
+        suggestions: Dict[str, Dict] = {}
+        for entry in entries:
+            statement, parameters = entry["sample"]
+            if explain and entry["plan"] is None and entry["plan_error"] is None and _is_select(statement):
+                try:
+                    entry["plan"] = explain_statement(statement, parameters)
+                except Exception as e:
+                    entry["plan_error"] = str(e)
+
+            plan = entry["plan"]
+            warnings = plan_warnings(plan) if plan else []
+            indexes, notes = suggest_indexes(statement) if (not plan or warnings) else ([], [])
+            for index in indexes:
+                aggregated = suggestions.setdefault(index["name"], dict(index, statements=0, total_ms=0.0))
+                aggregated["statements"] += 1
+                aggregated["total_ms"] = round(aggregated["total_ms"] + entry["total_ms"], 1)
+
+            queries.append(
+                {
+                    "statement": entry["statement"],
+                    "count": entry["count"],
+                    "total_ms": round(entry["total_ms"], 1),
+                    "avg_ms": round(entry["total_ms"] / entry["count"], 1),
+                    "max_ms": round(entry["max_ms"], 1),
+                    "last_seen": entry.get("last_seen"),
+                    "routes": dict(entry["routes"].most_common()),
+                    "plan": plan,
+                    "plan_error": entry["plan_error"],
+                    "plan_warnings": warnings,
+                    "suggested_indexes": indexes,
+                    "notes": notes,
+                }
+            )
+
+        return {
+            "threshold_ms": settings.DB_SLOW_QUERY_MS,
+            "queries": queries,
+            "suggested_indexes": sorted(suggestions.values(), key=lambda s: s["total_ms"], reverse=True),
+            "recent": recent[::-1],
+        }
+
+
+# Instancia global (por proceso)
+slow_query_log = SlowQueryLog()
+
+
+# ----------------------------------------------------------------------
+# EXPLAIN y sugerencias de índices
+# ----------------------------------------------------------------------
+def explain_statement(statement: str, parameters) -> List[Dict]:
+    """EXPLAIN de la sentencia con sus parámetros originales (réplica si existe)."""
+    from models import database
+
+    engine = database.replica_engine or database.engine
+    prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+    with engine.connect() as connection:
+        result = connection.exec_driver_sql(prefix + statement, parameters or ())
+        return [{key: value for key, value in row._mapping.items()} for row in result]
+
+
+def plan_warnings(plan: List[Dict]) -> List[str]:
+    """Señales de un plan caro: full scan, filesort, tabla temporal."""
+    warnings = []
+    for row in plan:
+        if "detail" in row:  # SQLite
+            detail = row["detail"]
+            if detail.startswith("SCAN") and " USING " not in detail:
+                warnings.append(detail)
+            elif "TEMP B-TREE" in detail:
+                warnings.append(detail)
+            continue
+        # MySQL
+        table = row.get("table")
+        if row.get("type") == "ALL":
+            warnings.append(f"{table}: full table scan (~{row.get('rows')} filas)")
+        extra = row.get("Extra") or ""
+        if "filesort" in extra:
+            warnings.append(f"{table}: Using filesort")
+        if "temporary" in extra:
+            warnings.append(f"{table}: Using temporary")
+    return warnings
+
+
+def _append(columns: Dict[str, List[str]], table: str, column: str) -> None:
+    names = columns.setdefault(table, [])
+    if column not in names:
+        names.append(column)
+
+
+def _existing_indexes(table) -> List[List[str]]:
+    indexes = [[c.name for c in table.primary_key.columns]]
+    indexes += [[c.name for c in index.columns] for index in table.indexes]
+    indexes += [
+        [c.name for c in constraint.columns]
+        for constraint in table.constraints
+        if isinstance(constraint, UniqueConstraint)
+    ]
+    # MySQL (InnoDB) crea un índice por cada FK
+    indexes += [[fk.parent.name] for fk in table.foreign_keys]
+    return indexes
+
+
+def _indexable(table, column: str, notes: List[str]) -> bool:
+    if column not in table.c:
+        return False
+    if isinstance(table.c[column].type, (Text, LargeBinary)):
+        note = f"{table.name}.{column}: columna TEXT/BLOB, no indexable sin prefijo"
+        if note not in notes:
+            notes.append(note)
+        return False
+    return True
+
+
+def suggest_indexes(statement: str) -> Tuple[List[Dict], List[str]]:
+    """
+    Índices compuestos que cubrirían los filtros/orden de la sentencia.
+
+    Devuelve (índices, notas). Solo considera tablas de los modelos y omite los
+    índices que ya existen en ellos como prefijo de otro.
+    """
+    from models.database import Base
+
+    tables = Base.metadata.tables
+    equality: Dict[str, List[str]] = {}
+    ranges: Dict[str, List[str]] = {}
+    order: Dict[str, List[str]] = {}
+    for table, column in _EQUALITY.findall(statement):
+        _append(equality, table, column)
+    for table, column in _RANGE.findall(statement):
+        _append(ranges, table, column)
+    order_by = _ORDER_BY.search(statement)
+    if order_by:
+        for table, column in _COLUMN.findall(order_by.group(1)):
+            _append(order, table, column)
+
+    indexes, notes = [], []
+    for name in list(dict.fromkeys([*equality, *ranges, *order])):
+        table = tables.get(name)
+        if table is None:
+            continue
+
+        # Un keyset (a < x OR (a = x AND id < y)) cuenta como rango, no igualdad
+        leading = [
+            c for c in equality.get(name, [])
+            if c not in ranges.get(name, []) and _indexable(table, c, notes)
+        ]
+        tail = [c for c in ranges.get(name, [])[:1] if _indexable(table, c, notes)]
+        if not tail:
+            tail = [c for c in order.get(name, []) if c not in leading and _indexable(table, c, notes)]
+        columns = (leading + tail)[:_MAX_INDEX_COLUMNS]
+        if not columns:
+            continue
+        if any(existing[: len(columns)] == columns for existing in _existing_indexes(table)):
+            continue
+
+        index_name = f"idx_{name}_{'_'.join(columns)}"[:_MAX_NAME_LENGTH]
+        indexes.append(
+            {
+                "table": name,
+                "columns": columns,
+                "name": index_name,
+                "ddl": f"CREATE INDEX {index_name} ON {name} ({', '.join(columns)})",
+            }
+        )
+    return indexes, notes
+
+
+# ----------------------------------------------------------------------
+# Eventos de SQLAlchemy
+# ----------------------------------------------------------------------
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(_START_KEY, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get(_START_KEY)
+    if not starts:
+        return
+    elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+    if elapsed_ms < settings.DB_SLOW_QUERY_MS or statement.lstrip().upper().startswith("EXPLAIN"):
+        return
+    route = current_route()
+    DB_SLOW_QUERIES.labels(route=route).inc()
+    slow_query_log.record(statement, parameters, executemany, elapsed_ms, route)
+
+
+def _handle_error(context):
+    connection = context.connection
+    starts = connection.info.get(_START_KEY) if connection is not None else None
+    if starts:
+        starts.pop()
+
+
+_installed = False
+
+
+def install() -> None:
+    """Registra los eventos en todos los Engine (idempotente)."""
+    global _installed
+    if _installed or not settings.DB_SLOW_QUERY_ENABLED:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+    _installed = True
+    logger.info(f"🐢 Registro de consultas lentas activo (>= {settings.DB_SLOW_QUERY_MS} ms)")
@@ -0,0 +1,109 @@
+"""
+Almacenamiento de uploads direccionado por contenido (SHA-256).
+
+Antes cada upload se guardaba como `{document_id}{ext}` y siempre se procesaba
+completo, aunque fuera el mismo archivo subido a otro workspace (p. ej. la
+misma licitación en varios equipos). Ahora:
+
+- El SHA-256 se calcula mientras el upload se copia a disco (una sola pasada,
+  en bloques de UPLOAD_HASH_CHUNK_BYTES) y el archivo se guarda como
+  `blobs/{sha256}{ext}` (GCS o disco local): bytes idénticos se guardan una vez.
+- `documents.content_hash` (idx_document_content_hash) es el índice de
+  contenido ya procesado: si hay un documento COMPLETED con el mismo hash, el
+  worker copia sus vectores (con los ids del nuevo documento/workspace) y su
+  análisis en lugar de extraer texto y calcular embeddings otra vez
+  (processing.tasks.copy_processed_document).
+
+Los archivos no se borran al borrar un documento (ya era así), así que
+compartir un blob entre documentos es seguro.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from core.config import settings
+from core.gcp_services import gcp_services
+from models.document import Document
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = Path("uploaded_files")
+BLOB_DIR = UPLOAD_DIR / "blobs"
+os.makedirs(BLOB_DIR, exist_ok=True)
+
+
+class StoredUpload(NamedTuple):
+    content_hash: str
+    uri: str  # gs://bucket/blobs/... o ruta local
+
+
+def split_gcs_uri(uri: str) -> Tuple[str, str]:
+    """gs://bucket/blob -> (bucket, blob)."""
+    bucket, _, blob = uri[len("gs://"):].partition("/")
+    return bucket, blob
+
+
+def save_upload(file_obj, extension: str) -> StoredUpload:
+    """
+    Copia el upload a un temporal calculando su SHA-256 y lo guarda por
+    contenido. Si el blob ya existe no se vuelve a subir/escribir.
+    """
+    digest = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=BLOB_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = file_obj.read(settings.UPLOAD_HASH_CHUNK_BYTES)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+
+        content_hash = digest.hexdigest()
+        name = f"{content_hash}{extension.lower()}"
+
+        # Intentar GCS si está configurado
+        if settings.GCS_BUCKET_NAME:
+            blob_name = f"blobs/{name}"
+            if gcp_services.blob_exists(blob_name):
+                return StoredUpload(content_hash, f"gs://{settings.GCS_BUCKET_NAME}/{blob_name}")
+            with open(temp_path, "rb") as data:
+                gcs_uri = gcp_services.upload_file(data, blob_name)
+            if gcs_uri:
+                return StoredUpload(content_hash, gcs_uri)
+            logger.warning(f"Error al subir {blob_name} a GCS, usando almacenamiento local")
+
+        # Almacenamiento local (o fallback si GCS falla)
+        path = BLOB_DIR / name
+        if not path.exists():
+            os.replace(temp_path, path)
+        return StoredUpload(content_hash, str(path))
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def find_processed(db: Session, content_hash: Optional[str], exclude_id: str) -> Optional[Document]:
+    """
+    Documento COMPLETED más reciente con el mismo contenido (None si no hay).
+    Solo sirven los que quedaron indexados (chunk_count > 0): si la ingestión
+    RAG falló, cada nuevo upload debe volver a intentarla.
+    """
+    if not content_hash or not settings.UPLOAD_DEDUP_ENABLED:
+        return None
+    return (
+        db.query(Document)
+        .filter(
+            Document.content_hash == content_hash,
+            Document.status == "COMPLETED",
+            Document.chunk_count > 0,
+            Document.id != exclude_id,
+        )
+        .order_by(Document.created_at.desc())
+        .first()
+    )
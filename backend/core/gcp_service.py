@@ -81,12 +81,13 @@ class GCPServiceManager:
         """Verifica si Gemini está disponible."""
         return self._gemini_configured
     
-    def get_gemini_model(self, model_name: str = None):
+    def get_gemini_model(self, model_name: str = None, system_instruction: str = None):
         """
         Obtiene un modelo de Gemini.
         
         Args:
             model_name: Nombre del modelo (default: desde settings)
+            system_instruction: Instrucciones de sistema (prefijo estable, cacheable)
         
         Returns:
             Modelo de Gemini configurado
@@ -95,6 +96,8 @@ class GCPServiceManager:
             raise RuntimeError("Gemini no está configurado")
         
         model = model_name or settings.GEMINI_MODEL
+        if system_instruction:
+            return genai.GenerativeModel(model, system_instruction=system_instruction)
         return genai.GenerativeModel(model)
     
     def get_document_processor_name(self) -> str:
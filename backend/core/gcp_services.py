@@ -108,6 +108,20 @@ class GCPServices:
             logger.error(f"Error uploading file {destination_blob_name}: {e}")
             return None
 
+    def blob_exists(self, blob_name: str, bucket_name: str | None = None) -> bool:
+        """
+        Checks whether a blob exists (False if storage is not configured or on error).
+        """
+        bucket_name = bucket_name or os.getenv("GCS_BUCKET_NAME")
+        if not self.storage_client or not bucket_name:
+            return False
+
+        try:
+            return self.storage_client.bucket(bucket_name).blob(blob_name).exists()
+        except Exception as e:
+            logger.error(f"Error checking blob {blob_name}: {e}")
+            return False
+
     def download_file(self, blob_name: str, destination_file_obj, bucket_name: str | None = None) -> bool:
         """
         Downloads a blob to a file-like object.
@@ -1,4 +1,5 @@
 from core import llm_service
+from core.llm_router import TaskType
 from prompts.chat_prompts import INTENT_CLASSIFICATION_PROMPT
 import logging
 import re
@@ -57,8 +58,10 @@ def classify_intent(user_query: str):
     
     try:
         response = llm_service.generate_response(
-            query=INTENT_PROMPT + user_query,
-            context_chunks=[]
+            query=user_query,
+            context_chunks=[],
+            system_prompt=INTENT_PROMPT,
+            task_type=TaskType.CLASSIFY
         ).strip()
 
         # Seguridad: normalizar
@@ -1,29 +1,154 @@
 """
 Sistema de caché para respuestas LLM usando Redis.
 Reduce costos y mejora rendimiento al cachear respuestas frecuentes.
+
+Dos niveles:
+- Local (LRU en memoria del proceso, limitado por bytes y con TTL corto):
+  las claves calientes se sirven sin ir a Redis.
+- Redis (compartido entre workers): respuestas comprimidas con zlib.
+
+Además, single-flight: si varias requests idénticas llegan a la vez (en el
+mismo proceso o en distintos workers) solo una llama al LLM y el resto espera
+su resultado.
 """
 import hashlib
 import json
 import logging
-from typing import Optional, List
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional, List, Tuple
 from redis import Redis
 from core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Cabecera de las respuestas comprimidas (un texto del LLM nunca empieza con NUL).
+# Las entradas sin cabecera se leen como texto plano (compatibles con el formato anterior).
+_ZLIB_MAGIC = b"\x00zl"
+
+# Libera el lock solo si sigue siendo nuestro (no borrar el de otro worker tras expirar)
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class _LocalLRU:
+    """LRU en memoria con límite de tamaño en bytes y TTL por entrada (thread-safe)."""
+    
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self._data: "OrderedDict[str, Tuple[float, int, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, size, value = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def set(self, key: str, value: str):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (time.monotonic() + self.ttl, size, value)
+            self.size += size
+            # Expulsar las menos usadas hasta volver bajo el límite
+            while self.size > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+    
+    def pop(self, key: str):
+        with self._lock:
+            self._remove(key)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+    
+    def _remove(self, key: str):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+    
+    def __len__(self) -> int:
+        return len(self._data)
+
 
 class LLMCache:
-    """Caché inteligente para respuestas LLM."""
+    """
+    Caché inteligente para respuestas LLM.
+    
+    Estructura en Redis:
+    - `llm_cache:<sha256>`            respuesta cacheada (con TTL)
+    - `llm_cache:tag:ws:<id>`         SET con las claves ligadas a un workspace
+    - `llm_cache:tag:doc:<id>`        SET con las claves ligadas a un documento
+    - `llm_cache_meta:index`          ZSET clave -> timestamp de expiración
+    - `llm_cache_meta:stats`          HASH de contadores (hits, misses, bytes...)
     
-    def __init__(self, redis_client: Redis, ttl: int = 3600):
+    El índice y los contadores van en otro prefijo para que invalidate_pattern
+    (que recorre `llm_cache:<patrón>*`) no los borre junto con las entradas.
+    
+    Las invalidaciones usan los tags (sin recorrer el keyspace) y las
+    operaciones administrativas usan SCAN en lugar de KEYS para no bloquear Redis.
+    
+    El nivel local de otros workers no se entera de las invalidaciones: sus
+    entradas caducan a los LLM_CACHE_LOCAL_TTL_SECONDS.
+    """
+    
+    # Tamaño de lote para SCAN/UNLINK
+    BATCH_SIZE = 500
+    
+    def __init__(
+        self,
+        redis_client: Redis,
+        ttl: int = 3600,
+        local_max_bytes: int = 32 * 1024 * 1024,
+        local_ttl: float = 60,
+        compress_min_bytes: int = 1024,
+        lock_timeout: float = 60
+    ):
         """
         Args:
             redis_client: Cliente Redis
             ttl: Tiempo de vida en segundos (default: 1 hora)
+            local_max_bytes: Tamaño máximo del nivel en memoria (0 = desactivado)
+            local_ttl: Tiempo de vida de las entradas en memoria (segundos)
+            compress_min_bytes: Respuestas desde este tamaño se guardan comprimidas
+            lock_timeout: Máximo que se espera (y dura el lock) de una generación en curso
         """
         self.redis = redis_client
         self.ttl = ttl
         self.prefix = "llm_cache:"
+        self.meta_prefix = "llm_cache_meta:"
+        self.index_key = f"{self.meta_prefix}index"
+        self.stats_key = f"{self.meta_prefix}stats"
+        self.local = _LocalLRU(local_max_bytes, local_ttl) if local_max_bytes > 0 else None
+        self.compress_min_bytes = compress_min_bytes
+        self.lock_timeout = lock_timeout
+        self._release_lock = self.redis.register_script(_RELEASE_LOCK_SCRIPT)
+        # Generaciones en curso en este proceso: clave -> evento de fin
+        self._flights = {}
+        self._flights_lock = threading.Lock()
     
     def _generate_key(self, query: str, context: List[str], model: str) -> str:
         """Genera una clave única basada en query, contexto y modelo."""
@@ -32,6 +157,55 @@ class LLMCache:
         hash_key = hashlib.sha256(content.encode()).hexdigest()
         return f"{self.prefix}{hash_key}"
     
+    def _tag_keys(self, workspace_ids: Iterable[str] = (), document_ids: Iterable[str] = ()) -> List[str]:
+        """Claves de los SETs de tags para los workspaces/documentos indicados."""
+        tags = [f"{self.prefix}tag:ws:{ws_id}" for ws_id in set(workspace_ids or ()) if ws_id]
+        tags += [f"{self.prefix}tag:doc:{doc_id}" for doc_id in set(document_ids or ()) if doc_id]
+        return tags
+    
+    def _encode(self, response: str) -> bytes:
+        data = response.encode('utf-8')
+        if len(data) >= self.compress_min_bytes:
+            return _ZLIB_MAGIC + zlib.compress(data, 6)
+        return data
+    
+    @staticmethod
+    def _decode(payload: bytes) -> str:
+        if payload.startswith(_ZLIB_MAGIC):
+            payload = zlib.decompress(payload[len(_ZLIB_MAGIC):])
+        return payload.decode('utf-8')
+    
+    def _read(self, key: str) -> Optional[str]:
+        """Lee una clave (memoria y luego Redis) sin contar hits/misses."""
+        if self.local is not None:
+            value = self.local.get(key)
+            if value is not None:
+                return value
+        payload = self.redis.get(key)
+        if payload is None:
+            return None
+        value = self._decode(payload)
+        if self.local is not None:
+            self.local.set(key, value)
+        return value
+    
+    def _forget_local(self, keys: Iterable) -> None:
+        if self.local is not None:
+            for key in keys:
+                self.local.pop(key.decode() if isinstance(key, bytes) else key)
+    
+    def _unlink(self, keys: List[str]) -> int:
+        """Elimina claves por lotes (UNLINK libera memoria en segundo plano)."""
+        removed = 0
+        self._forget_local(keys)
+        for i in range(0, len(keys), self.BATCH_SIZE):
+            batch = keys[i:i + self.BATCH_SIZE]
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.unlink(*batch)
+            pipe.zrem(self.index_key, *batch)
+            removed += pipe.execute()[0]
+        return removed
+    
     def get(self, query: str, context: List[str], model: str) -> Optional[str]:
         """
         Obtiene respuesta desde caché si existe.
@@ -41,12 +215,25 @@ class LLMCache:
         """
         try:
             key = self._generate_key(query, context, model)
-            cached = self.redis.get(key)
             
-            if cached:
+            # Nivel 1: memoria del proceso (sin round trip)
+            if self.local is not None:
+                cached = self.local.get(key)
+                if cached is not None:
+                    logger.info(f"✅ Cache HIT (memoria) para query: {query[:50]}...")
+                    return cached
+            
+            # Nivel 2: Redis
+            payload = self.redis.get(key)
+            if payload:
+                self.redis.hincrby(self.stats_key, "hits", 1)
+                cached = self._decode(payload)
+                if self.local is not None:
+                    self.local.set(key, cached)
                 logger.info(f"✅ Cache HIT para query: {query[:50]}...")
-                return cached.decode('utf-8')
+                return cached
             
+            self.redis.hincrby(self.stats_key, "misses", 1)
             logger.debug(f"❌ Cache MISS para query: {query[:50]}...")
             return None
             
@@ -54,54 +241,228 @@ class LLMCache:
             logger.warning(f"Error al obtener del caché: {e}")
             return None
     
-    def set(self, query: str, context: List[str], model: str, response: str):
+    def set(
+        self,
+        query: str,
+        context: List[str],
+        model: str,
+        response: str,
+        workspace_id: Optional[str] = None,
+        document_ids: Optional[Iterable[str]] = None
+    ):
         """
         Guarda respuesta en caché.
+        
+        Si se indican workspace_id / document_ids, la entrada queda registrada en
+        sus tags para poder invalidarla cuando cambian los documentos.
         """
         try:
             key = self._generate_key(query, context, model)
-            self.redis.setex(key, self.ttl, response)
+            payload = self._encode(response)
+            
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.setex(key, self.ttl, payload)
+            pipe.zadd(self.index_key, {key: time.time() + self.ttl})
+            for tag in self._tag_keys([workspace_id], document_ids or ()):
+                pipe.sadd(tag, key)
+                # El tag vive lo mismo que su entrada más reciente
+                pipe.expire(tag, self.ttl)
+            pipe.hincrby(self.stats_key, "sets", 1)
+            pipe.hincrby(self.stats_key, "bytes_written", len(payload))
+            pipe.execute()
+            if self.local is not None:
+                self.local.set(key, response)
             logger.info(f"💾 Respuesta cacheada para: {query[:50]}...")
             
         except Exception as e:
             logger.warning(f"Error al guardar en caché: {e}")
     
+    @contextmanager
+    def single_flight(self, query: str, context: List[str], model: str) -> Iterator[Optional[str]]:
+        """
+        Evita generar la misma respuesta varias veces a la vez (cache stampede).
+        
+        Devuelve la respuesta producida por otra request en curso, o None si
+        esta request debe generarla (y guardarla con set() antes de salir del bloque).
+        
+        Uso:
+            with cache.single_flight(query, context, model) as shared:
+                if shared is not None:
+                    return shared
+                response = generar(...)
+                cache.set(query, context, model, response)
+        """
+        key = self._generate_key(query, context, model)
+        
+        # 1) Dentro del proceso: la primera request es la líder, el resto espera
+        with self._flights_lock:
+            event = self._flights.get(key)
+            leader = event is None
+            if leader:
+                event = threading.Event()
+                self._flights[key] = event
+        if not leader:
+            event.wait(self.lock_timeout)
+            yield self._safe_read(key)
+            return
+        
+        # 2) Entre workers: lock en Redis (SET NX con expiración)
+        lock_key = f"{self.prefix}lock:{key[len(self.prefix):]}"
+        token = uuid.uuid4().hex
+        try:
+            owns_lock = bool(self.redis.set(lock_key, token, nx=True, ex=int(self.lock_timeout)))
+        except Exception as e:
+            logger.warning(f"Error al tomar lock de caché: {e}")
+            owns_lock = False
+        
+        try:
+            shared = None if owns_lock else self._wait_for_result(key, lock_key)
+            yield shared
+        finally:
+            if owns_lock:
+                try:
+                    self._release_lock(keys=[lock_key], args=[token])
+                except Exception as e:
+                    logger.warning(f"Error al liberar lock de caché: {e}")
+            with self._flights_lock:
+                self._flights.pop(key, None)
+            event.set()
+    
+    def _safe_read(self, key: str) -> Optional[str]:
+        try:
+            return self._read(key)
+        except Exception as e:
+            logger.warning(f"Error al obtener del caché: {e}")
+            return None
+    
+    def _wait_for_result(self, key: str, lock_key: str) -> Optional[str]:
+        """Espera a que otro worker termine de generar la respuesta (polling con backoff)."""
+        deadline = time.monotonic() + self.lock_timeout
+        delay = 0.05
+        try:
+            while time.monotonic() < deadline:
+                time.sleep(delay)
+                value = self._read(key)
+                if value is not None:
+                    logger.info("🤝 Respuesta compartida por una generación en curso")
+                    return value
+                if not self.redis.exists(lock_key):
+                    # El líder terminó sin guardar (error o baja calidad)
+                    return None
+                delay = min(delay * 2, 0.5)
+        except Exception as e:
+            logger.warning(f"Error esperando generación en curso: {e}")
+        return None
+    
+    def invalidate_tags(
+        self,
+        workspace_ids: Iterable[str] = (),
+        document_ids: Iterable[str] = ()
+    ) -> int:
+        """
+        Invalida las respuestas ligadas a los workspaces/documentos indicados.
+        Se llama al eliminar un documento o al terminar de procesar uno nuevo.
+        
+        Returns:
+            Número de entradas eliminadas
+        """
+        removed = 0
+        try:
+            for tag in self._tag_keys(workspace_ids, document_ids):
+                keys = [k for k in self.redis.sscan_iter(tag, count=self.BATCH_SIZE)]
+                if keys:
+                    removed += self._unlink(keys)
+                self.redis.unlink(tag)
+            if removed:
+                self.redis.hincrby(self.stats_key, "invalidated", removed)
+                logger.info(f"🗑️ Invalidadas {removed} entradas de caché por cambios en documentos")
+        except Exception as e:
+            logger.warning(f"Error al invalidar caché por tags: {e}")
+        return removed
+    
     def invalidate_pattern(self, pattern: str):
         """
         Invalida todas las claves que coincidan con el patrón.
-        Útil para invalidar caché cuando se actualiza un documento.
+        Recorre el keyspace con SCAN (no bloquea Redis); para invalidar por
+        workspace o documento usar invalidate_tags.
         """
         try:
-            keys = self.redis.keys(f"{self.prefix}{pattern}*")
-            if keys:
-                self.redis.delete(*keys)
-                logger.info(f"🗑️ Invalidadas {len(keys)} entradas de caché")
+            batch, removed = [], 0
+            for key in self.redis.scan_iter(match=f"{self.prefix}{pattern}*", count=self.BATCH_SIZE):
+                batch.append(key)
+                if len(batch) >= self.BATCH_SIZE:
+                    removed += self._unlink(batch)
+                    batch = []
+            if batch:
+                removed += self._unlink(batch)
+            if removed:
+                logger.info(f"🗑️ Invalidadas {removed} entradas de caché")
         except Exception as e:
             logger.warning(f"Error al invalidar caché: {e}")
     
     def clear_all(self):
-        """Limpia todo el caché LLM."""
+        """Limpia todo el caché LLM (entradas, tags, índice y contadores)."""
         try:
-            keys = self.redis.keys(f"{self.prefix}*")
-            if keys:
-                self.redis.delete(*keys)
-                logger.info(f"🗑️ Caché LLM limpiado ({len(keys)} entradas)")
+            if self.local is not None:
+                self.local.clear()
+            batch, removed = [], 0
+            for key in self.redis.scan_iter(match=f"{self.prefix}*", count=self.BATCH_SIZE):
+                batch.append(key)
+                if len(batch) >= self.BATCH_SIZE:
+                    removed += self.redis.unlink(*batch)
+                    batch = []
+            if batch:
+                removed += self.redis.unlink(*batch)
+            removed += self.redis.unlink(self.index_key, self.stats_key)
+            logger.info(f"🗑️ Caché LLM limpiado ({removed} claves)")
         except Exception as e:
             logger.warning(f"Error al limpiar caché: {e}")
     
     def get_stats(self) -> dict:
-        """Obtiene estadísticas del caché."""
+        """
+        Obtiene estadísticas del caché.
+        
+        Las entradas vigentes salen del índice (ZCARD tras purgar las expiradas) y
+        la memoria se estima con el tamaño medio de las respuestas guardadas; no se
+        recorre el keyspace.
+        """
         try:
-            keys = self.redis.keys(f"{self.prefix}*")
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.zremrangebyscore(self.index_key, "-inf", time.time())
+            pipe.zcard(self.index_key)
+            pipe.hgetall(self.stats_key)
+            _, entries, raw_counters = pipe.execute()
+            
+            counters = {k.decode() if isinstance(k, bytes) else k: int(v) for k, v in raw_counters.items()}
+            sets = counters.get("sets", 0)
+            avg_bytes = counters.get("bytes_written", 0) / sets if sets else 0
+            hits = counters.get("hits", 0)
+            lookups = hits + counters.get("misses", 0)
             return {
-                "total_entries": len(keys),
-                "estimated_memory_kb": sum(self.redis.memory_usage(k) or 0 for k in keys) / 1024
+                "total_entries": entries,
+                "estimated_memory_kb": round(entries * avg_bytes / 1024, 2),
+                "hits": hits,
+                "misses": counters.get("misses", 0),
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                "invalidated": counters.get("invalidated", 0),
+                # Nivel en memoria de este proceso
+                "local_entries": len(self.local) if self.local is not None else 0,
+                "local_memory_kb": round(self.local.size / 1024, 2) if self.local is not None else 0,
+                "local_hits": self.local.hits if self.local is not None else 0
             }
         except Exception as e:
             logger.warning(f"Error al obtener stats: {e}")
             return {"total_entries": 0, "estimated_memory_kb": 0}
 
 
+def invalidate_documents(workspace_id: Optional[str] = None, document_ids: Iterable[str] = ()) -> int:
+    """Invalida las respuestas cacheadas de un workspace y/o documentos (si hay caché)."""
+    cache = get_llm_cache()
+    if not cache:
+        return 0
+    return cache.invalidate_tags([workspace_id] if workspace_id else (), document_ids)
+
+
 # Instancia global
 _cache_instance: Optional[LLMCache] = None
 
@@ -114,7 +475,14 @@ def get_llm_cache() -> Optional[LLMCache]:
         try:
             import redis
             redis_client = redis.from_url(settings.REDIS_URL, decode_responses=False)
-            _cache_instance = LLMCache(redis_client, ttl=3600)  # 1 hora
+            _cache_instance = LLMCache(
+                redis_client,
+                ttl=settings.LLM_CACHE_TTL_SECONDS,
+                local_max_bytes=settings.LLM_CACHE_LOCAL_MAX_MB * 1024 * 1024,
+                local_ttl=settings.LLM_CACHE_LOCAL_TTL_SECONDS,
+                compress_min_bytes=settings.LLM_CACHE_COMPRESS_MIN_BYTES,
+                lock_timeout=settings.LLM_CACHE_LOCK_TIMEOUT_SECONDS
+            )
             logger.info("✅ LLM Cache inicializado")
         except Exception as e:
             logger.warning(f"No se pudo inicializar caché LLM: {e}")
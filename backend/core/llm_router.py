@@ -1,18 +1,33 @@
 """
-Router Inteligente de LLMs (Solo OpenAI).
+Router Inteligente de LLMs.
 
 Selecciona el mejor modelo según la tarea:
 - ANALIZAR: GPT-4o-mini (Económico y potente para lectura masiva)
 - CREAR: GPT-4o-mini (Mayor calidad de escritura y razonamiento)
 - RESPONDER/GENERAL: GPT-4o-mini (Rápido y eficiente para chat)
+
+Además mantiene la salud de cada proveedor (latencia EWMA del primer token,
+tasa de error y circuit breaker) y ordena la cadena de proveedores de cada
+tarea para que llm_service pueda hacer failover.
 """
 
 from enum import Enum
-from typing import Tuple
+from typing import Dict, List, Optional, Tuple
 import logging
+import threading
+import time
+
+from core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Cadena por defecto (orden de preferencia) de proveedores por tarea.
+# Gemini Flash es el principal; OpenAI GPT-4o-mini es el fallback.
+DEFAULT_PROVIDER_CHAIN = ["gemini_flash", "openai_gpt4o_mini"]
+
+# Latencia asumida para proveedores sin muestras (segundos)
+_DEFAULT_LATENCY = 1.0
+
 
 class TaskType(Enum):
     """Tipos de tareas que el sistema puede realizar."""
@@ -20,6 +35,48 @@ class TaskType(Enum):
     CREATE = "create"        # Generar documentos, propuestas -> GPT-4o-mini
     RESPOND = "respond"      # Chat general, Q&A simple -> GPT-4o-mini
     GENERAL = "general"      # Default -> GPT-4o-mini
+    CLASSIFY = "classify"    # Clasificación de intención (respuesta corta, prioriza latencia)
+
+
+class ProviderHealth:
+    """
+    Salud de un proveedor: latencia EWMA, tasa de error EWMA y circuit breaker.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.ewma_latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.last_failure_at = 0.0
+        self.total_requests = 0
+        self.total_failures = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def is_available(self) -> bool:
+        return time.time() >= self.open_until
+
+    def score(self, priority: int) -> float:
+        """Menor es mejor: latencia penalizada por errores y por posición en la cadena."""
+        latency = self.ewma_latency if self.ewma_latency is not None else _DEFAULT_LATENCY
+        # La penalización por errores se reduce a la mitad cada cooldown sin fallos,
+        # así un provider degradado vuelve a recibir tráfico y se re-evalúa.
+        elapsed = time.time() - self.last_failure_at
+        error_rate = self.error_rate * 0.5 ** (elapsed / max(settings.LLM_CIRCUIT_COOLDOWN_SECONDS, 1.0))
+        return latency * (1 + 4 * error_rate) * (1 + 0.25 * priority)
+
+    def to_dict(self) -> dict:
+        return {
+            "available": self.is_available,
+            "ewma_latency_sec": round(self.ewma_latency, 3) if self.ewma_latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "consecutive_failures": self.consecutive_failures,
+            "total_requests": self.total_requests,
+            "total_failures": self.total_failures,
+            "last_error": self.last_error,
+        }
 
 
 class LLMRouter:
@@ -34,9 +91,86 @@ class LLMRouter:
             TaskType.CREATE: "gpt4o_mini",      # Mejor modelo para generación
             TaskType.RESPOND: "gpt4o_mini",   # Rápido para chat
             TaskType.GENERAL: "gpt4o_mini",
+            TaskType.CLASSIFY: "gpt4o_mini",
         }
+        self._health: Dict[str, ProviderHealth] = {}
+        self._lock = threading.Lock()
         logger.info("LLM Router inicializado: GPT-4o-mini para todas las tareas")
     
+    # ------------------------------------------------------------------
+    # Routing por salud / latencia
+    # ------------------------------------------------------------------
+    
+    def get_chain(self, task_type: Optional[TaskType] = None) -> List[str]:
+        """Cadena configurada de proveedores para la tarea (LLM_TASK_ROUTING o default)."""
+        task_type = task_type or TaskType.GENERAL
+        return list(settings.LLM_TASK_ROUTING.get(task_type.value, DEFAULT_PROVIDER_CHAIN))
+    
+    def order_providers(self, names: List[str]) -> List[str]:
+        """
+        Ordena proveedores: primero los de circuito cerrado por score
+        (latencia + errores + preferencia), al final los que están en cooldown.
+        Nunca descarta ninguno: si todos fallan, igual se intentan.
+        """
+        names = list(dict.fromkeys(names))  # Quitar duplicados conservando orden
+        with self._lock:
+            healths = {name: self._get_health(name) for name in names}
+            available = [n for n in names if healths[n].is_available]
+            cooling = [n for n in names if not healths[n].is_available]
+            available.sort(key=lambda n: healths[n].score(names.index(n)))
+        return available + cooling
+    
+    def record_success(self, name: str, latency: float):
+        """Registra una llamada exitosa (latency = tiempo hasta el primer token o respuesta)."""
+        alpha = settings.LLM_HEALTH_EWMA_ALPHA
+        with self._lock:
+            health = self._get_health(name)
+            health.total_requests += 1
+            health.consecutive_failures = 0
+            health.open_until = 0.0
+            health.error_rate = (1 - alpha) * health.error_rate
+            if health.ewma_latency is None:
+                health.ewma_latency = latency
+            else:
+                health.ewma_latency = alpha * latency + (1 - alpha) * health.ewma_latency
+    
+    def record_failure(self, name: str, error: Exception):
+        """Registra un fallo (error o TTFT excedido) y abre el circuito si corresponde."""
+        alpha = settings.LLM_HEALTH_EWMA_ALPHA
+        with self._lock:
+            health = self._get_health(name)
+            health.total_requests += 1
+            health.total_failures += 1
+            health.consecutive_failures += 1
+            health.last_failure_at = time.time()
+            health.error_rate = alpha + (1 - alpha) * health.error_rate
+            health.last_error = f"{error.__class__.__name__}: {str(error)[:200]}"
+            
+            # Rate limit: sacar de rotación de inmediato
+            if (self._is_rate_limit(error)
+                    or health.consecutive_failures >= settings.LLM_CIRCUIT_FAILURE_THRESHOLD):
+                health.open_until = time.time() + settings.LLM_CIRCUIT_COOLDOWN_SECONDS
+                logger.warning(
+                    f"🔌 Circuito abierto para {name} por {settings.LLM_CIRCUIT_COOLDOWN_SECONDS}s "
+                    f"({health.last_error})"
+                )
+    
+    def get_health(self) -> Dict[str, dict]:
+        """Estado de salud de todos los proveedores observados."""
+        with self._lock:
+            return {name: health.to_dict() for name, health in self._health.items()}
+    
+    def _get_health(self, name: str) -> ProviderHealth:
+        health = self._health.get(name)
+        if health is None:
+            health = self._health[name] = ProviderHealth(name)
+        return health
+    
+    @staticmethod
+    def _is_rate_limit(error: Exception) -> bool:
+        text = f"{error.__class__.__name__} {error}".lower()
+        return any(k in text for k in ("429", "rate limit", "ratelimit", "resourceexhausted", "resource exhausted", "quota"))
+    
     def route(
         self, 
         query: str, 
@@ -5,7 +5,7 @@ Provides a unified interface to OpenAI LLM backend.
 Sistema LLM:
 - OpenAI GPT-4o-mini: Para todas las tareas
 """
-from typing import List, Generator
+from typing import Callable, List, Generator, Optional, Tuple
 from core.config import settings
 from core.providers import LLMProvider, OpenAIProvider
 from core.llm_router import LLMRouter, TaskType
@@ -13,6 +13,7 @@ from models.schemas import DocumentChunk
 from core.llm_cache import get_llm_cache
 from core.llm_validators import ResponseValidator, get_metrics
 import logging
+import threading
 import time
 
 logger = logging.getLogger(__name__)
@@ -22,6 +23,8 @@ _providers = {}
 _router = None
 _cache = None
 
+_EMPTY = object()
+
 
 def initialize_providers():
     """
@@ -79,48 +82,144 @@ def initialize_providers():
     logger.info(f"Sistema LLM listo con {len(_providers)} providers")
 
 
-def get_provider(model_name: str = None, task_type: str = None) -> LLMProvider:
+def _canonical_name(provider: LLMProvider) -> str:
+    """Nombre principal de un provider (los alias apuntan a la misma instancia)."""
+    return next(name for name, p in _providers.items() if p is provider)
+
+
+def _get_candidates(model_name: str = None, task_type=None) -> List[Tuple[str, LLMProvider]]:
     """
-    Obtiene el provider apropiado.
-    Prioridad: Gemini Flash > GPT-4o-mini
+    Providers a intentar, en orden, para una tarea.
     
-    Args:
-        model_name: Nombre específico del modelo (opcional)
-        task_type: Tipo de tarea (opcional)
-        
-    Returns:
-        LLMProvider instance
+    El modelo solicitado explícitamente va primero; el resto de la cadena de la
+    tarea queda como failover, ordenada por el router según salud y latencia.
     """
     if not _providers:
         initialize_providers()
     
-    # 1. Si se especifica modelo por nombre
+    if isinstance(task_type, str):
+        task_type = TaskType(task_type)
+    
+    names = [n for n in _router.order_providers(_router.get_chain(task_type)) if n in _providers]
     if model_name and model_name in _providers:
         logger.info(f"🎯 Usando modelo solicitado: {model_name}")
-        return _providers[model_name]
+        names.insert(0, model_name)
     
-    # 2. Priorizar Gemini Flash
-    if "gemini_flash" in _providers:
-        return _providers["gemini_flash"]
+    candidates = []
+    for name in names:
+        provider = _providers[name]
+        if any(provider is p for _, p in candidates):
+            continue
+        candidates.append((_canonical_name(provider), provider))
     
-    # 3. Fallback a GPT-4o-mini
-    return _providers.get("gpt4o_mini")
-    
-    # 3. Fallback si el preferido no está disponible
-    if not provider and _providers:
+    # Fallback si ningún provider de la cadena está disponible
+    if not candidates and _providers:
         provider = next(iter(_providers.values()))
         logger.warning(f"⚠️ Usando fallback provider: {provider.model_name if hasattr(provider, 'model_name') else 'unknown'}")
-
+        candidates.append((_canonical_name(provider), provider))
     
-    if not provider:
+    if not candidates:
         error_msg = "No LLM provider available. Please check your OPENAI_API_KEY in .env or token.txt"
         logger.error(f"❌ {error_msg}")
         raise RuntimeError(error_msg)
+    
+    return candidates
+
+
+def get_provider(model_name: str = None, task_type: str = None) -> LLMProvider:
+    """
+    Obtiene el provider apropiado.
+    Prioridad: modelo solicitado > cadena de la tarea ordenada por salud (Gemini Flash > GPT-4o-mini)
+    
+    Args:
+        model_name: Nombre específico del modelo (opcional)
+        task_type: Tipo de tarea (opcional)
         
-    return provider
+    Returns:
+        LLMProvider instance
+    """
+    return _get_candidates(model_name, task_type)[0][1]
+
+
+def get_provider_health() -> dict:
+    """Salud de los providers (latencia EWMA, error rate, circuito)."""
+    return _router.get_health() if _router else {}
+
+
+def _call_with_failover(candidates: List[Tuple[str, LLMProvider]], call: Callable[[LLMProvider], str]) -> Tuple[str, LLMProvider, str]:
+    """Ejecuta la llamada en el primer provider que responda sin error."""
+    last_error = None
+    for name, provider in candidates:
+        start = time.time()
+        try:
+            result = call(provider)
+        except Exception as e:
+            _router.record_failure(name, e)
+            logger.warning(f"⚠️ Provider {name} falló ({e}), probando el siguiente...")
+            last_error = e
+            continue
+        _router.record_success(name, time.time() - start)
+        return name, provider, result
+    raise last_error
+
+
+def _next_with_deadline(stream: Generator[str, None, None], timeout: float):
+    """
+    Obtiene el primer fragmento del stream o lanza TimeoutError si no llega a tiempo.
+
+    Cada espera usa su propio hilo (vive solo hasta el primer token): con un
+    pool compartido, los streams lentos o colgados ocupaban todos los hilos y
+    las esperas de los demás agotaban el deadline en cola.
+    """
+    result = {}
+    done = threading.Event()
+    lock = threading.Lock()
+
+    def fetch():
+        try:
+            result["value"] = next(stream, _EMPTY)
+        except BaseException as e:
+            result["error"] = e
+        with lock:
+            done.set()
+            abandoned = result.get("abandoned", False)
+        if abandoned:
+            # Un generador en ejecución no se puede cerrar desde otro hilo:
+            # se cierra cuando next() retorne (cierra la conexión upstream).
+            _close_quietly(stream)
+
+    threading.Thread(target=fetch, name="llm-ttft", daemon=True).start()
+    if not done.wait(timeout):
+        with lock:
+            if not done.is_set():
+                result["abandoned"] = True
+                raise TimeoutError(f"Sin primer token tras {timeout}s")
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+def _close_quietly(stream: Generator[str, None, None]):
+    try:
+        stream.close()
+    except Exception as e:
+        logger.debug(f"Error cerrando stream abandonado: {e}")
+
 
+def build_system_prompt(task_prompt: str, workspace_instructions: Optional[str] = None) -> str:
+    """
+    Construye el prefijo estable de una tarea (plantilla + instrucciones del workspace).
 
-def generate_response(query: str, context_chunks: List[DocumentChunk], model_override: str = None, chat_history: List[dict] = None, use_cache: bool = True) -> str:
+    No debe incluir la pregunta del usuario ni el contexto: al mantenerse idéntico
+    entre requests, OpenAI/Gemini pueden reutilizarlo desde su caché de prefijos.
+    """
+    parts = [task_prompt.strip()]
+    if workspace_instructions:
+        parts.append(f"=== INSTRUCCIONES DEL WORKSPACE ===\n{workspace_instructions.strip()}")
+    return "\n\n".join(parts)
+
+
+def generate_response(query: str, context_chunks: List[DocumentChunk], model_override: str = None, chat_history: List[dict] = None, use_cache: bool = True, system_prompt: str = None, task_type: TaskType = None, workspace_id: str = None) -> str:
     """
     Genera una respuesta usando el LLM apropiado con caché automático y validaciones.
     
@@ -130,6 +229,10 @@ def generate_response(query: str, context_chunks: List[DocumentChunk], model_ove
         model_override: Modelo específico a usar (opcional)
         chat_history: Historial de chat (opcional)
         use_cache: Si True, intenta usar caché (default: True)
+        system_prompt: Instrucciones estables de la tarea (opcional, ver build_system_prompt)
+        task_type: Tipo de tarea para elegir la cadena de providers (opcional)
+        workspace_id: Workspace del que depende la respuesta; la entrada de caché
+            se invalida cuando cambian sus documentos (opcional)
         
     Returns:
         Respuesta generada y validada
@@ -137,18 +240,27 @@ def generate_response(query: str, context_chunks: List[DocumentChunk], model_ove
     global _cache
     
     start_time = time.time()
-    was_cached = False
     metrics = get_metrics()
-    validator = ResponseValidator()
     
     # Intentar obtener del caché
     if use_cache and _cache:
         context_texts = [chunk.chunk_text[:200] for chunk in context_chunks]  # Primeros 200 chars
+        if system_prompt:
+            context_texts.append(system_prompt)
         model_name = model_override or "gpt4o_mini"
         
         cached_response = _cache.get(query, context_texts, model_name)
+        if not cached_response:
+            # Single-flight: si la misma consulta ya se está generando (en este
+            # u otro worker) se espera su resultado en lugar de llamar al LLM otra vez
+            with _cache.single_flight(query, context_texts, model_name) as shared:
+                if shared is None:
+                    return _generate_validated(
+                        query, context_chunks, model_override, chat_history,
+                        use_cache, system_prompt, task_type, workspace_id, start_time
+                    )
+                cached_response = shared
         if cached_response:
-            was_cached = True
             response_time = time.time() - start_time
             
             # Registrar métricas
@@ -162,9 +274,26 @@ def generate_response(query: str, context_chunks: List[DocumentChunk], model_ove
             
             return cached_response
     
-    # Generar respuesta
-    provider = get_provider(model_name=model_override)
-    response = provider.generate_response(query, context_chunks, chat_history=chat_history)
+    return _generate_validated(
+        query, context_chunks, model_override, chat_history,
+        use_cache, system_prompt, task_type, workspace_id, start_time
+    )
+
+
+def _generate_validated(query: str, context_chunks: List[DocumentChunk], model_override: Optional[str], chat_history: Optional[List[dict]], use_cache: bool, system_prompt: Optional[str], task_type: Optional[TaskType], workspace_id: Optional[str], start_time: float) -> str:
+    """Llama al LLM (con failover), valida la respuesta y la guarda en caché si es aceptable."""
+    was_cached = False
+    metrics = get_metrics()
+    validator = ResponseValidator()
+    
+    # Generar respuesta (con failover entre providers)
+    usage = {}
+    provider_name, provider, response = _call_with_failover(
+        _get_candidates(model_override, task_type),
+        lambda p: p.generate_response(
+            query, context_chunks, chat_history=chat_history, system_prompt=system_prompt, usage=usage
+        )
+    )
     
     response_time = time.time() - start_time
     
@@ -178,7 +307,12 @@ def generate_response(query: str, context_chunks: List[DocumentChunk], model_ove
         # Si es un problema técnico, reintentar UNA vez
         if validator.should_retry(validation):
             logger.info("🔄 Reintentando generación...")
-            response = provider.generate_response(query, context_chunks, chat_history=chat_history)
+            # Los tokens del primer intento también se pagan
+            metrics.record_token_usage(usage, provider=provider_name)
+            usage = {}
+            response = provider.generate_response(
+                query, context_chunks, chat_history=chat_history, system_prompt=system_prompt, usage=usage
+            )
             validation = validator.validate_response(query, response, context_chunks)
     
     # Log de calidad
@@ -190,8 +324,14 @@ def generate_response(query: str, context_chunks: List[DocumentChunk], model_ove
     # Guardar en caché solo si es de calidad aceptable
     if use_cache and _cache and response and validation['quality_score'] >= 0.6:
         context_texts = [chunk.chunk_text[:200] for chunk in context_chunks]
+        if system_prompt:
+            context_texts.append(system_prompt)
         model_name = model_override or "gpt4o_mini"
-        _cache.set(query, context_texts, model_name, response)
+        _cache.set(
+            query, context_texts, model_name, response,
+            workspace_id=workspace_id,
+            document_ids=[chunk.document_id for chunk in context_chunks]
+        )
     
     # Registrar métricas
     metrics.record_request(
@@ -201,6 +341,9 @@ def generate_response(query: str, context_chunks: List[DocumentChunk], model_ove
         response_time=response_time,
         was_cached=was_cached
     )
+    task_label = task_type.value if isinstance(task_type, TaskType) else task_type
+    metrics.record_latency("total", response_time, provider=provider_name, task=task_label)
+    metrics.record_token_usage(usage, provider=provider_name)
     
     # Log stats cada 10 requests
     if metrics.requests_count % 10 == 0:
@@ -209,18 +352,64 @@ def generate_response(query: str, context_chunks: List[DocumentChunk], model_ove
     return response
 
 
-def generate_response_stream(query: str, context_chunks: List[DocumentChunk], model_override: str = None, chat_history: List[dict] = None) -> Generator[str, None, None]:
+def generate_response_stream(query: str, context_chunks: List[DocumentChunk], model_override: str = None, chat_history: List[dict] = None, system_prompt: str = None, task_type: TaskType = None) -> Generator[str, None, None]:
     """
     Genera una respuesta en streaming usando el LLM apropiado.
     
+    Si un provider falla o no entrega el primer token antes de
+    LLM_TTFT_DEADLINE_SECONDS, se pasa al siguiente de la cadena. Una vez
+    enviado el primer token ya no hay failover (el cliente ya recibió texto).
+    
     Args:
         query: Pregunta del usuario
         context_chunks: Documentos relevantes del RAG
         model_override: Modelo específico a usar (opcional)
         chat_history: Historial de chat (opcional)
+        system_prompt: Instrucciones estables de la tarea (opcional, ver build_system_prompt)
+        task_type: Tipo de tarea para elegir la cadena de providers (opcional)
         
     Yields:
         Fragmentos de la respuesta
     """
-    provider = get_provider(model_name=model_override)
-    return provider.generate_response_stream(query, context_chunks, chat_history=chat_history)
+    candidates = _get_candidates(model_override, task_type)
+    return _stream_with_failover(
+        candidates,
+        lambda p, usage: p.generate_response_stream(
+            query, context_chunks, chat_history=chat_history, system_prompt=system_prompt, usage=usage
+        ),
+        task_type.value if isinstance(task_type, TaskType) else task_type
+    )
+
+
+def _stream_with_failover(
+    candidates: List[Tuple[str, LLMProvider]],
+    open_stream: Callable[[LLMProvider, dict], Generator[str, None, None]],
+    task_label: Optional[str] = None
+) -> Generator[str, None, None]:
+    """Reenvía el stream del primer provider que entregue su primer token a tiempo."""
+    metrics = get_metrics()
+    metrics.record_stream()
+    last_error = None
+    for name, provider in candidates:
+        usage = {}
+        start = time.time()
+        stream = open_stream(provider, usage)
+        try:
+            first = _next_with_deadline(stream, settings.LLM_TTFT_DEADLINE_SECONDS)
+        except Exception as e:
+            _router.record_failure(name, e)
+            logger.warning(f"⚠️ Provider {name} falló antes del primer token ({e}), probando el siguiente...")
+            last_error = e
+            continue
+        
+        ttft = time.time() - start
+        _router.record_success(name, ttft)
+        metrics.record_latency("ttft", ttft, provider=name, task=task_label)
+        if first is not _EMPTY:
+            yield first
+            yield from stream
+        metrics.record_latency("total", time.time() - start, provider=name, task=task_label)
+        metrics.record_token_usage(usage, provider=name)
+        return
+    
+    raise RuntimeError(f"Ningún provider LLM pudo responder: {last_error}") from last_error
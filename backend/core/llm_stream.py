@@ -0,0 +1,193 @@
+"""
+Relay de streams LLM hacia respuestas HTTP en streaming.
+
+Los proveedores (OpenAI/Gemini) exponen generadores síncronos. Iterarlos
+directamente dentro de un StreamingResponse bloquea el event loop y, si el
+cliente se desconecta (botón "stop", cambio de página), el generador sigue
+consumiendo y pagando tokens hasta el final.
+
+LLMStreamRelay consume el generador del proveedor en un hilo propio, reenvía
+los fragmentos al event loop y, cuando el cliente se va, cierra el generador
+(lo que cierra la conexión HTTP con el proveedor).
+
+Además agrupa los tokens (coalescing): el primero se envía de inmediato y el
+resto se acumula hasta STREAM_COALESCE_WINDOW_MS o STREAM_COALESCE_MAX_BYTES,
+reduciendo los frames NDJSON (CPU en backend/nginx y re-renders del frontend).
+"""
+import asyncio
+import logging
+import threading
+from typing import AsyncGenerator, Iterable, Optional
+
+from starlette.requests import Request
+
+from core.config import settings
+from core.llm_validators import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# Marca de fin del stream
+_DONE = object()
+
+
+class _StreamError:
+    """Envuelve una excepción del proveedor para re-lanzarla en el event loop."""
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+class LLMStreamRelay:
+    """
+    Reenvía un stream síncrono del proveedor como async iterator.
+
+    Uso:
+        relay = LLMStreamRelay(response_stream, request)
+        async for token in relay:
+            ...
+        relay.text       -> texto acumulado (completo o parcial)
+        relay.completed  -> el proveedor terminó normalmente
+        relay.aborted    -> el cliente se desconectó antes del final
+
+    Con coalesce=None se usa STREAM_COALESCE_ENABLED. Si se indica intent, se
+    registran TTFT y tiempo total percibidos por el cliente con esa etiqueta.
+    """
+
+    def __init__(
+        self,
+        stream: Iterable[str],
+        request: Optional[Request] = None,
+        coalesce: Optional[bool] = None,
+        intent: Optional[str] = None
+    ):
+        self._stream = stream
+        self._request = request
+        self._coalesce = settings.STREAM_COALESCE_ENABLED if coalesce is None else coalesce
+        self._intent = intent
+        self._stop = threading.Event()
+        self._failed = False
+        self.text = ""
+        self.completed = False
+        self.aborted = False
+
+    def _produce(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue) -> None:
+        """Consume el generador del proveedor (hilo dedicado)."""
+
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                # El event loop ya se cerró
+                self._stop.set()
+
+        iterator = iter(self._stream)
+        try:
+            for token in iterator:
+                if self._stop.is_set():
+                    break
+                put(token)
+        except Exception as e:
+            put(_StreamError(e))
+        finally:
+            # Cerrar el generador desde su propio hilo: propaga GeneratorExit
+            # hasta el proveedor, que cierra la conexión upstream.
+            close = getattr(iterator, "close", None)
+            if close:
+                try:
+                    close()
+                except Exception as e:
+                    logger.debug(f"Error cerrando stream del proveedor: {e}")
+            put(_DONE)
+
+    async def _client_disconnected(self) -> bool:
+        if self._request is None:
+            return False
+        try:
+            return await self._request.is_disconnected()
+        except Exception:
+            return False
+
+    async def __aiter__(self) -> AsyncGenerator[str, None]:
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        interval = settings.STREAM_DISCONNECT_CHECK_INTERVAL
+
+        producer = threading.Thread(
+            target=self._produce,
+            args=(loop, queue),
+            name="llm-stream-relay",
+            daemon=True,
+        )
+        producer.start()
+
+        window = settings.STREAM_COALESCE_WINDOW_MS / 1000
+        max_bytes = settings.STREAM_COALESCE_MAX_BYTES
+        buffer = []
+        buffered_bytes = 0
+        flush_at = None
+        first_token = True
+
+        started_at = loop.time()
+        last_check = started_at
+        try:
+            while True:
+                timeout = interval
+                if flush_at is not None:
+                    timeout = max(0.0, min(interval, flush_at - loop.time()))
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    item = None
+
+                if item is _DONE:
+                    self.completed = not self._stop.is_set()
+                    break
+                if isinstance(item, _StreamError):
+                    self._failed = True
+                    if buffer:
+                        yield "".join(buffer)
+                    raise item.error
+
+                # Chequeo periódico de desconexión (también con tráfico continuo)
+                if item is None or loop.time() - last_check >= interval:
+                    last_check = loop.time()
+                    if await self._client_disconnected():
+                        break
+
+                if item is not None:
+                    self.text += item
+                    # El primer token sale de inmediato (time-to-first-token)
+                    if first_token or not self._coalesce:
+                        if first_token and self._intent:
+                            get_metrics().record_latency(
+                                "ttft", loop.time() - started_at, intent=self._intent
+                            )
+                        first_token = False
+                        yield item
+                        continue
+                    buffer.append(item)
+                    buffered_bytes += len(item.encode("utf-8"))
+                    if flush_at is None:
+                        flush_at = loop.time() + window
+
+                if buffer and (buffered_bytes >= max_bytes or loop.time() >= flush_at):
+                    yield "".join(buffer)
+                    buffer = []
+                    buffered_bytes = 0
+                    flush_at = None
+
+            if buffer and self.completed:
+                yield "".join(buffer)
+            if self.completed and self._intent:
+                get_metrics().record_latency("total", loop.time() - started_at, intent=self._intent)
+        finally:
+            # Cualquier salida que no sea fin normal o error del proveedor
+            # (desconexión, CancelledError, GeneratorExit) cuenta como abortada.
+            self._stop.set()
+            if not self.completed and not self._failed:
+                self.aborted = True
+                get_metrics().record_stream_aborted(self.text)
+                logger.info(
+                    f"✋ Stream LLM cancelado por desconexión del cliente "
+                    f"({len(self.text)} caracteres enviados)"
+                )
@@ -2,26 +2,111 @@
 Validaciones y métricas para el servicio LLM.
 Monitorea calidad de respuestas y detecta problemas.
 """
+import bisect
 import logging
+import threading
 import time
 from typing import List, Dict, Optional
 from models.schemas import DocumentChunk
+from core import prometheus_metrics
 import re
 
 logger = logging.getLogger(__name__)
 
 
+# Precios GPT-4o-mini por 1M tokens (referencia para estimar costos)
+_PRICE_INPUT_PER_M = 0.15
+_PRICE_CACHED_INPUT_PER_M = 0.075
+_PRICE_OUTPUT_PER_M = 0.60
+
+
+def _log_buckets(start: float, stop: float, growth: float) -> List[float]:
+    """Límites superiores de buckets con crecimiento geométrico."""
+    bounds = []
+    bound = start
+    while bound < stop:
+        bounds.append(round(bound, 4))
+        bound *= growth
+    return bounds
+
+
+class LatencyHistogram:
+    """
+    Histograma de latencias con buckets logarítmicos fijos.
+    
+    Memoria constante sin importar el uptime; los percentiles se estiman con
+    interpolación lineal dentro del bucket (error relativo < 20%).
+    """
+    
+    _BOUNDS = _log_buckets(start=0.005, stop=600.0, growth=1.2)  # 5ms .. ~10 min
+    
+    def __init__(self):
+        self.counts = [0] * (len(self._BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+    
+    def record(self, value: float):
+        self.counts[bisect.bisect_left(self._BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+    
+    def percentile(self, p: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                if i >= len(self._BOUNDS):
+                    return self.max
+                lower = self._BOUNDS[i - 1] if i > 0 else 0.0
+                upper = min(self._BOUNDS[i], self.max)
+                fraction = (rank - seen) / bucket_count
+                return lower + (upper - lower) * fraction
+            seen += bucket_count
+        return self.max
+    
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+    
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "avg_sec": round(self.mean, 3),
+            "p50_sec": round(self.percentile(50), 3),
+            "p95_sec": round(self.percentile(95), 3),
+            "p99_sec": round(self.percentile(99), 3),
+            "max_sec": round(self.max, 3),
+        }
+
+
 class LLMMetrics:
     """Recolector de métricas de LLM."""
     
     def __init__(self):
+        self._lock = threading.Lock()
         self.requests_count = 0
+        self.stream_requests = 0
         self.cache_hits = 0
         self.cache_misses = 0
         self.total_tokens = 0
         self.total_cost = 0.0
         self.average_response_time = 0.0
-        self._response_times = []
+        self._response_times = LatencyHistogram()
+        # Latencias etiquetadas: {("ttft"|"total", (("provider", x), ("task", y))): LatencyHistogram}
+        self._latencies: Dict[tuple, LatencyHistogram] = {}
+        # Tokens por provider
+        self._tokens_by_provider: Dict[str, Dict[str, int]] = {}
+        # Prompt caching del proveedor (prefijo estable reutilizado)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_prompt_tokens = 0
+        # Streams cortados porque el cliente se desconectó
+        self.aborted_streams = 0
+        self.aborted_tokens = 0
     
     def record_request(
         self, 
@@ -33,35 +118,112 @@ class LLMMetrics:
         tokens_used: Optional[int] = None
     ):
         """Registra una petición LLM."""
-        self.requests_count += 1
-        
-        if was_cached:
-            self.cache_hits += 1
-        else:
-            self.cache_misses += 1
+        with self._lock:
+            self.requests_count += 1
+            
+            if was_cached:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+            prometheus_metrics.LLM_CACHE_REQUESTS.labels(result="hit" if was_cached else "miss").inc()
+            
+            self._response_times.record(response_time)
+            self.average_response_time = self._response_times.mean
+            
+            if tokens_used:
+                self.total_tokens += tokens_used
+                # Sin desglose input/output: precio promedio
+                estimated_cost = (tokens_used / 1_000_000) * 0.375
+                self.total_cost += estimated_cost
+    
+    def record_stream(self):
+        """Registra una petición en streaming (no pasa por el caché)."""
+        with self._lock:
+            self.stream_requests += 1
+    
+    def record_latency(self, kind: str, seconds: float, **labels):
+        """
+        Registra una latencia etiquetada.
         
-        self._response_times.append(response_time)
-        self.average_response_time = sum(self._response_times) / len(self._response_times)
+        Args:
+            kind: "ttft" (tiempo al primer token) o "total"
+            seconds: Latencia en segundos
+            **labels: Etiquetas de baja cardinalidad: provider, task y/o intent
+        """
+        key = (kind, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None)))
+        with self._lock:
+            histogram = self._latencies.get(key)
+            if histogram is None:
+                histogram = self._latencies[key] = LatencyHistogram()
+            histogram.record(seconds)
+        prometheus_metrics.observe_llm_latency(kind, seconds, **labels)
+    
+    def record_token_usage(self, usage: Optional[Dict], provider: Optional[str] = None):
+        """Registra el uso de tokens reportado por el proveedor (incluye tokens cacheados)."""
+        if not usage:
+            return
+        prompt = usage.get("prompt_tokens", 0) or 0
+        completion = usage.get("completion_tokens", 0) or 0
+        cached = min(usage.get("cached_tokens", 0) or 0, prompt)
         
-        if tokens_used:
-            self.total_tokens += tokens_used
-            # Costo estimado GPT-4o-mini: $0.15 input + $0.60 output por 1M tokens
-            estimated_cost = (tokens_used / 1_000_000) * 0.375  # Promedio
-            self.total_cost += estimated_cost
+        with self._lock:
+            self.prompt_tokens += prompt
+            self.completion_tokens += completion
+            self.cached_prompt_tokens += cached
+            self.total_tokens += prompt + completion
+            self.total_cost += (
+                (prompt - cached) * _PRICE_INPUT_PER_M
+                + cached * _PRICE_CACHED_INPUT_PER_M
+                + completion * _PRICE_OUTPUT_PER_M
+            ) / 1_000_000
+            
+            if provider:
+                totals = self._tokens_by_provider.setdefault(
+                    provider, {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+                )
+                totals["prompt_tokens"] += prompt
+                totals["completion_tokens"] += completion
+                totals["cached_tokens"] += cached
+        prometheus_metrics.observe_llm_tokens(provider, prompt, completion, cached)
+    
+    def record_stream_aborted(self, partial_response: str):
+        """Registra un stream cancelado por desconexión del cliente."""
+        with self._lock:
+            self.aborted_streams += 1
+            # Estimación: ~4 caracteres por token (el proveedor no reporta usage al cortar)
+            self.aborted_tokens += len(partial_response or "") // 4
+        prometheus_metrics.LLM_STREAMS_ABORTED.inc()
     
     def get_stats(self) -> Dict:
         """Obtiene estadísticas acumuladas."""
-        cache_rate = (self.cache_hits / self.requests_count * 100) if self.requests_count > 0 else 0
-        
-        return {
-            "total_requests": self.requests_count,
-            "cache_hits": self.cache_hits,
-            "cache_misses": self.cache_misses,
-            "cache_hit_rate": round(cache_rate, 2),
-            "total_tokens": self.total_tokens,
-            "estimated_cost_usd": round(self.total_cost, 4),
-            "avg_response_time_sec": round(self.average_response_time, 2)
-        }
+        with self._lock:
+            cache_rate = (self.cache_hits / self.requests_count * 100) if self.requests_count > 0 else 0
+            prompt_cache_rate = (self.cached_prompt_tokens / self.prompt_tokens * 100) if self.prompt_tokens > 0 else 0
+            
+            latencies: Dict[str, Dict] = {}
+            for (kind, labels), histogram in sorted(self._latencies.items()):
+                label = ",".join(f"{k}={v}" for k, v in labels) or "all"
+                latencies.setdefault(kind, {})[label] = histogram.to_dict()
+            
+            return {
+                "total_requests": self.requests_count,
+                "stream_requests": self.stream_requests,
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+                "cache_hit_rate": round(cache_rate, 2),
+                "total_tokens": self.total_tokens,
+                "estimated_cost_usd": round(self.total_cost, 4),
+                "avg_response_time_sec": round(self.average_response_time, 2),
+                "response_time": self._response_times.to_dict(),
+                "latency": latencies,
+                "tokens_by_provider": {k: dict(v) for k, v in self._tokens_by_provider.items()},
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cached_prompt_tokens": self.cached_prompt_tokens,
+                "prompt_cache_hit_rate": round(prompt_cache_rate, 2),
+                "aborted_streams": self.aborted_streams,
+                "aborted_tokens": self.aborted_tokens
+            }
     
     def log_stats(self):
         """Loguea estadísticas actuales."""
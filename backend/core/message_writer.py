@@ -0,0 +1,306 @@
+"""
+Persistencia write-behind de los mensajes del chat.
+
+Antes cada turno hacía un commit síncrono del mensaje del usuario antes del
+retrieval (en el camino crítico del TTFT) y otro del mensaje del asistente al
+final del stream. Ahora las rutas encolan los mensajes y una única tarea por
+proceso los inserta por lotes:
+
+- Cola acotada (MESSAGE_WRITER_QUEUE_SIZE): si se llena, `add` espera
+  (backpressure) en lugar de crecer sin límite.
+- Lotes de hasta MESSAGE_WRITER_BATCH_SIZE filas, esperando como mucho
+  MESSAGE_WRITER_FLUSH_MS para juntarlas. El cierre de un mensaje del
+  asistente se escribe sin esa espera.
+- Borradores: durante el stream la respuesta parcial se guarda cada
+  MESSAGE_CHECKPOINT_SECONDS (is_truncated=True), así que si el proceso muere
+  a mitad del stream queda lo generado hasta el último checkpoint.
+- Durabilidad: los lotes se reintentan y, si fallan, se escriben fila a fila
+  (una conversación borrada no tira el lote entero). `flush()` espera a que
+  todo lo encolado esté en la BD y `stop()` drena la cola al apagar.
+
+Los mensajes llevan id y created_at (con microsegundos, DATETIME(6))
+asignados al encolar, de modo que el orden por created_at es el del turno
+(usuario antes que asistente) aunque se inserten después.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+
+from core.config import settings
+from models import database
+from models.conversation import Message
+
+logger = logging.getLogger(__name__)
+
+messages_table = Message.__table__
+
+# Marca de parada de la tarea de escritura
+_STOP = object()
+
+
+class _Write(NamedTuple):
+    row: Dict
+    draft: bool  # Borrador del asistente: habrá más escrituras con el mismo id
+    urgent: bool  # Escribir sin esperar a juntar un lote
+
+
+def _new_row(conversation_id: str, role: str, content: str, is_truncated: bool = False) -> Dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "conversation_id": conversation_id,
+        "role": role,
+        "content": content,
+        "chunk_references": None,
+        "is_truncated": is_truncated,
+        # messages.created_at es DATETIME(6): se conservan los microsegundos
+        "created_at": datetime.now(),
+    }
+
+
+class MessageWriter:
+    """Cola de mensajes pendientes y tarea que los inserta por lotes (una por proceso)."""
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Borradores ya insertados: las siguientes escrituras son UPDATE
+        self._inserted = set()
+        # Referencias a las tareas sueltas para que no las recolecte el GC
+        self._background = set()
+        # Escrituras que no entraron en la cola llena, en orden de llegada
+        self._overflow = deque()
+        self._overflow_task: Optional[asyncio.Task] = None
+        # Sin cola (MESSAGE_WRITER_ENABLED=false): escrituras directas de a una,
+        # en orden (el checkpoint de un borrador no puede pisar a su cierre)
+        self._direct_lock = asyncio.Lock()
+
+    # ------------------------------------------------------------------
+    # API para las rutas
+    # ------------------------------------------------------------------
+    async def add(self, conversation_id: str, role: str, content: str) -> str:
+        """Encola un mensaje y devuelve su id (ya válido para excluirlo del historial)."""
+        row = _new_row(conversation_id, role, content)
+        await self._put(_Write(row, draft=False, urgent=False))
+        return row["id"]
+
+    def draft(self, conversation_id: str) -> "AssistantDraft":
+        """Mensaje del asistente que se va guardando mientras dura el stream."""
+        return AssistantDraft(self, conversation_id)
+
+    async def flush(self) -> None:
+        """Espera a que todo lo encolado hasta ahora esté escrito en la BD."""
+        await self._settle()
+        if not self._running():
+            return
+        done = asyncio.get_running_loop().create_future()
+        await self._queue.put(done)
+        await done
+
+    async def run_after_flush(self, func, *args) -> None:
+        """
+        Para BackgroundTask: espera a que los mensajes del turno estén en la BD
+        y luego ejecuta `func` (síncrona) en el threadpool.
+        """
+        await self.flush()
+        await run_in_threadpool(func, *args)
+
+    async def stop(self) -> None:
+        """Drena la cola y termina la tarea (shutdown de la aplicación)."""
+        await self._settle()
+        if not self._running():
+            return
+        pending = self._queue.qsize()
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+        logger.info(f"💾 Message writer detenido ({pending} escrituras pendientes drenadas)")
+
+    # ------------------------------------------------------------------
+    # Cola
+    # ------------------------------------------------------------------
+    def _running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._running() and self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=settings.MESSAGE_WRITER_QUEUE_SIZE)
+        self._task = loop.create_task(self._run())
+
+    async def _put(self, write: _Write) -> None:
+        if not settings.MESSAGE_WRITER_ENABLED:
+            await self._write_direct(write)
+            return
+        self._ensure_started()
+        await self._queue.put(write)
+
+    def _submit(self, write: _Write) -> None:
+        """
+        Encola sin esperar (checkpoints y cierre del stream, que se ejecutan en
+        `finally` y no deben suspenderse). Si la cola está llena la escritura
+        espera en `_overflow` (en orden: un checkpoint atrasado no puede entrar
+        después del cierre del mismo borrador) en lugar de descartarse.
+        """
+        if not settings.MESSAGE_WRITER_ENABLED:
+            self._spawn(self._write_direct(write))
+            return
+        self._ensure_started()
+        if not self._overflow:
+            try:
+                self._queue.put_nowait(write)
+                return
+            except asyncio.QueueFull:
+                logger.warning("⚠️ Cola de mensajes llena: encolando en segundo plano")
+        self._overflow.append(write)
+        if self._overflow_task is None or self._overflow_task.done():
+            self._overflow_task = self._spawn(self._drain_overflow())
+
+    async def _drain_overflow(self) -> None:
+        while self._overflow:
+            await self._queue.put(self._overflow.popleft())
+
+    async def _write_direct(self, write: _Write) -> None:
+        # asyncio.Lock atiende a las tareas en orden de llegada
+        async with self._direct_lock:
+            await self._write([write])
+
+    def _spawn(self, coroutine) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    async def _settle(self) -> None:
+        """Espera las escrituras pendientes fuera de la cola (overflow y modo directo)."""
+        while self._background:
+            await asyncio.gather(*list(self._background), return_exceptions=True)
+
+    async def _run(self) -> None:
+        flush_seconds = settings.MESSAGE_WRITER_FLUSH_MS / 1000
+        while True:
+            item = await self._queue.get()
+            batch = [item]
+            if isinstance(item, _Write) and not item.urgent:
+                # Juntar más filas antes de escribir
+                await asyncio.sleep(flush_seconds)
+            while len(batch) < settings.MESSAGE_WRITER_BATCH_SIZE and batch[-1] is not _STOP:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            writes = [entry for entry in batch if isinstance(entry, _Write)]
+            if writes:
+                try:
+                    await self._write(writes)
+                except Exception as e:
+                    logger.error(f"❌ Error inesperado en el message writer: {e}")
+            for entry in batch:
+                if isinstance(entry, asyncio.Future) and not entry.done():
+                    entry.set_result(None)
+            if _STOP in batch:
+                return
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+    async def _write(self, writes: List[_Write]) -> None:
+        # Varias escrituras del mismo borrador en el lote: vale la última
+        merged: Dict[str, _Write] = {}
+        for write in writes:
+            previous = merged.get(write.row["id"])
+            row = dict(previous.row, **write.row) if previous else write.row
+            merged[write.row["id"]] = _Write(row, write.draft, write.urgent)
+
+        if await self._execute(list(merged.values())):
+            self._track(merged.values())
+            return
+
+        # El lote falló: fila a fila, para no perder las que sí se pueden escribir
+        for write in merged.values():
+            if await self._execute([write]):
+                self._track([write])
+            else:
+                logger.error(
+                    f"❌ Mensaje {write.row['id']} de la conversación "
+                    f"{write.row['conversation_id']} descartado tras {settings.MESSAGE_WRITER_MAX_RETRIES} intentos"
+                )
+
+    async def _execute(self, writes: List[_Write]) -> bool:
+        inserts = [write.row for write in writes if write.row["id"] not in self._inserted]
+        updates = [write.row for write in writes if write.row["id"] in self._inserted]
+        for attempt in range(settings.MESSAGE_WRITER_MAX_RETRIES):
+            try:
+                async with database.AsyncSessionLocal() as db:
+                    if inserts:
+                        await db.execute(insert(messages_table), inserts)
+                    for row in updates:
+                        await db.execute(
+                            update(messages_table)
+                            .where(messages_table.c.id == row["id"])
+                            .values(content=row["content"], is_truncated=row["is_truncated"])
+                        )
+                    await db.commit()
+                return True
+            except IntegrityError as e:
+                # Permanente (p. ej. la conversación se borró): no se reintenta
+                logger.warning(f"⚠️ Mensaje(s) rechazados por la BD: {e.orig}")
+                return False
+            except Exception as e:
+                logger.warning(
+                    f"⚠️ Error guardando {len(writes)} mensaje(s) "
+                    f"(intento {attempt + 1}/{settings.MESSAGE_WRITER_MAX_RETRIES}): {e}"
+                )
+                await asyncio.sleep(0.1 * 2 ** attempt)
+        return False
+
+    def _track(self, writes) -> None:
+        for write in writes:
+            if write.draft:
+                self._inserted.add(write.row["id"])
+            else:
+                self._inserted.discard(write.row["id"])
+
+
+class AssistantDraft:
+    """
+    Respuesta del asistente en curso.
+
+        draft = message_writer.draft(conversation_id)
+        async for token in relay:
+            draft.checkpoint(relay.text)   # cada MESSAGE_CHECKPOINT_SECONDS
+        draft.finish(relay.text, aborted=relay.aborted)
+    """
+
+    def __init__(self, writer: MessageWriter, conversation_id: str):
+        self._writer = writer
+        self._row = _new_row(conversation_id, "assistant", "", is_truncated=True)
+        self._last_checkpoint = time.monotonic()
+        self.id = self._row["id"]
+
+    def checkpoint(self, text: str) -> None:
+        interval = settings.MESSAGE_CHECKPOINT_SECONDS
+        if interval <= 0 or not text or time.monotonic() - self._last_checkpoint < interval:
+            return
+        self._last_checkpoint = time.monotonic()
+        self._writer._submit(_Write(dict(self._row, content=text), draft=True, urgent=False))
+
+    def finish(self, text: str, aborted: bool) -> None:
+        self._writer._submit(
+            _Write(dict(self._row, content=text, is_truncated=aborted), draft=False, urgent=True)
+        )
+
+
+# Instancia global (una cola y una tarea por proceso)
+message_writer = MessageWriter()
@@ -0,0 +1,178 @@
+"""
+Verificación de ownership para rutas con alcance de workspace.
+
+Antes cada ruta hacía un SELECT del workspace, otro del documento/conversación
+y comparaba `owner_id` en Python. Aquí se resuelven workspace + entidad +
+ownership en una sola consulta (JOIN), con los mismos 404/403 que antes.
+
+Los resultados se guardan en `db.info` (la sesión vive lo que dura la request),
+así que si la misma entidad se verifica dos veces en una request (dependencia +
+lógica de la ruta) no se vuelve a consultar.
+
+Uso:
+- Como dependencia: `document: Document = Depends(owned_document)`.
+- Dentro de la ruta (para mensajes de error propios):
+  `get_owned_workspace(db, workspace_id, current_user, forbidden_detail="...")`.
+- En rutas async con AsyncSession:
+  `await db.run_sync(get_owned_workspace, workspace_id, current_user, ...)`.
+"""
+from typing import Optional, Tuple
+
+from fastapi import Depends, HTTPException, status
+from sqlalchemy import and_
+from sqlalchemy.orm import Session
+
+from core.auth import get_current_active_user
+from models.conversation import Conversation
+from models.database import get_db
+from models.document import Document
+from models.user import User
+from models.workspace import Workspace
+
+_CACHE_KEY = "ownership_cache"
+
+
+def _cache(db: Session) -> dict:
+    return db.info.setdefault(_CACHE_KEY, {})
+
+
+def _not_found(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+
+
+def _forbidden(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=detail)
+
+
+def get_owned_workspace(
+    db: Session,
+    workspace_id: str,
+    user: User,
+    forbidden_detail: str = "No tienes permiso para acceder a este workspace.",
+    not_found_detail: Optional[str] = None,
+    hide_forbidden: bool = False,
+) -> Workspace:
+    """
+    Workspace del usuario. 404 si no existe; 403 si es de otro usuario
+    (404 con `hide_forbidden`, para no revelar que existe).
+    """
+    cache = _cache(db)
+    key = ("workspace", workspace_id)
+    if key not in cache:
+        cache[key] = db.query(Workspace).filter(Workspace.id == workspace_id).first()
+    workspace = cache[key]
+
+    not_found_detail = not_found_detail or f"Workspace con id {workspace_id} no encontrado."
+    if workspace is None:
+        raise _not_found(not_found_detail)
+    if workspace.owner_id != user.id:
+        raise _not_found(not_found_detail) if hide_forbidden else _forbidden(forbidden_detail)
+    return workspace
+
+
+def get_owned_document(
+    db: Session,
+    document_id: str,
+    user: User,
+    workspace_id: Optional[str] = None,
+    forbidden_detail: str = "No tienes permiso para ver este documento.",
+) -> Tuple[Document, Workspace]:
+    """
+    Documento + su workspace en una consulta. 404 si no existe (o si no
+    pertenece a `workspace_id`, cuando se indica); 403 si el workspace es de
+    otro usuario.
+    """
+    cache = _cache(db)
+    key = ("document", document_id)
+    if key not in cache:
+        cache[key] = (
+            db.query(Document, Workspace)
+            .outerjoin(Workspace, Workspace.id == Document.workspace_id)
+            .filter(Document.id == document_id)
+            .first()
+        )
+    row = cache[key]
+
+    if row is None:
+        raise _not_found(f"Documento con id {document_id} no encontrado.")
+    document, workspace = row
+    if workspace_id is not None and document.workspace_id != workspace_id:
+        raise _not_found("El documento no pertenece al workspace especificado.")
+    if workspace is None or workspace.owner_id != user.id:
+        raise _forbidden(forbidden_detail)
+    cache.setdefault(("workspace", workspace.id), workspace)
+    return document, workspace
+
+
+def get_owned_conversation(
+    db: Session,
+    workspace_id: str,
+    conversation_id: str,
+    user: User,
+    forbidden_detail: str = "No tienes permiso para acceder a este workspace.",
+    not_found_detail: str = "Conversación no encontrada.",
+) -> Tuple[Conversation, Workspace]:
+    """
+    Conversación de un workspace del usuario, en una consulta (workspace LEFT
+    JOIN conversación). 404 si no existe alguno de los dos; 403 si el
+    workspace es de otro usuario.
+    """
+    cache = _cache(db)
+    key = ("conversation", workspace_id, conversation_id)
+    if key not in cache:
+        cache[key] = (
+            db.query(Workspace, Conversation)
+            .outerjoin(
+                Conversation,
+                and_(Conversation.workspace_id == Workspace.id, Conversation.id == conversation_id),
+            )
+            .filter(Workspace.id == workspace_id)
+            .first()
+        )
+    row = cache[key]
+
+    if row is None:
+        raise _not_found(f"Workspace con id {workspace_id} no encontrado.")
+    workspace, conversation = row
+    if workspace.owner_id != user.id:
+        raise _forbidden(forbidden_detail)
+    if conversation is None:
+        raise _not_found(not_found_detail)
+    cache.setdefault(("workspace", workspace_id), workspace)
+    return conversation, workspace
+
+
+def forget(db: Session):
+    """Vacía el caché de la request (p. ej. después de borrar entidades)."""
+    db.info.pop(_CACHE_KEY, None)
+
+
+# ----------------------------------------------------------------------
+# Dependencias FastAPI (mensajes de error por defecto)
+# ----------------------------------------------------------------------
+# Usan get_db, la misma sesión que las rutas: FastAPI la comparte dentro de la
+# request (y con ella el caché de db.info) y el ownership se lee del primario,
+# nunca de una réplica atrasada.
+def owned_workspace(
+    workspace_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db),
+) -> Workspace:
+    return get_owned_workspace(db, workspace_id, current_user)
+
+
+def owned_document(
+    document_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db),
+) -> Document:
+    return get_owned_document(db, document_id, current_user)[0]
+
+
+def owned_conversation(
+    workspace_id: str,
+    conversation_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db),
+) -> Conversation:
+    return get_owned_conversation(db, workspace_id, conversation_id, current_user)[0]
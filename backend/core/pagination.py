@@ -0,0 +1,48 @@
+"""
+Paginación por keyset (cursor) para listas ordenadas por (fecha, id).
+
+El cursor es la posición del último elemento devuelto, codificada en base64
+URL-safe. La página siguiente se obtiene con un WHERE sobre el índice
+(fecha, id) en lugar de OFFSET, así que el costo no crece con la página.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(created_at: datetime, item_id: str) -> str:
+    payload = json.dumps([created_at.isoformat(), item_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Decodifica un cursor; 400 si no es válido."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, item_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(created_at), str(item_id)
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor de paginación inválido.")
+
+
+def page_before(query, date_column, id_column, cursor: Optional[str], limit: int) -> Tuple[List, bool]:
+    """
+    Página de elementos anteriores al cursor, del más reciente al más antiguo.
+
+    Devuelve (elementos, hay_más). Pide limit + 1 filas para saber si quedan
+    más sin un COUNT adicional.
+    """
+    if cursor:
+        created_at, item_id = decode_cursor(cursor)
+        query = query.filter(
+            or_(
+                date_column < created_at,
+                and_(date_column == created_at, id_column < item_id),
+            )
+        )
+    rows = query.order_by(date_column.desc(), id_column.desc()).limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
@@ -0,0 +1,208 @@
+"""
+Métricas en formato Prometheus (GET /metrics).
+
+Exporta:
+- Latencia HTTP por ruta (plantilla de la ruta, no la URL concreta)
+- LLM: TTFT, duración total, tokens (prompt/completion/cached), streams abortados
+- Caché LLM: hits/misses
+- Celery: profundidad de las colas en Redis (se calcula en cada scrape)
+- Pools de conexiones a la BD (sync, async y réplica): tamaño, en uso, libres y overflow
+- Consultas SQL lentas por ruta
+
+Multi-worker: cada proceso de uvicorn/gunicorn tiene sus propios contadores.
+Si la variable de entorno PROMETHEUS_MULTIPROC_DIR apunta a un directorio
+vacío y escribible (definida ANTES de arrancar los workers), prometheus_client
+guarda los valores en archivos compartidos y /metrics agrega todos los procesos.
+"""
+import logging
+import os
+import time
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+from starlette.responses import Response
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Buckets de latencia (segundos): de 5ms a 2 min para cubrir respuestas LLM largas
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Latencia de requests HTTP (hasta el último byte de la respuesta)",
+    ["method", "route", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+LLM_TTFT = Histogram(
+    "llm_ttft_seconds",
+    "Tiempo hasta el primer token del LLM",
+    ["provider", "task", "intent"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+LLM_DURATION = Histogram(
+    "llm_response_duration_seconds",
+    "Duración total de la respuesta del LLM",
+    ["provider", "task", "intent"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens consumidos por provider y tipo (prompt, completion, cached)",
+    ["provider", "kind"],
+)
+
+LLM_CACHE_REQUESTS = Counter(
+    "llm_cache_requests_total",
+    "Consultas al caché de respuestas LLM",
+    ["result"],
+)
+
+LLM_STREAMS_ABORTED = Counter(
+    "llm_streams_aborted_total",
+    "Streams LLM cancelados por desconexión del cliente",
+)
+
+DB_SLOW_QUERIES = Counter(
+    "db_slow_queries_total",
+    "Consultas SQL por encima de DB_SLOW_QUERY_MS (core/db_instrumentation.py)",
+    ["route"],
+)
+
+
+def observe_llm_latency(kind: str, seconds: float, provider: Optional[str] = None,
+                        task: Optional[str] = None, intent: Optional[str] = None):
+    """Registra TTFT ("ttft") o duración total ("total") de una respuesta LLM."""
+    histogram = LLM_TTFT if kind == "ttft" else LLM_DURATION
+    histogram.labels(provider=provider or "", task=task or "", intent=intent or "").observe(seconds)
+
+
+def observe_llm_tokens(provider: Optional[str], prompt: int, completion: int, cached: int):
+    provider = provider or "unknown"
+    if prompt:
+        LLM_TOKENS.labels(provider=provider, kind="prompt").inc(prompt)
+    if completion:
+        LLM_TOKENS.labels(provider=provider, kind="completion").inc(completion)
+    if cached:
+        LLM_TOKENS.labels(provider=provider, kind="cached").inc(cached)
+
+
+class CeleryQueueCollector:
+    """Profundidad de las colas de Celery (LLEN en Redis) calculada al momento del scrape."""
+
+    def __init__(self, queues=("celery",)):
+        self.queues = queues
+        self._redis = None
+
+    def _client(self):
+        if self._redis is None:
+            import redis
+            self._redis = redis.from_url(settings.REDIS_URL, socket_timeout=1)
+        return self._redis
+
+    def collect(self):
+        gauge = GaugeMetricFamily(
+            "celery_queue_depth", "Tareas pendientes en la cola de Celery", labels=["queue"]
+        )
+        try:
+            client = self._client()
+            for queue in self.queues:
+                gauge.add_metric([queue], client.llen(queue))
+        except Exception as e:
+            logger.debug(f"No se pudo leer la profundidad de colas Celery: {e}")
+        yield gauge
+
+
+class DbPoolCollector:
+    """Estado de los pools de conexiones (sync, async y réplica) al momento del scrape."""
+
+    def collect(self):
+        from models import database
+
+        pools = {
+            "sync": database.engine.pool,
+            "async": database.async_engine.sync_engine.pool,
+        }
+        if database.replica_engine is not None:
+            pools["replica"] = database.replica_engine.pool
+        metrics = {
+            "size": GaugeMetricFamily("db_pool_size", "Conexiones permanentes del pool", labels=["engine"]),
+            "checkedout": GaugeMetricFamily("db_pool_checked_out", "Conexiones en uso", labels=["engine"]),
+            "checkedin": GaugeMetricFamily("db_pool_checked_in", "Conexiones libres en el pool", labels=["engine"]),
+            "overflow": GaugeMetricFamily("db_pool_overflow", "Conexiones por encima de pool_size", labels=["engine"]),
+        }
+        for name, pool in pools.items():
+            for attr, gauge in metrics.items():
+                method = getattr(pool, attr, None)
+                if method is not None:
+                    gauge.add_metric([name], method())
+        yield from metrics.values()
+
+
+def _build_registry():
+    """Registry para el scrape: agregado multiproceso si está configurado."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    registry.register(CeleryQueueCollector())
+    registry.register(DbPoolCollector())
+    return registry
+
+
+_registry = _build_registry()
+
+
+def metrics_response() -> Response:
+    """Respuesta con todas las métricas en formato de exposición de texto."""
+    return Response(generate_latest(_registry), media_type=CONTENT_TYPE_LATEST)
+
+
+class PrometheusMiddleware:
+    """
+    Middleware ASGI que mide la latencia de cada request (hasta el último byte,
+    incluidas las respuestas en streaming) etiquetada con la plantilla de la ruta.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # El router deja la ruta resuelta en el scope: usamos la plantilla
+            # (/workspaces/{workspace_id}) para no explotar la cardinalidad
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            if path != "/metrics":
+                HTTP_REQUEST_DURATION.labels(
+                    method=scope.get("method", ""), route=path, status=str(status_code)
+                ).observe(time.perf_counter() - start)
@@ -3,7 +3,7 @@ Gemini 2.0 Flash LLM Provider.
 Uses Google Generative AI API for Gemini 2.0 Flash model.
 """
 
-from typing import List, Generator
+from typing import List, Generator, Optional
 import google.generativeai as genai
 from .llm_provider import LLMProvider
 from models.schemas import DocumentChunk
@@ -24,11 +24,38 @@ class GeminiFlashProvider(LLMProvider):
         self.max_tokens = settings.GEMINI_MAX_TOKENS
         logger.info(f"✅ Gemini Flash Provider inicializado: {self.model_name}")
     
+    def _build_contents(self, query: str, context_chunks: List[DocumentChunk], chat_history: List[dict] = None) -> str:
+        """
+        Contenido volátil del request: historial y, al final, contexto + pregunta.
+        Las instrucciones estables van en system_instruction para que Gemini
+        pueda reutilizar el prefijo (implicit caching).
+        """
+        full_prompt = []
+        if chat_history:
+            for msg in chat_history[-5:]:  # Last 5 messages
+                role = msg.get("role", "user")
+                content = msg.get("content", "")
+                full_prompt.append(f"{role.upper()}: {content}")
+        
+        full_prompt.append(f"USER: {self._build_prompt(query, context_chunks)}")
+        return "\n\n".join(full_prompt)
+    
+    @staticmethod
+    def _fill_usage(usage: Optional[dict], usage_metadata) -> None:
+        """Copia el uso de tokens de Gemini (incluidos los tokens cacheados)."""
+        if usage is None or not usage_metadata:
+            return
+        usage["prompt_tokens"] = getattr(usage_metadata, "prompt_token_count", 0) or 0
+        usage["completion_tokens"] = getattr(usage_metadata, "candidates_token_count", 0) or 0
+        usage["cached_tokens"] = getattr(usage_metadata, "cached_content_token_count", 0) or 0
+    
     def generate_response(
         self, 
         query: str, 
         context_chunks: List[DocumentChunk], 
-        chat_history: List[dict] = None
+        chat_history: List[dict] = None,
+        system_prompt: str = None,
+        usage: Optional[dict] = None
     ) -> str:
         """
         Generate a complete response for the given query and context.
@@ -37,35 +64,29 @@ class GeminiFlashProvider(LLMProvider):
             query: User's question
             context_chunks: Relevant document chunks for context
             chat_history: List of previous messages
+            system_prompt: Stable task instructions (optional)
+            usage: Optional dict filled with token usage
             
         Returns:
             Complete response as string
         """
         try:
-            model = gcp_service.get_gemini_model(self.model_name)
-            
-            # Build prompt with context
-            prompt = self._build_prompt(query, context_chunks)
-            
-            # Add chat history if exists
-            full_prompt = []
-            if chat_history:
-                for msg in chat_history[-5:]:  # Last 5 messages
-                    role = msg.get("role", "user")
-                    content = msg.get("content", "")
-                    full_prompt.append(f"{role.upper()}: {content}")
-            
-            full_prompt.append(f"USER: {prompt}")
+            model = gcp_service.get_gemini_model(
+                self.model_name,
+                system_instruction=self._build_system_prompt(system_prompt)
+            )
             
             # Generate
             response = model.generate_content(
-                "\n\n".join(full_prompt),
+                self._build_contents(query, context_chunks, chat_history),
                 generation_config=genai.GenerationConfig(
                     temperature=self.temperature,
                     max_output_tokens=self.max_tokens,
                 ),
             )
             
+            self._fill_usage(usage, getattr(response, "usage_metadata", None))
+            
             return response.text if response.text else ""
             
         except Exception as e:
@@ -76,7 +97,9 @@ class GeminiFlashProvider(LLMProvider):
         self, 
         query: str, 
         context_chunks: List[DocumentChunk], 
-        chat_history: List[dict] = None
+        chat_history: List[dict] = None,
+        system_prompt: str = None,
+        usage: Optional[dict] = None
     ) -> Generator[str, None, None]:
         """
         Generate a streaming response for the given query and context.
@@ -85,29 +108,23 @@ class GeminiFlashProvider(LLMProvider):
             query: User's question
             context_chunks: Relevant document chunks for context
             chat_history: List of previous messages
+            system_prompt: Stable task instructions (optional)
+            usage: Optional dict filled with token usage once the stream finishes
             
         Yields:
             Response chunks as they are generated
         """
+        response = None
+        completed = False
         try:
-            model = gcp_service.get_gemini_model(self.model_name)
-            
-            # Build prompt with context
-            prompt = self._build_prompt(query, context_chunks)
-            
-            # Add chat history if exists
-            full_prompt = []
-            if chat_history:
-                for msg in chat_history[-5:]:
-                    role = msg.get("role", "user")
-                    content = msg.get("content", "")
-                    full_prompt.append(f"{role.upper()}: {content}")
-            
-            full_prompt.append(f"USER: {prompt}")
+            model = gcp_service.get_gemini_model(
+                self.model_name,
+                system_instruction=self._build_system_prompt(system_prompt)
+            )
             
             # Generate with streaming
             response = model.generate_content(
-                "\n\n".join(full_prompt),
+                self._build_contents(query, context_chunks, chat_history),
                 generation_config=genai.GenerationConfig(
                     temperature=self.temperature,
                     max_output_tokens=self.max_tokens,
@@ -118,7 +135,25 @@ class GeminiFlashProvider(LLMProvider):
             for chunk in response:
                 if chunk.text:
                     yield chunk.text
+                # usage_metadata llega completo en el último chunk
+                self._fill_usage(usage, getattr(chunk, "usage_metadata", None))
+            completed = True
             
         except Exception as e:
             logger.error(f"❌ Error en Gemini Flash streaming: {e}")
-            yield f"Error: {str(e)}"
+            # Propagar para que llm_service pueda hacer failover a otro provider
+            raise
+        finally:
+            if response is not None and not completed:
+                self._cancel_stream(response)
+    
+    @staticmethod
+    def _cancel_stream(response) -> None:
+        """Cancela el stream gRPC subyacente (el SDK no expone un close público)."""
+        iterator = getattr(response, "_iterator", None)
+        cancel = getattr(iterator, "cancel", None)
+        if cancel:
+            try:
+                cancel()
+            except Exception as e:
+                logger.debug(f"No se pudo cancelar el stream de Gemini: {e}")
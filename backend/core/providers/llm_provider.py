@@ -3,16 +3,23 @@ Abstract base class for LLM providers.
 All LLM implementations must inherit from this class.
 """
 from abc import ABC, abstractmethod
-from typing import List, Generator
+from typing import List, Generator, Optional
 from models.schemas import DocumentChunk
-from prompts.chat_prompts import RAG_SYSTEM_PROMPT_TEMPLATE
+from prompts.chat_prompts import RAG_SYSTEM_PROMPT, RAG_USER_PROMPT_TEMPLATE
 
 
 class LLMProvider(ABC):
     """Abstract base class for LLM providers."""
     
     @abstractmethod
-    def generate_response(self, query: str, context_chunks: List[DocumentChunk], chat_history: List[dict] = None) -> str:
+    def generate_response(
+        self,
+        query: str,
+        context_chunks: List[DocumentChunk],
+        chat_history: List[dict] = None,
+        system_prompt: str = None,
+        usage: Optional[dict] = None
+    ) -> str:
         """
         Generate a complete response for the given query and context.
         
@@ -20,6 +27,8 @@ class LLMProvider(ABC):
             query: User's question
             context_chunks: Relevant document chunks for context
             chat_history: List of previous messages [{"role": "user", "content": "..."}]
+            system_prompt: Stable task instructions (sent before any volatile content)
+            usage: Optional dict filled with prompt_tokens, completion_tokens and cached_tokens
             
         Returns:
             Complete response as string
@@ -27,7 +36,14 @@ class LLMProvider(ABC):
         pass
     
     @abstractmethod
-    def generate_response_stream(self, query: str, context_chunks: List[DocumentChunk], chat_history: List[dict] = None) -> Generator[str, None, None]:
+    def generate_response_stream(
+        self,
+        query: str,
+        context_chunks: List[DocumentChunk],
+        chat_history: List[dict] = None,
+        system_prompt: str = None,
+        usage: Optional[dict] = None
+    ) -> Generator[str, None, None]:
         """
         Generate a streaming response for the given query and context.
         
@@ -35,15 +51,31 @@ class LLMProvider(ABC):
             query: User's question
             context_chunks: Relevant document chunks for context
             chat_history: List of previous messages
+            system_prompt: Stable task instructions (sent before any volatile content)
+            usage: Optional dict filled with token usage once the stream finishes
             
         Yields:
             Response chunks as they are generated
         """
         pass
     
+    def _build_system_prompt(self, system_prompt: str = None) -> str:
+        """
+        Build the stable prefix of the request.
+
+        Only static text goes here (base RAG instructions + task/workspace
+        instructions) so providers can reuse their prompt-prefix cache across
+        requests. Never put the query, the context or the history in it.
+        """
+        parts = [RAG_SYSTEM_PROMPT.strip()]
+        if system_prompt:
+            parts.append(system_prompt.strip())
+        return "\n\n".join(parts)
+
     def _build_prompt(self, query: str, context_chunks: List[DocumentChunk]) -> str:
         """
-        Build the prompt with context and query.
+        Build the volatile part of the prompt (context + query).
+        It is sent last, as the user message.
         Can be overridden by subclasses for custom prompt formatting.
         """
         if context_chunks:
@@ -56,9 +88,8 @@ class LLMProvider(ABC):
         else:
             context_string = "=== CONTEXTO ===\nNo hay documentos disponibles para esta consulta.\n\n"
 
-        prompt = RAG_SYSTEM_PROMPT_TEMPLATE.format(
+        prompt = RAG_USER_PROMPT_TEMPLATE.format(
             context_string=context_string,
             query=query
         )
         return prompt
-    
\ No newline at end of file
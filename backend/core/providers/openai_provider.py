@@ -5,7 +5,7 @@ Uses OpenAI API for GPT-4o-mini model.
 Cost-effective and fast model for general tasks.
 """
 
-from typing import List, Generator
+from typing import List, Generator, Optional
 from openai import OpenAI
 from .llm_provider import LLMProvider
 from models.schemas import DocumentChunk
@@ -16,6 +16,13 @@ from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_excep
 
 logger = logging.getLogger(__name__)
 
+# Prefijo fijo del mensaje de sistema (debe ir primero para aprovechar el
+# prompt caching automático de OpenAI, que cachea prefijos idénticos >= 1024 tokens)
+TIVIT_SYSTEM_PREFIX = (
+    "Eres un asistente experto de TIVIT para análisis de propuestas. "
+    "Solo respondes sobre temas de TIVIT y documentos del caso."
+)
+
 
 class OpenAIProvider(LLMProvider):
     """
@@ -45,6 +52,56 @@ class OpenAIProvider(LLMProvider):
         
         logger.info("OpenAI provider inicializado correctamente")
     
+    def _build_messages(
+        self,
+        query: str,
+        context_chunks: List[DocumentChunk],
+        custom_prompt: str = None,
+        chat_history: List[dict] = None,
+        system_prompt: str = None
+    ) -> List[dict]:
+        """
+        Construye los mensajes con el orden estable -> volátil:
+        1. Sistema: prefijo TIVIT + instrucciones RAG + instrucciones de la tarea (idéntico entre requests)
+        2. Historial de la conversación
+        3. Usuario: contexto RAG + pregunta (cambia en cada request)
+        """
+        system_content = custom_prompt if custom_prompt else self._build_system_prompt(system_prompt)
+        
+        messages = [
+            {
+                "role": "system",
+                "content": TIVIT_SYSTEM_PREFIX + "\n\n" + system_content
+            }
+        ]
+        
+        # Inyectar historial si existe
+        if chat_history:
+            for msg in chat_history:
+                if msg.get("role") in ["system", "user", "assistant"]:
+                    messages.append({
+                        "role": msg["role"],
+                        "content": msg["content"]
+                    })
+        
+        # Agregar mensaje actual (contexto + pregunta). Con custom_prompt el
+        # contexto ya viene en el mensaje de sistema.
+        messages.append({
+            "role": "user",
+            "content": query if custom_prompt else self._build_prompt(query, context_chunks)
+        })
+        return messages
+    
+    @staticmethod
+    def _fill_usage(usage: Optional[dict], response_usage) -> None:
+        """Copia el uso de tokens de la respuesta (incluidos los tokens cacheados)."""
+        if usage is None or not response_usage:
+            return
+        details = getattr(response_usage, "prompt_tokens_details", None)
+        usage["prompt_tokens"] = response_usage.prompt_tokens or 0
+        usage["completion_tokens"] = response_usage.completion_tokens or 0
+        usage["cached_tokens"] = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+    
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=4, max=10),
@@ -56,7 +113,9 @@ class OpenAIProvider(LLMProvider):
         query: str, 
         context_chunks: List[DocumentChunk], 
         custom_prompt: str = None,
-        chat_history: List[dict] = None
+        chat_history: List[dict] = None,
+        system_prompt: str = None,
+        usage: Optional[dict] = None
     ) -> str:
         """
         Genera una respuesta completa usando GPT-4o-mini.
@@ -66,35 +125,13 @@ class OpenAIProvider(LLMProvider):
             context_chunks: Chunks de contexto del RAG
             custom_prompt: Prompt personalizado (opcional)
             chat_history: Historial de chat (opcional)
+            system_prompt: Instrucciones estables de la tarea (opcional)
+            usage: Dict opcional donde se registra el uso de tokens
             
         Returns:
             Respuesta generada
         """
-        # Construir el prompt del sistema (contexto RAG)
-        system_content = custom_prompt if custom_prompt else self._build_prompt(query, context_chunks)
-        
-        # Construir lista de mensajes
-        messages = [
-            {
-                "role": "system",
-                "content": "Eres un asistente experto de TIVIT para análisis de propuestas. Solo respondes sobre temas de TIVIT y documentos del caso. " + system_content
-            }
-        ]
-        
-        # Inyectar historial si existe
-        if chat_history:
-            for msg in chat_history:
-                if msg.get("role") in ["user", "assistant"]:
-                    messages.append({
-                        "role": msg["role"],
-                        "content": msg["content"]
-                    })
-        
-        # Agregar mensaje actual
-        messages.append({
-            "role": "user",
-            "content": query
-        })
+        messages = self._build_messages(query, context_chunks, custom_prompt, chat_history, system_prompt)
         
         start_time = time.time()
         
@@ -109,6 +146,7 @@ class OpenAIProvider(LLMProvider):
             
             elapsed_time = time.time() - start_time
             tokens_used = response.usage.total_tokens if response.usage else 0
+            self._fill_usage(usage, response.usage)
             
             logger.info(f"OpenAI response generated in {elapsed_time:.2f}s, tokens: {tokens_used}")
             
@@ -130,7 +168,9 @@ class OpenAIProvider(LLMProvider):
         query: str, 
         context_chunks: List[DocumentChunk],
         custom_prompt: str = None,
-        chat_history: List[dict] = None
+        chat_history: List[dict] = None,
+        system_prompt: str = None,
+        usage: Optional[dict] = None
     ) -> Generator[str, None, None]:
         """
         Genera una respuesta en streaming usando GPT-4o-mini.
@@ -140,37 +180,16 @@ class OpenAIProvider(LLMProvider):
             context_chunks: Chunks de contexto del RAG
             custom_prompt: Prompt personalizado (opcional)
             chat_history: Historial de chat (opcional)
+            system_prompt: Instrucciones estables de la tarea (opcional)
+            usage: Dict opcional donde se registra el uso de tokens al terminar
             
         Yields:
             Chunks de texto de la respuesta
         """
-        # Construir el prompt del sistema (contexto RAG)
-        system_content = custom_prompt if custom_prompt else self._build_prompt(query, context_chunks)
-        
-        # Construir lista de mensajes
-        messages = [
-            {
-                "role": "system",
-                "content": "Eres un asistente experto de TIVIT para análisis de propuestas. Solo respondes sobre temas de TIVIT y documentos del caso. " + system_content
-            }
-        ]
-        
-        # Inyectar historial si existe
-        if chat_history:
-            for msg in chat_history:
-                if msg.get("role") in ["user", "assistant"]:
-                    messages.append({
-                        "role": msg["role"],
-                        "content": msg["content"]
-                    })
-        
-        # Agregar mensaje actual
-        messages.append({
-            "role": "user",
-            "content": query
-        })
+        messages = self._build_messages(query, context_chunks, custom_prompt, chat_history, system_prompt)
         
         start_time = time.time()
+        stream = None
         
         try:
             stream = self.client.chat.completions.create(
@@ -179,18 +198,21 @@ class OpenAIProvider(LLMProvider):
                 temperature=0.7,
                 max_tokens=8000,
                 stream=True,
+                stream_options={"include_usage": True},
                 timeout=30.0
             )
             
             total_tokens = 0
             
             for chunk in stream:
-                if chunk.choices[0].delta.content:
+                # El último chunk (include_usage) no trae choices, solo usage
+                if chunk.choices and chunk.choices[0].delta.content:
                     yield chunk.choices[0].delta.content
                 
                 # Track tokens if available
                 if hasattr(chunk, 'usage') and chunk.usage:
                     total_tokens = chunk.usage.total_tokens
+                    self._fill_usage(usage, chunk.usage)
             
             elapsed_time = time.time() - start_time
             logger.info(f"OpenAI streaming completed in {elapsed_time:.2f}s, tokens: {total_tokens}")
@@ -198,4 +220,9 @@ class OpenAIProvider(LLMProvider):
         except Exception as e:
             elapsed_time = time.time() - start_time
             logger.error(f"Error en OpenAI streaming después de {elapsed_time:.2f}s: {e}")
-            raise RuntimeError(f"Error en streaming con OpenAI: {e}") from e
\ No newline at end of file
+            raise RuntimeError(f"Error en streaming con OpenAI: {e}") from e
+        finally:
+            # Si el consumidor cerró el generador (cliente desconectado), cerrar
+            # la conexión HTTP para que OpenAI deje de generar tokens.
+            if stream is not None:
+                stream.close()
\ No newline at end of file
@@ -11,6 +11,7 @@ from pydantic import BaseModel
 import logging
 import json
 from core.config import settings
+from core import tracing
 
 logger = logging.getLogger(__name__)
 
@@ -108,6 +109,8 @@ class RAGClient:
         """Hace una petición HTTP al servicio RAG"""
         client = await self._get_client()
         url = f"{self.base_url}{endpoint}"
+        # Propagar el contexto de traza (traceparent) al servicio RAG
+        kwargs["headers"] = tracing.inject_headers(kwargs.get("headers"))
 
         try:
             response = await client.request(method, url, **kwargs)
@@ -214,6 +217,49 @@ class RAGClient:
             logger.error(f"RAG ingest text error: {e}")
             return None
 
+    async def copy_document(
+        self,
+        source_document_id: str,
+        document_id: str,
+        workspace_id: str,
+        metadata: Dict[str, Any],
+        user_id: Optional[str] = None,
+        conversation_id: Optional[str] = None
+    ) -> Optional[IngestResponse]:
+        """
+        Copia los chunks (con sus vectores) de un documento ya indexado con el
+        mismo contenido, bajo los ids del nuevo documento. No recalcula embeddings.
+
+        Args:
+            source_document_id: Documento ya indexado (mismo content_hash)
+            document_id: ID del nuevo documento
+            workspace_id: Workspace del nuevo documento
+            metadata: Metadata del nuevo documento (filename, file_type, ...)
+            user_id: ID del usuario (opcional)
+            conversation_id: Conversación del nuevo documento (opcional)
+
+        Returns:
+            Respuesta con los chunks copiados o None si falla
+        """
+        try:
+            payload = {
+                "source_document_id": source_document_id,
+                "document_id": document_id,
+                "workspace_id": workspace_id,
+                "metadata": metadata,
+                "user_id": user_id,
+                "conversation_id": conversation_id
+            }
+
+            response_data = await self._make_request("POST", "/copy_document", json=payload)
+            result = IngestResponse(**response_data)
+            logger.info(f"RAG copy: {source_document_id} -> {result.document_id} ({result.chunks_count} chunks)")
+            return result
+
+        except Exception as e:
+            logger.error(f"RAG copy error: {e}")
+            return None
+
     async def delete_document(self, document_id: str) -> bool:
         """
         Elimina un documento del servicio RAG.
@@ -0,0 +1,124 @@
+"""
+Enrutamiento de lecturas a la réplica (DATABASE_REPLICA_URL).
+
+La mayor parte de las consultas son GETs de polling (estado de documentos,
+listas, dashboard). `get_read_db` los manda a la réplica, salvo que el
+usuario haya escrito hace menos de DATABASE_READ_YOUR_WRITES_SECONDS: en ese
+caso lee del primario para ver su propio cambio aunque la réplica vaya
+atrasada (read-your-writes).
+
+Las escrituras se detectan por request: ReadYourWritesMiddleware marca al
+usuario cuando una request que no es GET/HEAD/OPTIONS termina sin error (al
+empezar la respuesta y otra vez al terminar, para los streams de chat cuyos
+mensajes se guardan al final). La marca vive en memoria del proceso y en
+Redis, así que la respeta cualquier worker.
+
+Sin réplica configurada `get_read_db` equivale a `get_db` y el middleware no
+se instala.
+"""
+import logging
+import time
+from typing import Dict, Optional
+
+from fastapi import Depends
+
+from core.auth import get_current_active_user
+from core.config import settings
+from models import database
+from models.user import User
+
+logger = logging.getLogger(__name__)
+
+_SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+_REDIS_PREFIX = "recent_write:"
+
+# user_id -> instante (monotonic) hasta el que se lee del primario
+_local_marks: Dict[str, float] = {}
+_redis = None
+
+
+def _redis_client():
+    global _redis
+    if _redis is None:
+        import redis
+
+        _redis = redis.from_url(settings.REDIS_URL, socket_timeout=1)
+    return _redis
+
+
+def replica_enabled() -> bool:
+    return database.ReplicaSessionLocal is not None
+
+
+def mark_write(user_id: Optional[str]) -> None:
+    """Registra que el usuario acaba de escribir."""
+    if not user_id:
+        return
+    window = settings.DATABASE_READ_YOUR_WRITES_SECONDS
+    _local_marks[user_id] = time.monotonic() + window
+    try:
+        _redis_client().set(_REDIS_PREFIX + user_id, 1, ex=window)
+    except Exception as e:
+        logger.debug(f"No se pudo registrar la escritura reciente en Redis: {e}")
+
+
+def recently_wrote(user_id: str) -> bool:
+    until = _local_marks.get(user_id)
+    if until is not None:
+        if until > time.monotonic():
+            return True
+        _local_marks.pop(user_id, None)
+    try:
+        return bool(_redis_client().exists(_REDIS_PREFIX + user_id))
+    except Exception:
+        # Sin Redis no se puede garantizar: mejor leer del primario
+        return True
+
+
+def get_read_db(current_user: User = Depends(get_current_active_user)):
+    """
+    Sesión para endpoints de solo lectura: réplica, o primario si no hay
+    réplica o si el usuario escribió hace poco. No hacer commit con ella.
+    """
+    if replica_enabled() and not recently_wrote(current_user.id):
+        db = database.ReplicaSessionLocal()
+    else:
+        db = database.SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+class ReadYourWritesMiddleware:
+    """
+    Middleware ASGI que marca al usuario autenticado (request.state.user_id,
+    lo deja get_current_user) cuando una request de escritura termina bien.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") in _SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        succeeded = False
+
+        def user_id():
+            return (scope.get("state") or {}).get("user_id")
+
+        async def send_wrapper(message):
+            nonlocal succeeded
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                succeeded = True
+                mark_write(user_id())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if succeeded:
+                # Los streams escriben hasta el final: renovar la marca
+                mark_write(user_id())
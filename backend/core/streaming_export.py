@@ -0,0 +1,170 @@
+"""
+Exportaciones CSV/TXT en streaming.
+
+Antes se armaba el archivo completo en memoria (StringIO / concatenación de
+strings) y se devolvía de una vez: la memoria crecía con el tamaño del
+workspace. Estos generadores leen la BD en lotes (stream_results + yield_per)
+y emiten bloques codificados de ~EXPORT_STREAM_CHUNK_BYTES, así que la memoria
+es constante aunque se exporte todo.
+
+Cada generador abre su propia sesión: StreamingResponse consume el iterador
+después de que la sesión de la request se cerró. Al ser generadores síncronos,
+Starlette los itera en el threadpool (el I/O no bloquea el event loop).
+"""
+import csv
+import io
+import re
+from datetime import datetime
+from typing import Iterator, Optional
+
+from core.config import settings
+from models import database
+from models.conversation import Conversation, Message
+from models.document import Document
+
+_SEPARATOR = "=" * 80
+_MESSAGE_SEPARATOR = "-" * 80
+
+_MARKDOWN_RULES = [
+    # Headers
+    (re.compile(r"^#{1,6}\s+(.+)$", re.MULTILINE), r"\1"),
+    # Bold
+    (re.compile(r"\*\*(.+?)\*\*"), r"\1"),
+    (re.compile(r"__(.+?)__"), r"\1"),
+    # Italic
+    (re.compile(r"\*(.+?)\*"), r"\1"),
+    (re.compile(r"_(.+?)_"), r"\1"),
+    # Code blocks
+    (re.compile(r"```[\w]*\n([\s\S]+?)```"), r"\n\1\n"),
+    # Inline code
+    (re.compile(r"`(.+?)`"), r"\1"),
+    # Links
+    (re.compile(r"\[([^\]]+)\]\([^\)]+\)"), r"\1"),
+    # Lists
+    (re.compile(r"^[\*\-\+]\s+", re.MULTILINE), "• "),
+    (re.compile(r"^\d+\.\s+", re.MULTILINE), ""),
+]
+
+
+def markdown_to_text(markdown_text: str) -> str:
+    """Convierte Markdown a texto plano legible."""
+    text = markdown_text
+    for pattern, replacement in _MARKDOWN_RULES:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class _ChunkBuffer:
+    """Acumula texto y lo entrega en bloques UTF-8 de tamaño acotado."""
+
+    def __init__(self):
+        self._buffer = io.StringIO()
+
+    def write(self, text: str) -> None:
+        self._buffer.write(text)
+
+    def full(self) -> bool:
+        return self._buffer.tell() >= settings.EXPORT_STREAM_CHUNK_BYTES
+
+    def take(self) -> bytes:
+        data = self._buffer.getvalue().encode("utf-8")
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+
+def _stream(query):
+    return query.execution_options(stream_results=True, yield_per=settings.EXPORT_BATCH_SIZE)
+
+
+def iter_documents_csv(workspace_id: str) -> Iterator[bytes]:
+    """CSV de los documentos del workspace, fila a fila."""
+    buffer = _ChunkBuffer()
+    writer = csv.writer(buffer)
+
+    # Escribir encabezados
+    writer.writerow(["ID", "Nombre", "Tipo", "Estado", "Chunks", "Fecha Creación"])
+
+    with database.SessionLocal() as db:
+        rows = _stream(
+            db.query(
+                Document.id,
+                Document.file_name,
+                Document.file_type,
+                Document.status,
+                Document.chunk_count,
+                Document.created_at,
+            )
+            .filter(Document.workspace_id == workspace_id)
+            .order_by(Document.created_at, Document.id)
+        )
+        for doc in rows:
+            writer.writerow(
+                [
+                    doc.id,
+                    doc.file_name,
+                    doc.file_type,
+                    doc.status,
+                    doc.chunk_count,
+                    doc.created_at.strftime("%Y-%m-%d %H:%M:%S") if doc.created_at else "",
+                ]
+            )
+            if buffer.full():
+                yield buffer.take()
+
+    yield buffer.take()
+
+
+def iter_chat_txt(
+    workspace_id: str,
+    workspace_name: str,
+    workspace_description: Optional[str],
+    conversation_id: Optional[str] = None,
+) -> Iterator[bytes]:
+    """Historial de chat en texto plano, mensaje a mensaje."""
+    buffer = _ChunkBuffer()
+    buffer.write(f"CHAT EXPORT - {workspace_name}\n")
+    buffer.write(f"{_SEPARATOR}\n")
+    buffer.write(f"Workspace: {workspace_name}\n")
+    buffer.write(f"Descripción: {workspace_description or 'N/A'}\n")
+    buffer.write(f"Fecha de exportación: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+    buffer.write(f"{_SEPARATOR}\n\n")
+
+    with database.SessionLocal() as db:
+        # Solo los encabezados de las conversaciones se cargan completos
+        conversations = db.query(Conversation.id, Conversation.title, Conversation.created_at).filter(
+            Conversation.workspace_id == workspace_id
+        )
+        if conversation_id:
+            conversations = conversations.filter(Conversation.id == conversation_id)
+        conversations = conversations.order_by(Conversation.created_at.desc()).all()
+
+        if not conversations:
+            buffer.write("No hay conversaciones en este workspace.\n")
+
+        for conv in conversations:
+            buffer.write(f"\n{_SEPARATOR}\n")
+            buffer.write(f"CONVERSACIÓN: {conv.title}\n")
+            buffer.write(f"Fecha: {conv.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n")
+            buffer.write(f"{_SEPARATOR}\n\n")
+
+            messages = _stream(
+                db.query(Message.role, Message.content, Message.created_at)
+                .filter(Message.conversation_id == conv.id)
+                .order_by(Message.created_at.asc(), Message.id.asc())
+            )
+            empty = True
+            for msg in messages:
+                empty = False
+                role = "Usuario" if msg.role == "user" else "Asistente"
+                buffer.write(f"[{msg.created_at.strftime('%H:%M:%S')}] {role}:\n")
+                # Convertir markdown a texto plano
+                buffer.write(f"{markdown_to_text(msg.content)}\n\n")
+                buffer.write(f"{_MESSAGE_SEPARATOR}\n\n")
+                if buffer.full():
+                    yield buffer.take()
+
+            if empty:
+                buffer.write("  (Sin mensajes)\n")
+
+    yield buffer.take()
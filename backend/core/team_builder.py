@@ -0,0 +1,306 @@
+"""
+Motor de armado de equipos TIVIT (/tivit/equipos/sugerir).
+
+Índices precalculados (una vez por proceso):
+- Cada característica (área, certificación, idioma, ubicación) tiene un bitset
+  de trabajadores y sus trabajadores ordenados por eficiencia (puntaje/costo),
+  por puntaje y por costo. Una consulta solo evalúa los primeros de cada
+  ranking para sus requisitos, así el tiempo no depende del tamaño del roster.
+- Cada trabajador tiene su costo mensual estimado y un puntaje base
+  (experiencia + disponibilidad).
+
+Solver:
+1. Greedy de set cover con presupuesto: en cada paso elige al candidato con
+   mejor (cobertura nueva + puntaje) / costo que aún entra en el presupuesto.
+2. Branch-and-bound acotado sobre los mejores candidatos, con el greedy como
+   solución inicial y poda por presupuesto y por cota optimista. Si se agota
+   el límite de nodos se devuelve la mejor solución encontrada.
+
+Objetivo: cubrir la mayor cantidad de requisitos (áreas, certificaciones,
+idiomas) y, a igualdad, maximizar el puntaje del equipo, sin exceder el
+presupuesto mensual ni el tamaño pedido.
+"""
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from core.tivit_index import normalize
+
+# Modelo de costos mensual (USD) por rol + incremento por año de experiencia
+COSTO_BASE_POR_ROL = {
+    "analista": 3500,
+    "desarrollador": 4500,
+    "consultor": 5000,
+    "arquitecto": 6500,
+}
+COSTO_BASE_DEFAULT = 5000
+COSTO_POR_ANO_EXPERIENCIA = 150
+
+PESO_DISPONIBILIDAD = {"inmediata": 1.0, "1_mes": 0.6, "3_meses": 0.3}
+PESO_UBICACION = 0.5
+PESO_REQUISITO = 10.0  # Cubrir un requisito pesa más que cualquier diferencia de puntaje
+
+# Límites del branch-and-bound
+MAX_CANDIDATOS_EXACTO = 24
+MAX_NODOS = 20000
+
+# Candidatos evaluados por ranking: tamaño del equipo + margen
+MARGEN_CANDIDATOS = 2
+SCAN_FACTOR = 20  # Hasta dónde se busca en un ranking a los de la ubicación preferida
+ALL_WORKERS = "*"
+
+
+def costo_mensual(trabajador) -> float:
+    """Costo mensual estimado de un trabajador según rol y experiencia."""
+    base = COSTO_BASE_POR_ROL.get(normalize(trabajador.rol), COSTO_BASE_DEFAULT)
+    return float(base + COSTO_POR_ANO_EXPERIENCIA * trabajador.anos_experiencia)
+
+
+def _features(trabajador) -> List[str]:
+    features = [f"area:{normalize(trabajador.area)}"]
+    features += [f"cert:{normalize(c)}" for c in trabajador.certificaciones]
+    features += [f"lang:{normalize(i)}" for i in trabajador.idiomas]
+    # Ubicación: cada parte de "Ciudad, País" y la nacionalidad
+    places = [p.strip() for p in trabajador.localidad.split(",")] + [trabajador.nacionalidad]
+    features += [f"loc:{normalize(p)}" for p in places if p]
+    return features
+
+
+class TeamIndex:
+    """Bitsets de trabajadores por característica y datos precalculados por trabajador."""
+
+    def __init__(self, trabajadores: list):
+        self.trabajadores = list(trabajadores)
+        self.workers_by_feature: Dict[str, int] = {}
+        self.costs: List[float] = []
+        self.base_scores: List[float] = []
+        members: Dict[str, List[int]] = {ALL_WORKERS: list(range(len(self.trabajadores)))}
+
+        for i, t in enumerate(self.trabajadores):
+            for feature in _features(t):
+                self.workers_by_feature[feature] = self.workers_by_feature.get(feature, 0) | (1 << i)
+                members.setdefault(feature, []).append(i)
+            self.costs.append(costo_mensual(t))
+            self.base_scores.append(
+                PESO_DISPONIBILIDAD.get(t.disponibilidad, 0.3) + min(t.anos_experiencia / 15, 1.0) * 0.5
+            )
+
+        # Rankings por característica: eficiencia, puntaje y costo
+        self.rankings: Dict[str, Tuple[List[int], ...]] = {
+            feature: (
+                sorted(workers, key=lambda i: -self.base_scores[i] / self.costs[i]),
+                sorted(workers, key=lambda i: -self.base_scores[i]),
+                sorted(workers, key=lambda i: self.costs[i]),
+            )
+            for feature, workers in members.items()
+        }
+
+    def workers_with(self, feature: str) -> int:
+        return self.workers_by_feature.get(feature, 0)
+
+    def top(self, feature: str, k: int, within: int = 0) -> Iterable[int]:
+        """
+        Los k primeros de cada ranking de la característica. Con `within`
+        (bitset) además los k primeros que pertenecen a ese conjunto.
+        """
+        for ranking in self.rankings.get(feature, ()):
+            yield from ranking[:k]
+            if within:
+                found = 0
+                for i in ranking[:k * SCAN_FACTOR]:
+                    if within >> i & 1:
+                        yield i
+                        found += 1
+                        if found >= k:
+                            break
+
+
+@dataclass
+class TeamRequest:
+    """Requerimientos normalizados de un equipo."""
+    areas: List[str] = field(default_factory=list)
+    certificaciones: List[str] = field(default_factory=list)
+    idiomas: List[str] = field(default_factory=list)
+    tamano_equipo: int = 3
+    presupuesto_mensual: float = 50000
+    ubicacion_preferida: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TeamRequest":
+        return cls(
+            areas=[normalize(a) for a in data.get("servicios", []) or []],
+            certificaciones=[normalize(c) for c in data.get("certificaciones", []) or []],
+            idiomas=[normalize(i) for i in data.get("idiomas", []) or []],
+            tamano_equipo=max(int(data.get("tamano_equipo", 3) or 0), 0),
+            presupuesto_mensual=float(data.get("presupuesto_mensual", 50000) or 0),
+            ubicacion_preferida=data.get("ubicacion_preferida"),
+        )
+
+    def requirements(self) -> List[str]:
+        return (
+            [f"area:{a}" for a in self.areas]
+            + [f"cert:{c}" for c in self.certificaciones]
+            + [f"lang:{i}" for i in self.idiomas]
+        )
+
+
+@dataclass
+class TeamResult:
+    members: List[int]
+    cost: float
+    covered: List[str]
+    missing: List[str]
+    score: float
+    method: str
+
+
+def _popcount(x: int) -> int:
+    return bin(x).count("1")
+
+
+class TeamBuilder:
+    """Resuelve el mejor equipo para un TeamRequest sobre un TeamIndex."""
+
+    def __init__(self, index: TeamIndex):
+        self.index = index
+
+    def _prepare(self, request: TeamRequest):
+        index = self.index
+        requirements = request.requirements()
+        # Bit de requisito (local a la consulta) -> máscara de cada candidato
+        req_masks: List[int] = []
+        for feature in requirements:
+            req_masks.append(index.workers_with(feature))
+
+        location_mask = 0
+        if request.ubicacion_preferida:
+            location_mask = index.workers_with(f"loc:{normalize(request.ubicacion_preferida)}")
+
+        # Candidatos: los mejores de cada ranking por requisito, más los mejores
+        # del roster completo para completar el equipo
+        k = max(request.tamano_equipo, 1) + MARGEN_CANDIDATOS
+        pool = set()
+        for feature in requirements + [ALL_WORKERS]:
+            pool.update(index.top(feature, k, within=location_mask))
+
+        candidates = []
+        for i in sorted(pool):
+            if index.costs[i] > request.presupuesto_mensual:
+                continue
+            coverage = 0
+            for r, mask in enumerate(req_masks):
+                if mask >> i & 1:
+                    coverage |= 1 << r
+            score = index.base_scores[i] + (PESO_UBICACION if location_mask >> i & 1 else 0.0)
+            candidates.append((i, coverage, score, index.costs[i]))
+        return requirements, candidates
+
+    @staticmethod
+    def _value(coverage: int, score: float) -> float:
+        return _popcount(coverage) * PESO_REQUISITO + score
+
+    def _greedy(self, candidates, size: int, budget: float) -> Tuple[List[int], int, float, float]:
+        chosen, covered, score, cost = [], 0, 0.0, 0.0
+        remaining = list(candidates)
+        while len(chosen) < size and remaining:
+            best, best_ratio = None, -1.0
+            for cand in remaining:
+                i, coverage, s, c = cand
+                if cost + c > budget:
+                    continue
+                gain = _popcount(coverage & ~covered) * PESO_REQUISITO + s
+                ratio = gain / max(c, 1.0)
+                if ratio > best_ratio:
+                    best, best_ratio = cand, ratio
+            if best is None:
+                break
+            remaining.remove(best)
+            chosen.append(best[0])
+            covered |= best[1]
+            score += best[2]
+            cost += best[3]
+        return chosen, covered, score, cost
+
+    def _branch_and_bound(self, candidates, size: int, budget: float, incumbent):
+        """Búsqueda exacta acotada; devuelve la mejor solución y si se completó."""
+        # Ordenar por valor individual descendente para encontrar buenas soluciones pronto
+        candidates = sorted(candidates, key=lambda c: -self._value(c[1], c[2]))
+        best_chosen, best_covered, best_score, best_cost = incumbent
+        best_value = self._value(best_covered, best_score)
+        # Cota: el mejor puntaje restante a partir de cada posición
+        max_score_from = [0.0] * (len(candidates) + 1)
+        for k in range(len(candidates) - 1, -1, -1):
+            max_score_from[k] = max(max_score_from[k + 1], candidates[k][2])
+        coverable = 0
+        for c in candidates:
+            coverable |= c[1]
+        nodes = 0
+        exhausted = True
+
+        def search(k, chosen, covered, score, cost):
+            nonlocal best_chosen, best_covered, best_score, best_cost, best_value, nodes, exhausted
+            nodes += 1
+            if nodes > MAX_NODOS:
+                exhausted = False
+                return
+            value = self._value(covered, score)
+            if value > best_value:
+                best_chosen, best_covered, best_score, best_cost = list(chosen), covered, score, cost
+                best_value = value
+            if len(chosen) >= size or k >= len(candidates):
+                return
+            slots = size - len(chosen)
+            bound = (
+                value
+                + _popcount(coverable & ~covered) * PESO_REQUISITO
+                + slots * max_score_from[k]
+            )
+            if bound <= best_value:
+                return
+            for j in range(k, len(candidates)):
+                i, coverage, s, c = candidates[j]
+                if cost + c > budget:
+                    continue
+                chosen.append(i)
+                search(j + 1, chosen, covered | coverage, score + s, cost + c)
+                chosen.pop()
+                if nodes > MAX_NODOS:
+                    return
+
+        search(0, [], 0, 0.0, 0.0)
+        return (best_chosen, best_covered, best_score, best_cost), exhausted
+
+    def build(self, request: TeamRequest) -> TeamResult:
+        requirements, candidates = self._prepare(request)
+        size, budget = request.tamano_equipo, request.presupuesto_mensual
+
+        solution = self._greedy(candidates, size, budget)
+        method = "greedy"
+        if size > 0 and candidates:
+            # Solo los mejores candidatos entran a la búsqueda exacta; los elegidos
+            # por el greedy siempre entran para que la solución inicial sea alcanzable
+            pool = sorted(candidates, key=lambda c: -self._value(c[1], c[2]) / max(c[3], 1.0))
+            pool = pool[:MAX_CANDIDATOS_EXACTO]
+            in_pool = {c[0] for c in pool}
+            pool += [c for c in candidates if c[0] in solution[0] and c[0] not in in_pool]
+            solution, exhausted = self._branch_and_bound(pool, size, budget, solution)
+            method = "branch_and_bound" if exhausted else "branch_and_bound_parcial"
+
+        chosen, covered, score, cost = solution
+        # Orden estable: el del roster
+        chosen = sorted(chosen)
+        return TeamResult(
+            members=chosen,
+            cost=cost,
+            covered=[r for k, r in enumerate(requirements) if covered >> k & 1],
+            missing=[r for k, r in enumerate(requirements) if not covered >> k & 1],
+            score=round(score, 3),
+            method=method,
+        )
+
+
+@lru_cache(maxsize=1)
+def get_team_builder() -> TeamBuilder:
+    """Builder con el índice del roster actual (get_team_builder.cache_clear() para reconstruir)."""
+    from api.routes.tivit import TRABAJADORES_TIVIT
+    return TeamBuilder(TeamIndex(TRABAJADORES_TIVIT))
@@ -0,0 +1,213 @@
+"""
+Índice invertido sobre los datos TIVIT (TRABAJADORES_TIVIT / SERVICIOS_TIVIT).
+
+Se construye una vez por proceso y resuelve qué trabajadores y servicios son
+relevantes para las keywords de una consulta sin recorrer las listas:
+
+- Por área (Desarrollo, Ciberseguridad, Cloud, Datos), precalculando el mismo
+  criterio de coincidencia que antes se evaluaba en cada consulta.
+- Por término: certificaciones y tecnologías (normalizados a minúsculas y sin
+  tildes, por palabra y por frase completa). Los términos solo ordenan dentro
+  de las áreas detectadas; sin área, seleccionan directamente. Los idiomas y
+  las palabras genéricas de los títulos ("professional", "lead"...) no se
+  indexan: aparecen en consultas normales y no dicen nada del perfil.
+
+Los textos de los chunks también se precalculan. `version` es un hash del
+contenido de los datos: forma parte de las claves de caché, así que si cambian
+los datos las entradas viejas dejan de usarse solas.
+"""
+import hashlib
+import json
+import unicodedata
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Set, Tuple
+
+from models import schemas
+
+# Keywords de la consulta -> área TIVIT relevante
+AREA_KEYWORDS: Dict[str, FrozenSet[str]] = {
+    "Desarrollo": frozenset(
+        ["desarrollo", "programador", "developer", "software", "web", "mobile", "backend", "frontend"]
+    ),
+    "Ciberseguridad": frozenset(
+        ["seguridad", "ciberseguridad", "cybersecurity", "hacking", "pentest", "auditoria"]
+    ),
+    "Cloud": frozenset(["cloud", "aws", "azure", "gcp", "nube", "infraestructura"]),
+    "Datos": frozenset(["datos", "data", "analytics", "bi", "machine learning", "ml", "ai"]),
+}
+
+# Palabras de certificaciones demasiado genéricas para seleccionar perfiles
+GENERIC_TERMS = frozenset([
+    "administrator", "agilist", "architect", "associate", "auditor", "coach",
+    "deep", "developer", "engineer", "fundamentals", "lead", "learning",
+    "master", "professional", "safe", "solutions", "specialization",
+    "specialty", "stack",
+])
+
+_AREA_WORDS = frozenset().union(*AREA_KEYWORDS.values())
+
+MAX_TRABAJADORES = 8
+MAX_SERVICIOS = 4
+
+
+def normalize(text: str) -> str:
+    """Minúsculas y sin tildes ("Inglés" -> "ingles")."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def _terms(values: Iterable[str]) -> Set[str]:
+    """Términos indexables: cada frase completa y cada una de sus palabras."""
+    terms = set()
+    for value in values:
+        phrase = normalize(value)
+        terms.add(phrase)
+        terms.update(
+            word for word in phrase.replace("/", " ").split()
+            if len(word) > 1 and word not in GENERIC_TERMS
+        )
+    return terms
+
+
+def _ranked(candidates: Set[int], preferred: Set[int]) -> List[int]:
+    """Candidatos en orden de los datos, con los preferidos primero."""
+    return sorted(candidates, key=lambda i: (i not in preferred, i))
+
+
+class TivitIndex:
+    """Índice invertido de trabajadores y servicios TIVIT con chunks precalculados."""
+
+    def __init__(self, trabajadores: list, servicios: list):
+        self.trabajadores = list(trabajadores)
+        self.servicios = list(servicios)
+
+        # Área -> posiciones (mismo criterio que el filtrado lineal original)
+        self.workers_by_area: Dict[str, Set[int]] = {}
+        self.services_by_area: Dict[str, Set[int]] = {}
+        for area in AREA_KEYWORDS:
+            needle = area.lower()
+            self.workers_by_area[area] = {
+                i for i, t in enumerate(self.trabajadores)
+                if needle in t.area.lower() or needle in t.area_experiencia.lower()
+            }
+            self.services_by_area[area] = {
+                i for i, s in enumerate(self.servicios) if needle in s.categoria.lower()
+            }
+
+        # Término (certificación / tecnología) -> posiciones
+        self.workers_by_term: Dict[str, Set[int]] = {}
+        for i, t in enumerate(self.trabajadores):
+            for term in _terms(t.certificaciones):
+                self.workers_by_term.setdefault(term, set()).add(i)
+        self.services_by_term: Dict[str, Set[int]] = {}
+        for i, s in enumerate(self.servicios):
+            for term in _terms(s.tecnologias_principales):
+                self.services_by_term.setdefault(term, set()).add(i)
+
+        self.vocabulary: FrozenSet[str] = frozenset(self.workers_by_term) | frozenset(self.services_by_term)
+        self.worker_texts = [self._worker_text(t) for t in self.trabajadores]
+        self.service_texts = [self._service_text(s) for s in self.servicios]
+        self.version = self._content_hash()
+
+    @staticmethod
+    def _worker_text(trabajador) -> str:
+        return (
+            f"TIVIT {trabajador.nombre}: {trabajador.area} con {trabajador.anos_experiencia} años exp. "
+            f"Certificaciones: {', '.join(trabajador.certificaciones[:3])}. Rol: {trabajador.rol}. "
+            f"Idiomas: {', '.join(trabajador.idiomas)}. Disponibilidad: {trabajador.disponibilidad}."
+        )
+
+    @staticmethod
+    def _service_text(servicio) -> str:
+        return (
+            f"Servicio TIVIT {servicio.nombre}: {servicio.descripcion[:100]}... "
+            f"Costo: ${servicio.costo_mensual_min}-${servicio.costo_mensual_max}/mes. "
+            f"Duración: {servicio.duracion_estimada_meses} meses. "
+            f"Tecnologías: {', '.join(servicio.tecnologias_principales[:3])}."
+        )
+
+    def _content_hash(self) -> str:
+        payload = json.dumps(
+            {"t": self.worker_texts, "s": self.service_texts}, sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
+    def relevant_areas(self, query_keywords: Iterable[str]) -> Set[str]:
+        keywords = set(query_keywords)
+        return {area for area, words in AREA_KEYWORDS.items() if keywords & words}
+
+    def search(self, query_keywords: Iterable[str]) -> Tuple[List[int], List[int]]:
+        """
+        Posiciones de trabajadores y servicios relevantes, limitadas a
+        MAX_TRABAJADORES / MAX_SERVICIOS.
+
+        Con áreas detectadas el resultado es el del filtrado original por área
+        (mismo orden de los datos); los que además coinciden con algún término
+        de la consulta pasan primero. Sin áreas deciden los términos y, si
+        tampoco hay, se usan todas las áreas (por separado para trabajadores y
+        servicios).
+        """
+        keywords = {normalize(kw) for kw in query_keywords}
+        areas = self.relevant_areas(keywords)
+
+        term_workers: Set[int] = set()
+        term_services: Set[int] = set()
+        # Las keywords de área ya eligieron las áreas: no reordenan
+        for kw in keywords - _AREA_WORDS:
+            term_workers |= self.workers_by_term.get(kw, set())
+            term_services |= self.services_by_term.get(kw, set())
+
+        workers: Set[int] = set()
+        services: Set[int] = set()
+        for area in areas or AREA_KEYWORDS:
+            workers |= self.workers_by_area[area]
+            services |= self.services_by_area[area]
+        if not areas:
+            workers = term_workers or workers
+            services = term_services or services
+
+        return (
+            _ranked(workers, term_workers)[:MAX_TRABAJADORES],
+            _ranked(services, term_services)[:MAX_SERVICIOS],
+        )
+
+    def chunks_for(self, query_keywords: Iterable[str]) -> List[schemas.DocumentChunk]:
+        """Chunks de contexto TIVIT para las keywords de la consulta."""
+        workers, services = self.search(query_keywords)
+        chunks = []
+        for i in workers:
+            chunks.append(
+                schemas.DocumentChunk(
+                    document_id="tivit-trabajadores",
+                    chunk_text=self.worker_texts[i],
+                    chunk_index=len(chunks),
+                    score=0.95,  # Alta relevancia para datos filtrados
+                )
+            )
+        for i in services:
+            chunks.append(
+                schemas.DocumentChunk(
+                    document_id="tivit-servicios",
+                    chunk_text=self.service_texts[i],
+                    chunk_index=len(chunks),
+                    score=0.85,
+                )
+            )
+        return chunks
+
+    def cache_key(self, query_keywords: Iterable[str], prefix: str = "tivit_chunks:") -> str:
+        """Clave estable entre procesos: versión de los datos + hash de las keywords."""
+        canonical = "\x1f".join(sorted({normalize(kw) for kw in query_keywords}))
+        digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+        return f"{prefix}{self.version}:{digest}"
+
+
+@lru_cache(maxsize=1)
+def get_tivit_index() -> TivitIndex:
+    """Índice construido una vez por proceso (get_tivit_index.cache_clear() para reconstruir)."""
+    try:
+        from api.routes.tivit import SERVICIOS_TIVIT, TRABAJADORES_TIVIT
+    except Exception as e:
+        print(f"Error cargando datos TIVIT: {e}")
+        return TivitIndex([], [])
+    return TivitIndex(TRABAJADORES_TIVIT, SERVICIOS_TIVIT)
@@ -0,0 +1,223 @@
+"""
+Búsqueda vectorial sobre los perfiles TIVIT (trabajadores y servicios).
+
+Reemplaza al recomendador externo (localhost:8095) por una búsqueda en proceso:
+
+- Cada perfil se convierte en un vector disperso "hasheado" (feature hashing)
+  de palabras normalizadas + trigramas de caracteres, con ponderación TF-IDF.
+  Los trigramas acercan variantes ("desarrollo" / "desarrollador") y un mapa de
+  sinónimos acerca términos equivalentes ("nube" / "cloud").
+- La matriz (perfiles x TIVIT_VECTOR_DIM, float32, filas normalizadas) se
+  guarda en TIVIT_VECTORS_DIR y se abre con memory-map: los workers comparten
+  las mismas páginas en memoria. El archivo lleva el hash del contenido en el
+  nombre, así que si cambian los datos se regenera solo.
+- `search` resuelve una lista de requerimientos en una sola multiplicación de
+  matrices (similitud coseno) + top-k con argpartition.
+"""
+import hashlib
+import logging
+import os
+import re
+import zlib
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from core.config import settings
+from core.tivit_index import normalize
+
+logger = logging.getLogger(__name__)
+
+# Términos equivalentes -> término canónico (se agrega además del original)
+SINONIMOS: Dict[str, str] = {
+    "nube": "cloud",
+    "ciberseguridad": "seguridad",
+    "cybersecurity": "seguridad",
+    "security": "seguridad",
+    "pentest": "seguridad",
+    "pentesting": "seguridad",
+    "ia": "inteligencia_artificial",
+    "ai": "inteligencia_artificial",
+    "ml": "machine_learning",
+    "datos": "data",
+    "analytics": "data",
+    "programador": "developer",
+    "desarrollador": "developer",
+    "desarrollo": "developer",
+    "ingles": "english",
+    "portugues": "portuguese",
+    "espanol": "spanish",
+    "devops": "infraestructura",
+    "kubernetes": "contenedores",
+    "docker": "contenedores",
+    "k8s": "contenedores",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9+#]+")
+_TRIGRAM_WEIGHT = 0.5
+
+
+def _tokens(text: str) -> List[str]:
+    tokens = _TOKEN_RE.findall(normalize(text))
+    expanded = list(tokens)
+    for token in tokens:
+        if token in SINONIMOS:
+            expanded.append(SINONIMOS[token])
+    # Bigramas frecuentes ("machine learning", "inteligencia artificial")
+    expanded += [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+    return expanded
+
+
+def _term_frequencies(text: str, dim: int) -> Dict[int, float]:
+    """Frecuencias por bucket (hash estable entre procesos: crc32, no hash())."""
+    tf: Dict[int, float] = {}
+    for token in _tokens(text):
+        bucket = zlib.crc32(f"w:{token}".encode()) % dim
+        tf[bucket] = tf.get(bucket, 0.0) + 1.0
+        padded = f"#{token}#"
+        for i in range(len(padded) - 2):
+            bucket = zlib.crc32(f"c:{padded[i:i + 3]}".encode()) % dim
+            tf[bucket] = tf.get(bucket, 0.0) + _TRIGRAM_WEIGHT
+    return tf
+
+
+def _trabajador_text(t) -> str:
+    return " ".join([
+        t.rol, t.area, t.area_experiencia, " ".join(t.certificaciones),
+        " ".join(t.idiomas), t.localidad,
+    ])
+
+
+def _servicio_text(s) -> str:
+    return " ".join([
+        s.nombre, s.categoria, s.descripcion, s.nivel_dificultad,
+        " ".join(s.tecnologias_principales),
+    ])
+
+
+@dataclass
+class ProfileMatch:
+    tipo: str  # "trabajador" | "servicio"
+    id: str
+    nombre: str
+    score: float
+
+    def to_dict(self) -> dict:
+        return {"tipo": self.tipo, "id": self.id, "nombre": self.nombre, "score": round(self.score, 4)}
+
+
+class TivitVectorIndex:
+    """Matriz de embeddings de perfiles TIVIT con búsqueda top-k por lotes."""
+
+    def __init__(self, trabajadores: list, servicios: list, dim: int = 1024, cache_dir: Optional[str] = None):
+        self.dim = dim
+        self.profiles = (
+            [("trabajador", t.id, t.nombre, _trabajador_text(t)) for t in trabajadores]
+            + [("servicio", s.id, s.nombre, _servicio_text(s)) for s in servicios]
+        )
+        self.kinds = np.array([p[0] for p in self.profiles])
+        self.version = hashlib.sha256(
+            "\x1e".join(p[3] for p in self.profiles).encode("utf-8")
+        ).hexdigest()[:12]
+        self.matrix, self.idf = self._load_or_build(cache_dir)
+
+    def _build(self):
+        n = len(self.profiles)
+        tf = np.zeros((n, self.dim), dtype=np.float32)
+        for row, profile in enumerate(self.profiles):
+            for bucket, value in _term_frequencies(profile[3], self.dim).items():
+                tf[row, bucket] = value
+        df = np.count_nonzero(tf, axis=0)
+        idf = (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+        matrix = tf * idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+        return matrix, idf
+
+    def _load_or_build(self, cache_dir: Optional[str]):
+        if not cache_dir:
+            return self._build()
+
+        base = os.path.join(cache_dir, f"tivit_{self.version}_{self.dim}")
+        matrix_path, idf_path = f"{base}.matrix.npy", f"{base}.idf.npy"
+        if not (os.path.exists(matrix_path) and os.path.exists(idf_path)):
+            matrix, idf = self._build()
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                # Escritura atómica: otro worker puede estar leyendo el mismo archivo
+                for path, array in ((matrix_path, matrix), (idf_path, idf)):
+                    tmp = f"{path}.{os.getpid()}.tmp"
+                    with open(tmp, "wb") as fh:
+                        np.save(fh, array)
+                    os.replace(tmp, path)
+            except OSError as e:
+                logger.warning(f"No se pudo guardar la matriz TIVIT en {cache_dir}: {e}")
+                return matrix, idf
+        return np.load(matrix_path, mmap_mode="r"), np.load(idf_path)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Vectores normalizados (len(texts) x dim) para textos de consulta."""
+        queries = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for bucket, value in _term_frequencies(text, self.dim).items():
+                queries[row, bucket] = value
+        queries *= self.idf
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        return queries / np.where(norms == 0, 1, norms)
+
+    def search(
+        self,
+        requirements: List[str],
+        k: int = 3,
+        tipo: Optional[str] = None,
+        min_score: float = 0.0
+    ) -> List[List[ProfileMatch]]:
+        """
+        Top-k perfiles por requerimiento (una sola operación matricial para todos).
+
+        Args:
+            requirements: Textos de requerimientos (skills, rol, tecnologías...)
+            k: Perfiles por requerimiento
+            tipo: "trabajador" o "servicio" para filtrar (opcional)
+            min_score: Similitud coseno mínima
+        """
+        if not requirements or not self.profiles:
+            return [[] for _ in requirements]
+
+        scores = self.embed(requirements) @ self.matrix.T  # (m x n)
+        if tipo:
+            scores = np.where(self.kinds == tipo, scores, -1.0)
+
+        k = max(1, min(k, scores.shape[1]))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        rows = np.arange(scores.shape[0])[:, None]
+        order = np.argsort(-scores[rows, top], axis=1)
+        top = top[rows, order]
+
+        results = []
+        for r, columns in enumerate(top):
+            matches = []
+            for c in columns:
+                score = float(scores[r, c])
+                if score <= min_score:
+                    continue
+                kind, profile_id, nombre, _ = self.profiles[c]
+                matches.append(ProfileMatch(kind, profile_id, nombre, score))
+            results.append(matches)
+        return results
+
+
+@lru_cache(maxsize=1)
+def get_tivit_vectors() -> TivitVectorIndex:
+    """Índice vectorial de perfiles TIVIT (se construye/carga una vez por proceso)."""
+    from api.routes.tivit import SERVICIOS_TIVIT, TRABAJADORES_TIVIT
+    index = TivitVectorIndex(
+        TRABAJADORES_TIVIT,
+        SERVICIOS_TIVIT,
+        dim=settings.TIVIT_VECTOR_DIM,
+        cache_dir=settings.TIVIT_VECTORS_DIR,
+    )
+    logger.info(f"✅ Índice vectorial TIVIT listo ({len(index.profiles)} perfiles, v{index.version})")
+    return index
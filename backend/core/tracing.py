@@ -0,0 +1,126 @@
+"""
+Trazas del pipeline de chat (OpenTelemetry).
+
+- Cada request HTTP abre un span raíz (TracingMiddleware) que continúa el
+  contexto recibido en el header `traceparent`, si existe.
+- Las etapas del chat (auth, conversación, RAG, intención, historial, LLM) se
+  miden con `stage(...)`: crean un span hijo y además guardan su duración en el
+  desglose de tiempos de la request (opcionalmente devuelto al cliente).
+- `inject_headers` propaga el contexto al servicio RAG.
+
+Exportador local: TRACING_EXPORTER=console (stdout) o file (TRACING_FILE_PATH,
+un span JSON por línea). Con TRACING_ENABLED=false los spans son no-op, pero el
+desglose de tiempos sigue disponible.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.trace import SpanKind
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+tracer = trace.get_tracer("caso01.backend")
+
+# Desglose de tiempos (ms por etapa) de la request en curso
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def setup_tracing(service_name: str = "caso01-backend"):
+    """Configura el TracerProvider con el exportador local (si el tracing está habilitado)."""
+    if not settings.TRACING_ENABLED:
+        return
+
+    def formatter(span) -> str:
+        return span.to_json(indent=None) + os.linesep
+
+    if settings.TRACING_EXPORTER == "file":
+        out = open(settings.TRACING_FILE_PATH, "a", encoding="utf-8")
+        exporter = ConsoleSpanExporter(out=out, formatter=formatter)
+    else:
+        exporter = ConsoleSpanExporter(formatter=formatter)
+
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    logger.info(f"🔭 Tracing habilitado ({settings.TRACING_EXPORTER})")
+
+
+@contextmanager
+def stage(name: str, **attributes):
+    """
+    Mide una etapa: span hijo del span actual + duración en el desglose de la request.
+
+    Uso:
+        with tracing.stage("rag.search", workspace_id=workspace_id):
+            ...
+    """
+    attributes = {k: v for k, v in attributes.items() if v is not None}
+    start = time.perf_counter()
+    with tracer.start_as_current_span(name, attributes=attributes) as span:
+        try:
+            yield span
+        finally:
+            record_timing(name, time.perf_counter() - start)
+
+
+def record_timing(name: str, seconds: float):
+    """Agrega una duración al desglose de la request actual (si hay una activa)."""
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = round(seconds * 1000, 1)
+
+
+def get_timings() -> Dict[str, float]:
+    """Desglose de tiempos (ms) acumulado hasta ahora en la request actual."""
+    return dict(_timings.get() or {})
+
+
+def inject_headers(headers: Optional[dict] = None) -> dict:
+    """Agrega el contexto de traza actual (traceparent) a los headers salientes."""
+    headers = dict(headers or {})
+    propagate.inject(headers)
+    return headers
+
+
+class TracingMiddleware:
+    """Middleware ASGI: span raíz por request y desglose de tiempos vacío."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {
+            key.decode("latin-1"): value.decode("latin-1")
+            for key, value in scope.get("headers", [])
+        }
+        method = scope.get("method", "")
+        token = _timings.set({})
+        try:
+            with tracer.start_as_current_span(
+                f"{method} {scope.get('path', '')}",
+                context=propagate.extract(headers),
+                kind=SpanKind.SERVER,
+            ) as span:
+                try:
+                    await self.app(scope, receive, send)
+                finally:
+                    # Renombrar con la plantilla de la ruta una vez resuelta
+                    route = scope.get("route")
+                    if getattr(route, "path", None):
+                        span.update_name(f"{method} {route.path}")
+        finally:
+            _timings.reset(token)
@@ -0,0 +1,167 @@
+"""
+Caché de usuarios autenticados (get_current_user).
+
+Cada request autenticada resolvía el usuario con un SELECT por email. Este
+módulo guarda, por subject del token (`sub`), una copia de las columnas del
+usuario durante AUTH_USER_CACHE_TTL_SECONDS en memoria del proceso.
+
+Invalidación:
+- Los cambios sobre `User` (update/delete) se detectan con eventos del mapper
+  y, al confirmarse la transacción, se publican en Redis (pub/sub). Cada
+  worker escucha el canal y descarta la entrada: desactivar un usuario o
+  cambiar su email se refleja enseguida en todos los procesos.
+- Si Redis no está disponible, el TTL corto acota cuánto puede durar una
+  entrada desactualizada.
+"""
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from core.config import settings
+from models.user import User
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "auth:user_invalidate"
+
+# Columnas que se guardan (relaciones y atributos diferidos se cargan bajo demanda)
+_COLUMNS = [c.key for c in inspect(User).column_attrs]
+
+
+class UserCache:
+    """Snapshots de usuarios por subject del token, con TTL y pub/sub de invalidaciones."""
+
+    def __init__(self, ttl: float, redis_url: Optional[str] = None):
+        self.ttl = ttl
+        self.redis_url = redis_url
+        self._entries: Dict[str, Tuple[float, dict]] = {}
+        self._lock = threading.Lock()
+        self._redis = None
+        self._listener: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # Lectura / escritura
+    # ------------------------------------------------------------------
+    def get(self, subject: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[subject]
+                return None
+            return entry[1]
+
+    def set(self, subject: str, user: User):
+        snapshot = {key: getattr(user, key) for key in _COLUMNS}
+        with self._lock:
+            self._entries[subject] = (time.monotonic() + self.ttl, snapshot)
+
+    def discard(self, subject: str):
+        with self._lock:
+            self._entries.pop(subject, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @staticmethod
+    def attach(snapshot: dict, db: Session) -> User:
+        """
+        Reconstruye el usuario y lo asocia a la sesión sin consultar la BD
+        (merge con load=False): las rutas pueden modificarlo y hacer commit.
+        """
+        user = User(**snapshot)
+        make_transient_to_detached(user)
+        return db.merge(user, load=False)
+
+    # ------------------------------------------------------------------
+    # Invalidación entre workers
+    # ------------------------------------------------------------------
+    def _client(self):
+        if self._redis is None and self.redis_url:
+            import redis
+            self._redis = redis.from_url(self.redis_url, socket_timeout=2)
+        return self._redis
+
+    def publish_invalidation(self, subjects):
+        """Descarta los subjects localmente y avisa al resto de workers."""
+        for subject in subjects:
+            self.discard(subject)
+        try:
+            client = self._client()
+            if client:
+                for subject in subjects:
+                    client.publish(INVALIDATION_CHANNEL, subject)
+        except Exception as e:
+            logger.warning(f"No se pudo publicar invalidación de usuario: {e}")
+
+    def start_listener(self):
+        """Arranca (una vez por proceso) el hilo que escucha las invalidaciones."""
+        if self._listener is not None or not self.redis_url:
+            return
+        self._listener = threading.Thread(target=self._listen, name="user-cache-invalidation", daemon=True)
+        self._listener.start()
+
+    def _listen(self):
+        import redis
+        while True:
+            try:
+                client = redis.from_url(self.redis_url)
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Al (re)conectar pueden haberse perdido mensajes
+                self.clear()
+                for message in pubsub.listen():
+                    data = message.get("data")
+                    if isinstance(data, bytes):
+                        self.discard(data.decode("utf-8"))
+            except Exception as e:
+                logger.warning(f"Listener de invalidación de usuarios desconectado: {e}")
+                time.sleep(5)
+
+
+_user_cache: Optional[UserCache] = None
+
+
+def get_user_cache() -> Optional[UserCache]:
+    """Instancia del caché (None si AUTH_USER_CACHE_TTL_SECONDS es 0)."""
+    global _user_cache
+    if _user_cache is None and settings.AUTH_USER_CACHE_TTL_SECONDS > 0:
+        _user_cache = UserCache(settings.AUTH_USER_CACHE_TTL_SECONDS, getattr(settings, "REDIS_URL", None))
+        _user_cache.start_listener()
+    return _user_cache
+
+
+# ----------------------------------------------------------------------
+# Eventos: invalidar al confirmar cambios sobre usuarios
+# ----------------------------------------------------------------------
+def _collect(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is None:
+        return
+    subjects = session.info.setdefault("invalidated_users", set())
+    subjects.add(target.email)
+    # Si cambió el email, el token viejo sigue apuntando al anterior
+    subjects.update(v for v in inspect(target).attrs.email.history.deleted if v)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_user_invalidations(session):
+    subjects = session.info.pop("invalidated_users", None)
+    cache = get_user_cache() if subjects else None
+    if cache is not None:
+        cache.publish_invalidation(subjects)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_user_invalidations(session):
+    session.info.pop("invalidated_users", None)
+
+
+event.listen(User, "after_update", _collect)
+event.listen(User, "after_delete", _collect)
@@ -12,6 +12,10 @@ from models import database
 from sqlalchemy.exc import OperationalError
 from starlette.middleware.cors import CORSMiddleware
 from core import llm_service
+from core.prometheus_metrics import PrometheusMiddleware, metrics_response
+from core.tracing import TracingMiddleware, setup_tracing
+from core.read_routing import ReadYourWritesMiddleware
+from core import db_instrumentation
 
 # Rate Limiting
 from slowapi import Limiter, _rate_limit_exceeded_handler
@@ -29,6 +33,12 @@ from middleware.security_headers import SecurityHeadersMiddleware
 setup_logging(log_level=os.getenv("LOG_LEVEL", "INFO"))
 logger = logging.getLogger(__name__)
 
+# --- Configurar Tracing (OpenTelemetry) ---
+setup_tracing("caso01-backend")
+
+# --- Registro de consultas SQL lentas ---
+db_instrumentation.install()
+
 # --- Configurar Rate Limiter ---
 limiter = Limiter(key_func=get_remote_address)
 
@@ -51,7 +61,7 @@ def create_tables_with_retry(max_retries=5, delay=3):
                 f"Intento {attempt + 1}/{max_retries} de crear tablas en la base de datos..."
             )
             # Import models to ensure they are registered with Base
-            from models import User, Workspace, Document, Conversation, Message
+            from models import User, Workspace, Document, Conversation, Message, WorkspaceStats, AnalysisItem
 
             database.Base.metadata.create_all(bind=database.engine)
             logger.info("✅ Tablas creadas exitosamente.")
@@ -89,6 +99,14 @@ except Exception as e:
 logger.info("Inicializando providers de LLM...")
 llm_service.initialize_providers()
 
+# Construir/cargar el índice vectorial de perfiles TIVIT
+try:
+    from core.tivit_vectors import get_tivit_vectors
+
+    get_tivit_vectors()
+except Exception as e:
+    logger.warning(f"⚠️ No se pudo construir el índice vectorial TIVIT: {e}")
+
 app = FastAPI(
     title="Sistema de IA Empresarial (Multi-LLM)",
     description="Backend para RAG, gestión de documentos y análisis de propuestas.",
@@ -99,6 +117,19 @@ app = FastAPI(
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+# --- Métricas Prometheus (latencia por ruta) ---
+app.add_middleware(PrometheusMiddleware)
+
+# --- Consultas SQL lentas asociadas a la ruta que las ejecuta ---
+app.add_middleware(db_instrumentation.QueryRouteMiddleware)
+
+# --- Tracing: span raíz por request + desglose de tiempos ---
+app.add_middleware(TracingMiddleware)
+
+# --- Read-your-writes: tras una escritura, el usuario lee del primario ---
+if settings.DATABASE_REPLICA_URL:
+    app.add_middleware(ReadYourWritesMiddleware)
+
 # --- Configurar Security Headers Middleware ---
 app.add_middleware(SecurityHeadersMiddleware)
 
@@ -130,6 +161,14 @@ app.include_router(tivit.router, prefix="/api/v1", tags=["TIVIT Services"])
 app.include_router(notifications_ws.router, prefix="/api/v1", tags=["Notifications"])
 app.include_router(rag_proxy.router, prefix="/api/v1/rag", tags=["RAG Service (Proxy)"])
 app.include_router(general_chat.router, prefix="/api/v1", tags=["General Chat"])
+app.include_router(metrics.router, prefix="/api/v1", tags=["Metrics"])
+
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    """Métricas en formato Prometheus (scrape interno, sin autenticación)."""
+    return metrics_response()
+
 
 # Tasks Router (sin prefijo v1 estricto, o interno)
 from api.routes import tasks
@@ -153,6 +192,14 @@ def read_root(request: Request):
     }
 
 
+@app.on_event("shutdown")
+async def flush_pending_messages():
+    """Escribe los mensajes de chat que quedan en la cola write-behind."""
+    from core.message_writer import message_writer
+
+    await message_writer.stop()
+
+
 @app.exception_handler(ServiceException)
 async def service_exception_handler(request: Request, exc: ServiceException):
     return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
@@ -3,5 +3,7 @@ from .workspace import Workspace
 from .document import Document
 from .conversation import Conversation, Message
 from .user import User
+from .workspace_stats import WorkspaceStats
+from .analysis_item import AnalysisItem
 
-__all__ = ["Base", "get_db", "Workspace", "Document", "Conversation", "Message", "User"]
+__all__ = ["Base", "get_db", "Workspace", "Document", "Conversation", "Message", "User", "WorkspaceStats", "AnalysisItem"]
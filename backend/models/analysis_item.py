@@ -0,0 +1,41 @@
+from sqlalchemy import Column, String, DateTime, Integer, ForeignKey, Index
+from sqlalchemy.dialects.mysql import CHAR
+from sqlalchemy.orm import relationship
+from .database import Base
+
+
+class AnalysisItem(Base):
+    """
+    Elemento estructurado extraído del análisis (suggestion_full) de un documento.
+
+    - kind="requirement": preguntas críticas (🔴 -> pending, prioridad high),
+      importantes (🟡 -> partial, medium) y supuestos (📝 -> completed, low).
+    - kind="deadline": fechas límite detectadas, con título y contexto.
+
+    Se generan al guardar el análisis (core/analysis_extractor.py) para que
+    /compliance y /deadlines no vuelvan a parsear el texto en cada request.
+    """
+    __tablename__ = "analysis_items"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    document_id = Column(
+        CHAR(36), ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    workspace_id = Column(
+        CHAR(36), ForeignKey("workspaces.id", ondelete="CASCADE"), nullable=False
+    )
+    kind = Column(String(20), nullable=False)
+    status = Column(String(20), nullable=True)
+    priority = Column(String(10), nullable=True)
+    text = Column(String(255), nullable=False)
+    title = Column(String(255), nullable=True)
+    due_date = Column(DateTime, nullable=True)
+    # Orden de aparición dentro del análisis
+    position = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("idx_analysis_ws_kind_status", "workspace_id", "kind", "status"),
+        Index("idx_analysis_ws_kind_due", "workspace_id", "kind", "due_date"),
+    )
+
+    document = relationship("Document", back_populates="analysis_items")
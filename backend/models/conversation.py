@@ -1,9 +1,28 @@
 from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Integer, Index, Boolean
+from sqlalchemy.dialects import mysql
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import expression, func
 from .database import Base
 import uuid
 
+
+class now_precise(expression.FunctionElement):
+    """CURRENT_TIMESTAMP con microsegundos (MySQL exige la misma precisión que la columna)."""
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(now_precise)
+def _now_precise_default(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
+
+@compiles(now_precise, "mysql")
+def _now_precise_mysql(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP(6)"
+
+
 class Conversation(Base):
     """
     Modelo para almacenar conversaciones (títulos de chat).
@@ -17,6 +36,10 @@ class Conversation(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     has_proposal = Column(Boolean, default=False)
+
+    # Memoria compacta: resumen incremental de los mensajes más antiguos
+    summary = Column(Text, nullable=True)
+    summary_message_count = Column(Integer, default=0, server_default="0", nullable=False)
     
     # ÍNDICES
     __table_args__ = (
@@ -48,7 +71,15 @@ class Message(Base):
     role = Column(String(20), nullable=False)
     content = Column(Text, nullable=False)
     chunk_references = Column(Text, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Respuesta parcial: el cliente se desconectó antes de terminar el stream
+    is_truncated = Column(Boolean, default=False, server_default="0", nullable=False)
+    # Con microsegundos: el mensaje del usuario y el del asistente de un turno
+    # suelen caer en el mismo segundo y el orden (created_at, id) debe ser el real
+    created_at = Column(
+        DateTime(timezone=True).with_variant(mysql.DATETIME(fsp=6), "mysql"),
+        server_default=now_precise(),
+        nullable=False,
+    )
     
     # ÍNDICES
     __table_args__ = (
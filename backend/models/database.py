@@ -1,4 +1,6 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import QueuePool
@@ -8,8 +10,8 @@ from core.config import settings
 engine = create_engine(
     settings.DATABASE_URL,
     poolclass=QueuePool,
-    pool_size=20,           # Conexiones permanentes en el pool
-    max_overflow=10,        # Conexiones adicionales permitidas
+    pool_size=settings.DATABASE_POOL_SIZE,        # Conexiones permanentes en el pool
+    max_overflow=settings.DATABASE_MAX_OVERFLOW,  # Conexiones adicionales permitidas
     pool_pre_ping=True,     # Verificar conexiones antes de usarlas
     pool_recycle=3600       # Reciclar conexiones cada 1 hora
 )
@@ -26,4 +28,65 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# ============================================================================
+# RÉPLICA DE LECTURA (opcional)
+# ============================================================================
+# Solo lecturas: las rutas la usan a través de core/read_routing.get_read_db,
+# que vuelve al primario si el usuario escribió hace poco (read-your-writes).
+replica_engine = None
+ReplicaSessionLocal = None
+if settings.DATABASE_REPLICA_URL:
+    replica_engine = create_engine(
+        settings.DATABASE_REPLICA_URL,
+        poolclass=QueuePool,
+        pool_size=settings.DATABASE_REPLICA_POOL_SIZE,
+        max_overflow=settings.DATABASE_REPLICA_MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+    )
+    ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+
+
+# ============================================================================
+# MOTOR ASYNC (rutas `async def`)
+# ============================================================================
+# Las rutas async que usaban la sesión sync bloqueaban el event loop en cada
+# consulta/commit. Estas usan AsyncSession sobre aiomysql; el código sync que
+# reciba una sesión (ownership, memoria de chat) se ejecuta con
+# `await db.run_sync(func, ...)`, que hace el I/O sin bloquear el loop.
+_ASYNC_DRIVERS = {"mysql": "mysql+aiomysql", "sqlite": "sqlite+aiosqlite"}
+
+
+def _async_url(url: str) -> str:
+    if settings.DATABASE_ASYNC_URL:
+        return settings.DATABASE_ASYNC_URL
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        return url
+    return parsed.set(drivername=_ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+_async_engine_options = dict(pool_pre_ping=True, pool_recycle=3600)
+if make_url(settings.DATABASE_URL).get_backend_name() != "sqlite":
+    _async_engine_options.update(
+        pool_size=settings.DATABASE_ASYNC_POOL_SIZE,
+        max_overflow=settings.DATABASE_ASYNC_MAX_OVERFLOW,
+    )
+
+async_engine = create_async_engine(_async_url(settings.DATABASE_URL), **_async_engine_options)
+
+# expire_on_commit=False: tras un commit los atributos siguen disponibles sin
+# recargarlos (un lazy load implícito no está permitido en AsyncSession)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+
+async def get_async_db():
+    """Dependencia con una AsyncSession por request (para rutas `async def`)."""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, Text, func
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, Text, Index, func
 from sqlalchemy.dialects.mysql import CHAR
 from sqlalchemy.orm import relationship
 from .database import Base
@@ -15,9 +15,16 @@ class Document(Base):
 
     chunk_count = Column(Integer, default=0)
 
+    # SHA-256 del archivo y dónde quedó guardado (blobs/{hash}{ext}, local o gs://).
+    # NULL en documentos anteriores a la deduplicación (guardados como {id}{ext}).
+    content_hash = Column(CHAR(64), nullable=True)
+    storage_uri = Column(String(512), nullable=True)
+
     # Mensajes automáticos generados
     suggestion_short = Column(Text, nullable=True)
     suggestion_full = Column(Text, nullable=True)
+    # Versión del extractor con la que se generaron los analysis_items (None = pendiente)
+    analysis_version = Column(Integer, nullable=True)
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
@@ -33,7 +40,29 @@ class Document(Base):
         nullable=True
     )
 
+    # ÍNDICES (consultas de las rutas; ver core/db_instrumentation.py)
+    __table_args__ = (
+        # Pendientes (status IN ...) y completados, ordenados por fecha
+        Index('idx_document_ws_status_created', 'workspace_id', 'status', 'created_at'),
+        # Lista de documentos del workspace y exportación CSV
+        Index('idx_document_ws_created', 'workspace_id', 'created_at'),
+        # Documentos de una conversación
+        Index('idx_document_ws_conversation', 'workspace_id', 'conversation_id'),
+        # Análisis pendientes de extraer (suggestion_full es TEXT: no indexable)
+        Index('idx_document_ws_analysis', 'workspace_id', 'analysis_version'),
+        # Documento ya procesado con el mismo contenido (deduplicación de uploads)
+        Index('idx_document_content_hash', 'content_hash', 'status'),
+    )
+
     workspace = relationship("Workspace", back_populates="documents")
 
     # Relación hacia conversacion
     conversation = relationship("Conversation", back_populates="documents")
+
+    # Requisitos y fechas límite extraídos de suggestion_full (borrado en cascada por FK)
+    analysis_items = relationship(
+        "AnalysisItem",
+        back_populates="document",
+        cascade="all, delete-orphan",
+        passive_deletes=True
+    )
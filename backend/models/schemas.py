@@ -94,6 +94,7 @@ class ChatRequest(BaseModel):
     query: str
     conversation_id: str | None = None  # Opcional: ID de conversación existente
     model: str | None = None  # Opcional: modelo LLM a usar (gpt-4o-mini)
+    include_timings: bool = False  # Opcional: incluir desglose de tiempos en el primer evento
     
     @validator('query')
     def query_must_not_be_empty(cls, v):
@@ -137,6 +138,7 @@ class MessagePublic(BaseModel):
     role: str
     content: str
     chunk_references: str | None = None
+    is_truncated: bool = False
     created_at: datetime
     
     class Config:
@@ -164,8 +166,11 @@ class ConversationPublic(BaseModel):
         from_attributes = True
 
 class ConversationWithMessages(ConversationPublic):
-    """Schema para conversación con todos sus mensajes."""
+    """Schema para conversación con una página de sus mensajes (orden cronológico)."""
     messages: list[MessagePublic] = []
+    # Paginación: hay mensajes anteriores; se piden con ?before=<next_cursor>
+    has_more: bool = False
+    next_cursor: Optional[str] = None
 
 # ========================
 # Document Generation Schemas
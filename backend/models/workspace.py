@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, DateTime, Boolean, func, Text, ForeignKey
+from sqlalchemy import Column, String, DateTime, Boolean, func, Text, ForeignKey, Index
 from sqlalchemy.dialects.mysql import CHAR
 from sqlalchemy.orm import relationship
 from .database import Base
@@ -22,6 +22,11 @@ class Workspace(Base):
     owner_id = Column(CHAR(36), ForeignKey("users.id", ondelete="CASCADE"), nullable=True)
     owner = relationship("User", back_populates="workspaces")
 
+    # ÍNDICES: lista de workspaces activos del usuario
+    __table_args__ = (
+        Index('idx_workspace_owner_active', 'owner_id', 'is_active'),
+    )
+
     # --- relaciones corregidas ---
     documents = relationship(
         "Document",
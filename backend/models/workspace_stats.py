@@ -0,0 +1,37 @@
+from sqlalchemy import Column, String, DateTime, Boolean, Integer, ForeignKey, func
+from sqlalchemy.dialects.mysql import CHAR
+from .database import Base
+
+
+class WorkspaceStats(Base):
+    """
+    Contadores agregados por workspace para el dashboard.
+
+    Se mantienen incrementalmente con eventos de Document / Conversation /
+    Workspace (core/dashboard_stats.py) y se recalculan periódicamente desde
+    las tablas base (tarea reconcile_dashboard_stats).
+    """
+    __tablename__ = "workspace_stats"
+
+    workspace_id = Column(
+        CHAR(36), ForeignKey("workspaces.id", ondelete="CASCADE"), primary_key=True
+    )
+    owner_id = Column(String(36), nullable=True, index=True)
+    is_active = Column(Boolean, default=True, nullable=False)
+
+    documents = Column(Integer, default=0, server_default="0", nullable=False)
+    pending = Column(Integer, default=0, server_default="0", nullable=False)
+    processing = Column(Integer, default=0, server_default="0", nullable=False)
+    completed = Column(Integer, default=0, server_default="0", nullable=False)
+    failed = Column(Integer, default=0, server_default="0", nullable=False)
+    # Con suggestion_full (análisis completo) / COMPLETED sin suggestion_full
+    analyzed = Column(Integer, default=0, server_default="0", nullable=False)
+    completed_unanalyzed = Column(Integer, default=0, server_default="0", nullable=False)
+    conversations = Column(Integer, default=0, server_default="0", nullable=False)
+
+    # Documentos creados en el mes `month_key` (AAAAMM) y en el anterior
+    month_key = Column(Integer, default=0, server_default="0", nullable=False)
+    documents_this_month = Column(Integer, default=0, server_default="0", nullable=False)
+    documents_last_month = Column(Integer, default=0, server_default="0", nullable=False)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
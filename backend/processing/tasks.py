@@ -21,6 +21,13 @@ import shutil
 # Checklist + chat
 from core.checklist_analyzer import analyze_document_for_suggestions
 from core.chat_service import send_ai_message_to_chat
+from core.llm_cache import invalidate_documents
+
+# Registra los eventos que mantienen los agregados del dashboard y los
+# analysis_items en el worker
+from core import dashboard_stats
+from core import analysis_extractor  # noqa: F401
+from core import chat_export
 
 redis_client = (
     redis.from_url(settings.REDIS_URL) if hasattr(settings, "REDIS_URL") else None
@@ -202,6 +209,9 @@ def process_document(self, document_id: str, temp_file_path_str: str):
         db_document.status = "COMPLETED"
         db_document.chunk_count = chunk_count
         db.commit()
+
+        # Un documento nuevo (o re-subido) cambia las respuestas del workspace
+        invalidate_documents(db_document.workspace_id, [db_document.id])
         
         # 5) PUBLICAR NOTIFICACIÓN EN REDIS
         try:
@@ -268,3 +278,147 @@ def process_document(self, document_id: str, temp_file_path_str: str):
                  print(f"WORKER: Error eliminando temporal: {e}")
         
         db.close()
+
+
+def _publish_document_status(db_document, status: str, **extra):
+    try:
+        redis_client.publish(
+            "documents",
+            json.dumps({
+                "status": status,
+                "document_id": db_document.id,
+                "workspace_id": db_document.workspace_id,
+                **extra,
+            })
+        )
+    except Exception as e:
+        logger.error(f"ERROR notificando estado de documento: {str(e)}")
+
+
+@celery_app.task
+def copy_processed_document(document_id: str, source_document_id: str, file_uri: str):
+    """
+    Upload idéntico (mismo content_hash) a un documento ya procesado: copia sus
+    vectores bajo los ids del nuevo documento/workspace y su análisis, sin
+    volver a extraer texto ni calcular embeddings. Si la copia no es posible,
+    encola el procesamiento completo.
+    """
+    print(f"WORKER: Reutilizando procesamiento de {source_document_id} para Documento ID: {document_id}")
+
+    db: Session = database.SessionLocal()
+    reprocess = False
+    try:
+        db_document = db.get(document_model.Document, document_id)
+        source = db.get(document_model.Document, source_document_id)
+
+        if not db_document:
+            print(f"WORKER: ERROR - Documento ID {document_id} no encontrado.")
+            return
+
+        if db_document.status == "COMPLETED":
+            print(f"WORKER: Documento {document_id} ya estaba completado.")
+            return
+
+        if (
+            source is None
+            or source.status != "COMPLETED"
+            or not source.chunk_count
+            or source.content_hash != db_document.content_hash
+            or not settings.RAG_SERVICE_ENABLED
+        ):
+            print(f"WORKER: Documento origen {source_document_id} no disponible, procesando completo.")
+            reprocess = True
+            return
+
+        db_document.status = "PROCESSING"
+        db.commit()
+        _publish_document_status(db_document, "PROCESSING", message="Reutilizando documento idéntico ya procesado...")
+
+        chunk_count = source.chunk_count
+        user_id = (
+            str(db_document.workspace.owner_id)
+            if db_document.workspace and db_document.workspace.owner_id
+            else None
+        )
+        metadata = {
+            "filename": db_document.file_name,
+            "file_type": db_document.file_type,
+            "created_at": db_document.created_at.isoformat()
+        }
+
+        async def copy_with_local_client():
+            local_client = RAGClient()
+            try:
+                return await local_client.copy_document(
+                    source_document_id=source.id,
+                    document_id=db_document.id,
+                    workspace_id=db_document.workspace_id,
+                    metadata=metadata,
+                    user_id=user_id,
+                    conversation_id=db_document.conversation_id
+                )
+            finally:
+                await local_client.close()
+
+        try:
+            nest_asyncio.apply()
+        except ValueError:
+            pass
+        result = asyncio.run(copy_with_local_client())
+        # Copia parcial (p. ej. el origen se borró durante el scroll): procesar completo
+        if not result or result.chunks_count != chunk_count:
+            copied = result.chunks_count if result else 0
+            print(
+                f"WORKER: Copia incompleta de {source_document_id} "
+                f"({copied}/{chunk_count} chunks), procesando completo."
+            )
+            reprocess = True
+            return
+
+        # Análisis: al asignar suggestion_full se regeneran los analysis_items
+        db_document.suggestion_short = source.suggestion_short
+        db_document.suggestion_full = source.suggestion_full
+        db_document.chunk_count = chunk_count
+        db_document.status = "COMPLETED"
+        db.commit()
+
+        invalidate_documents(db_document.workspace_id, [db_document.id])
+
+        _publish_document_status(
+            db_document,
+            "COMPLETED",
+            conversation_id=db_document.conversation_id,
+            message="Procesamiento completado exitosamente"
+        )
+        print(f"WORKER: Documento {document_id} completado reutilizando {source_document_id} ({chunk_count} chunks).")
+
+    except Exception as e:
+        print(f"WORKER: Error reutilizando {source_document_id}: {e}")
+        db.rollback()
+        reprocess = True
+
+    finally:
+        db.close()
+        if reprocess:
+            process_document.delay(document_id, file_uri)
+
+
+@celery_app.task
+def reconcile_dashboard_stats():
+    """Recalcula los agregados del dashboard desde las tablas base (tarea periódica)."""
+    start = time.time()
+    total = dashboard_stats.reconcile_all(database.engine)
+    print(f"WORKER: Agregados del dashboard recalculados ({total} workspaces, {time.time() - start:.2f}s)")
+    return total
+
+
+@celery_app.task
+def export_chat_pdf(workspace_id: str, conversation_id: str, key: str):
+    """Genera el PDF del historial de chat y lo deja cacheado bajo `key`."""
+    print(f"WORKER: Exportando chat a PDF (workspace {workspace_id}, job {key})")
+    db: Session = database.SessionLocal()
+    try:
+        job = chat_export.build_artifact(db, workspace_id, conversation_id, key)
+        return job["uri"]
+    finally:
+        db.close()
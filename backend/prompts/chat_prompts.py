@@ -123,23 +123,42 @@ NOTA:
 """
 
 # System Prompt (Base RAG)
-RAG_SYSTEM_PROMPT_TEMPLATE = """
+# Prefijo ESTABLE del prompt: no debe contener datos de la consulta para que los
+# proveedores (OpenAI/Gemini) puedan reutilizarlo con su caché de prefijos.
+RAG_SYSTEM_PROMPT = """
 Eres un asistente de IA profesional, preciso y detallado especializado en análisis de documentos.
 
-{context_string}
-
-=== PREGUNTA DEL USUARIO ===
-{query}
-
 === INSTRUCCIONES CRÍTICAS ===
-1. Responde BASÁNDOTE ÚNICAMENTE en el 'CONTEXTO DE LOS DOCUMENTOS' proporcionado arriba.
+1. Responde BASÁNDOTE ÚNICAMENTE en el 'CONTEXTO DE LOS DOCUMENTOS' incluido en el mensaje del usuario.
 2. Si la información NO está en el contexto actual, responde que no tienes acceso a esa información en los documentos activos.
 3. IMPORTANTE: Ignora cualquier información sobre documentos que recuerdes de mensajes anteriores del chat si esa información no está presente en el contexto actual (el documento podría haber sido eliminado).
 4. Organiza la respuesta en secciones claras.
+"""
+
+# Parte VOLÁTIL del prompt (va al final, en el mensaje del usuario)
+RAG_USER_PROMPT_TEMPLATE = """
+{context_string}
+
+=== PREGUNTA DEL USUARIO ===
+{query}
 
 === RESPUESTA ===
 """
 
+# Conversation Summary Prompt (memoria compacta del chat)
+CONVERSATION_SUMMARY_PROMPT = """
+Actualiza el resumen de la conversación entre el usuario y el asistente de TIVIT.
+
+El contexto contiene el RESUMEN PREVIO (si existe) y los MENSAJES NUEVOS en orden cronológico.
+Genera un único resumen actualizado que:
+- Conserve decisiones, cifras, requisitos, plazos, nombres y acuerdos relevantes.
+- Indique qué entregables ya generó el asistente (propuestas, matrices, cotizaciones) y sus puntos clave, sin copiarlos completos.
+- Mantenga las preguntas del usuario que siguen abiertas.
+- Sea conciso (máximo 300 palabras), en español y en formato de viñetas.
+
+Responde ÚNICAMENTE con el resumen actualizado.
+"""
+
 # Intent Classification Prompt
 INTENT_CLASSIFICATION_PROMPT = """
 Clasifica la siguiente petición del usuario en una INTENCIÓN.
@@ -0,0 +1,51 @@
+"""
+Verifica que el índice TIVIT (core/tivit_index.py) devuelve para consultas
+solo de área exactamente lo mismo que el filtrado lineal original, y que
+palabras de idioma no desplazan a los perfiles del área.
+
+Uso (desde backend/): python validate_tivit_index.py
+"""
+import itertools
+import os
+import sys
+
+sys.path.append(os.getcwd())
+
+from api.routes.tivit import SERVICIOS_TIVIT, TRABAJADORES_TIVIT
+from core.tivit_index import AREA_KEYWORDS, MAX_SERVICIOS, MAX_TRABAJADORES, TivitIndex
+
+
+def linear_search(keywords):
+    """Filtrado original de generate_tivit_chunks (antes del índice)."""
+    areas = {area for area, words in AREA_KEYWORDS.items() if keywords & words} or set(AREA_KEYWORDS)
+    workers = [
+        i for i, t in enumerate(TRABAJADORES_TIVIT)
+        if any(a.lower() in t.area.lower() or a.lower() in t.area_experiencia.lower() for a in areas)
+    ][:MAX_TRABAJADORES]
+    services = [
+        i for i, s in enumerate(SERVICIOS_TIVIT)
+        if any(a.lower() in s.categoria.lower() for a in areas)
+    ][:MAX_SERVICIOS]
+    return workers, services
+
+
+def run_validation():
+    index = TivitIndex(TRABAJADORES_TIVIT, SERVICIOS_TIVIT)
+    area_words = sorted(set().union(*AREA_KEYWORDS.values()))
+
+    checked = 0
+    for size in range(3):
+        for combo in itertools.combinations(area_words, size):
+            keywords = set(combo)
+            assert index.search(keywords) == linear_search(keywords), combo
+            checked += 1
+    print(f"✅ {checked} consultas de área coinciden con el filtrado lineal")
+
+    for language in ("espanol", "ingles", "portugues"):
+        keywords = {"ciberseguridad", language}
+        assert index.search(keywords) == linear_search({"ciberseguridad"}), keywords
+    print("✅ Los idiomas no cambian la selección por área")
+
+
+if __name__ == "__main__":
+    run_validation()
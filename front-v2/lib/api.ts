@@ -806,13 +806,35 @@ export const exportChatToPdfApi = async (
   conversationId?: string,
 ): Promise<Blob> => {
   const params = conversationId ? `?conversation_id=${conversationId}` : "";
-  const { data } = await api.get<Blob>(
-    `/workspaces/${workspaceId}/chat/export/pdf${params}`,
-    {
-      responseType: "blob",
-    },
-  );
-  return data;
+  // The PDF is generated in the background: 202 + job while it is being built,
+  // 200 + file once it is ready (same request).
+  const maxAttempts = 150; // ~5 min
+  for (let attempt = 0; attempt < maxAttempts; attempt++) {
+    const response = await api.get<Blob>(
+      `/workspaces/${workspaceId}/chat/export/pdf${params}`,
+      {
+        responseType: "blob",
+      },
+    );
+    if (response.status !== 202) {
+      return response.data;
+    }
+
+    const job: { job_id: string } = JSON.parse(await response.data.text());
+    let status = "pending";
+    while (status === "pending" && attempt < maxAttempts) {
+      await new Promise((resolve) => setTimeout(resolve, 2000));
+      attempt++;
+      const { data } = await api.get<{ status: string; error?: string }>(
+        `/workspaces/${workspaceId}/chat/export/pdf/jobs/${job.job_id}`,
+      );
+      status = data.status;
+      if (status === "failed") {
+        throw new Error(data.error || "PDF export failed");
+      }
+    }
+  }
+  throw new Error("PDF export timed out");
 };
 
 /**
@@ -289,6 +289,8 @@ export type Conversation = ConversationPublic;
  */
 export interface ConversationWithMessages extends ConversationPublic {
   messages: MessagePublic[]; // default: []
+  has_more?: boolean; // default: false
+  next_cursor?: string | null; // ?before=<next_cursor> loads older messages
 }
 
 /**
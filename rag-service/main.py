@@ -15,11 +15,15 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 # Import the new VectorStore module
 from vector_store import vector_store
+from metrics import PrometheusMiddleware, metrics_response
+from tracing import TracingMiddleware, setup_tracing
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+setup_tracing()
+
 # FastAPI app
 app = FastAPI(
     title="RAG Service API",
@@ -35,6 +39,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(PrometheusMiddleware)
+app.add_middleware(TracingMiddleware)
+
 # Pydantic models
 class SearchRequest(BaseModel):
     query: str = Field(..., min_length=1, max_length=1000)
@@ -63,6 +70,14 @@ class RAGIngestRequest(BaseModel):
             raise ValueError('Content cannot be empty')
         return v.strip()
 
+class CopyDocumentRequest(BaseModel):
+    source_document_id: str = Field(..., min_length=1)
+    document_id: str = Field(..., min_length=1)
+    workspace_id: str = Field(..., min_length=1)
+    metadata: Dict[str, Any] = Field(default_factory=dict)
+    user_id: Optional[str] = None
+    conversation_id: Optional[str] = None
+
 class IngestResponse(BaseModel):
     document_id: str
     chunks_count: int
@@ -198,6 +213,35 @@ async def ingest_batch(request: Request, batch_request: BatchIngestRequest):
         logger.error(f"Batch error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/copy_document", response_model=IngestResponse)
+async def copy_document(request: Request, copy_request: CopyDocumentRequest):
+    """Copy an already indexed document (same content) under new ids, reusing its vectors"""
+    try:
+        overrides = {
+            **copy_request.metadata,
+            "workspace_id": copy_request.workspace_id,
+            "document_id": copy_request.document_id,
+            "conversation_id": copy_request.conversation_id,
+        }
+        if copy_request.user_id:
+            overrides["user_id"] = copy_request.user_id
+
+        count = vector_store.copy_document(copy_request.source_document_id, overrides)
+
+        logger.info(
+            f"Copied doc {copy_request.source_document_id} -> {copy_request.document_id} ({count} chunks)"
+        )
+
+        return IngestResponse(
+            document_id=copy_request.document_id,
+            chunks_count=count,
+            status="success"
+        )
+
+    except Exception as e:
+        logger.error(f"Copy error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/search", response_model=List[SearchResult])
 async def search_documents(request: Request, search_request: SearchRequest):
     """Search documents"""
@@ -236,6 +280,11 @@ async def health_check(request: Request):
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus metrics"""
+    return metrics_response()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8080)
@@ -0,0 +1,129 @@
+"""
+Prometheus metrics for the RAG service (GET /metrics).
+
+Exports request latency per route, embedding batch sizes/latency and Qdrant
+latency per operation. For multi-worker uvicorn set PROMETHEUS_MULTIPROC_DIR
+(empty, writable directory) before starting the workers so /metrics
+aggregates all processes.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.responses import Response
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "rag_http_request_duration_seconds",
+    "HTTP request latency per route",
+    ["method", "route", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+EMBEDDING_BATCH_SIZE = Histogram(
+    "rag_embedding_batch_size",
+    "Number of texts embedded per call",
+    ["kind"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+
+EMBEDDING_DURATION = Histogram(
+    "rag_embedding_duration_seconds",
+    "Time spent computing embeddings per call",
+    ["kind"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+QDRANT_DURATION = Histogram(
+    "rag_qdrant_duration_seconds",
+    "Qdrant call latency per operation",
+    ["operation"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+QDRANT_ERRORS = Counter(
+    "rag_qdrant_errors_total",
+    "Failed Qdrant calls per operation",
+    ["operation"],
+)
+
+
+@contextmanager
+def track_qdrant(operation: str):
+    """Measure a Qdrant call (latency + errors)."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        QDRANT_ERRORS.labels(operation=operation).inc()
+        raise
+    finally:
+        QDRANT_DURATION.labels(operation=operation).observe(time.perf_counter() - start)
+
+
+@contextmanager
+def track_embedding(kind: str, batch_size: int):
+    """Measure an embedding call ("query" or "passage")."""
+    EMBEDDING_BATCH_SIZE.labels(kind=kind).observe(batch_size)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        EMBEDDING_DURATION.labels(kind=kind).observe(time.perf_counter() - start)
+
+
+def _build_registry():
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+_registry = _build_registry()
+
+
+def metrics_response() -> Response:
+    return Response(generate_latest(_registry), media_type=CONTENT_TYPE_LATEST)
+
+
+class PrometheusMiddleware:
+    """ASGI middleware: request latency labelled with the route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            if path != "/metrics":
+                HTTP_REQUEST_DURATION.labels(
+                    method=scope.get("method", ""), route=path, status=str(status_code)
+                ).observe(time.perf_counter() - start)
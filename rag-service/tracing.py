@@ -0,0 +1,75 @@
+"""
+OpenTelemetry tracing for the RAG service.
+
+Continues the trace started by the backend (W3C `traceparent` header) so the
+embedding and Qdrant spans show up under the same chat request.
+
+Env vars:
+- TRACING_ENABLED=true|false (default false: spans are no-op)
+- TRACING_EXPORTER=console|file (default console, one JSON span per line)
+- TRACING_FILE_PATH (default traces-rag.jsonl, used with TRACING_EXPORTER=file)
+"""
+
+import os
+import logging
+
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.trace import SpanKind
+
+logger = logging.getLogger(__name__)
+
+tracer = trace.get_tracer("caso01.rag-service")
+
+
+def setup_tracing(service_name: str = "caso01-rag-service"):
+    """Configure the tracer provider with a local exporter (if enabled)."""
+    if os.getenv("TRACING_ENABLED", "false").lower() not in ("1", "true", "yes"):
+        return
+
+    exporter_name = os.getenv("TRACING_EXPORTER", "console")
+
+    def formatter(span) -> str:
+        return span.to_json(indent=None) + os.linesep
+
+    if exporter_name == "file":
+        out = open(os.getenv("TRACING_FILE_PATH", "traces-rag.jsonl"), "a", encoding="utf-8")
+        exporter = ConsoleSpanExporter(out=out, formatter=formatter)
+    else:
+        exporter = ConsoleSpanExporter(formatter=formatter)
+
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    logger.info(f"Tracing enabled ({exporter_name})")
+
+
+class TracingMiddleware:
+    """ASGI middleware: server span per request, child of the caller's traceparent."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {
+            key.decode("latin-1"): value.decode("latin-1")
+            for key, value in scope.get("headers", [])
+        }
+        method = scope.get("method", "")
+        with tracer.start_as_current_span(
+            f"{method} {scope.get('path', '')}",
+            context=propagate.extract(headers),
+            kind=SpanKind.SERVER,
+        ) as span:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                route = scope.get("route")
+                if getattr(route, "path", None):
+                    span.update_name(f"{method} {route.path}")
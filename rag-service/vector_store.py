@@ -6,6 +6,9 @@ from qdrant_client import QdrantClient
 from qdrant_client.http import models as qmodels
 from sentence_transformers import SentenceTransformer
 
+from metrics import track_embedding, track_qdrant
+from tracing import tracer
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -68,7 +71,8 @@ class VectorStore:
             # However, standard E5 practice acts as asymmetric. We'll add "passage: " to be safe and consistent.
             text = f"passage: {text}"
 
-        embedding = self.embedding_model.encode(text, convert_to_numpy=True)
+        with track_embedding("query" if is_query else "passage", 1):
+            embedding = self.embedding_model.encode(text, convert_to_numpy=True)
         return embedding.tolist()
 
     def upsert_documents(self, documents: List[Dict[str, Any]]) -> int:
@@ -99,9 +103,10 @@ class VectorStore:
             )
 
         if points:
-            self.client.upsert(
-                collection_name=self.collection_name, points=points, wait=True
-            )
+            with track_qdrant("upsert"):
+                self.client.upsert(
+                    collection_name=self.collection_name, points=points, wait=True
+                )
 
         return len(points)
 
@@ -117,7 +122,8 @@ class VectorStore:
         Search for similar documents.
         """
         # Generate embedding (is_query=True)
-        query_vector = self.get_embedding(query, is_query=True)
+        with tracer.start_as_current_span("embed_query"):
+            query_vector = self.get_embedding(query, is_query=True)
 
         # Build filters
         must_filters = []
@@ -146,14 +152,16 @@ class VectorStore:
                 )
             )
 
-        search_result = self.client.query_points(
-            collection_name=self.collection_name,
-            query=query_vector,
-            query_filter=qmodels.Filter(must=must_filters) if must_filters else None,
-            limit=limit,
-            score_threshold=None,  # Disable threshold for debugging/re-calibration
-            with_payload=True,
-        ).points
+        with tracer.start_as_current_span("qdrant.search", attributes={"limit": limit}), \
+                track_qdrant("search"):
+            search_result = self.client.query_points(
+                collection_name=self.collection_name,
+                query=query_vector,
+                query_filter=qmodels.Filter(must=must_filters) if must_filters else None,
+                limit=limit,
+                score_threshold=None,  # Disable threshold for debugging/re-calibration
+                with_payload=True,
+            ).points
 
         results = []
         for hit in search_result:
@@ -168,23 +176,81 @@ class VectorStore:
 
         return results
 
-    def delete_document(self, document_id: str):
-        """Delete all chunks for a specific document ID."""
-        self.client.delete(
-            collection_name=self.collection_name,
-            points_selector=qmodels.FilterSelector(
-                filter=qmodels.Filter(
-                    must=[
-                        qmodels.FieldCondition(
-                            key="document_id",
-                            match=qmodels.MatchValue(value=document_id),
-                        )
-                    ]
+    def copy_document(
+        self, source_document_id: str, overrides: Dict[str, Any], batch_size: int = 256
+    ) -> int:
+        """
+        Copy every chunk of a document under a new document_id, reusing the
+        stored vectors (no re-embedding). `overrides` replaces payload fields
+        (document_id, workspace_id, conversation_id, ...); chunk ids are rebuilt
+        from the new document_id, so re-ingesting it later overwrites the copy.
+        """
+        document_id = overrides["document_id"]
+        source_filter = qmodels.Filter(
+            must=[
+                qmodels.FieldCondition(
+                    key="document_id",
+                    match=qmodels.MatchValue(value=source_document_id),
                 )
-            ),
-            wait=True,
+            ]
         )
 
+        count = 0
+        offset = None
+        while True:
+            with track_qdrant("scroll"):
+                records, offset = self.client.scroll(
+                    collection_name=self.collection_name,
+                    scroll_filter=source_filter,
+                    limit=batch_size,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=True,
+                )
+
+            points = []
+            for record in records:
+                payload = {**record.payload, **overrides}
+                chunk_index = payload.get("chunk_index", count + len(points))
+                payload["chunk_id"] = f"{document_id}_chunk_{chunk_index}"
+                points.append(
+                    qmodels.PointStruct(
+                        id=str(uuid.uuid5(uuid.NAMESPACE_DNS, payload["chunk_id"])),
+                        vector=record.vector,
+                        payload=payload,
+                    )
+                )
+
+            if points:
+                with track_qdrant("upsert"):
+                    self.client.upsert(
+                        collection_name=self.collection_name, points=points, wait=True
+                    )
+                count += len(points)
+
+            if offset is None:
+                break
+
+        return count
+
+    def delete_document(self, document_id: str):
+        """Delete all chunks for a specific document ID."""
+        with track_qdrant("delete"):
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=qmodels.FilterSelector(
+                    filter=qmodels.Filter(
+                        must=[
+                            qmodels.FieldCondition(
+                                key="document_id",
+                                match=qmodels.MatchValue(value=document_id),
+                            )
+                        ]
+                    )
+                ),
+                wait=True,
+            )
+
 
 # Singleton instance
 vector_store = VectorStore()